@@ -1,8 +1,22 @@
+import contextlib
+import functools
 import json
+import math
+import time
 
-import google.generativeai as genai
+from django.conf import settings
+from django.utils.module_loading import import_string
 from google.ai.generativelanguage_v1beta.types import content
 
+from . import metrics
+from .generation_backends import (
+    CallLimit,
+    CircuitBreaker,
+    call_with_retries,
+    stream_with_retries,
+)
+from .partial_json import PartialJSONParser
+
 generation_config = {
     "temperature": 1,
     "top_p": 0.95,
@@ -63,17 +77,101 @@ generation_config = {
 }
 
 
-def get_generated_recipe(ingredients_description, recipe_description):
-    prompt = (
+@functools.cache
+def _get_cached_backend(path, *options):
+    return import_string(path).from_settings(generation_config)
+
+
+def get_backend():
+    """
+    Return backend chosen in settings. It is created once per process,
+    and again only if its settings change.
+    """
+    return _get_cached_backend(
+        settings.RECIPE_GENERATION_BACKEND,
+        settings.RECIPE_GENERATION_TIMEOUT,
+        settings.RECIPE_GENERATION_MODEL,
+        settings.RECIPE_GENERATION_STUB_CHUNK_DELAY,
+    )
+
+
+def get_breaker():
+    return CircuitBreaker(
+        get_backend().name,
+        settings.RECIPE_GENERATION_BREAKER_THRESHOLD,
+        settings.RECIPE_GENERATION_BREAKER_COOLDOWN,
+    )
+
+
+def is_generation_available():
+    return not get_breaker().is_open()
+
+
+def get_prompt(ingredients_description, recipe_description):
+    return (
         f'Create a such recipe where ingredients can be described as "{ingredients_description}"'
         + f'and this recipe itself can be described as "{recipe_description}". '
         + "Output must be in Ukranian. Cooking steps must be without list item numbers."
     )
 
-    model = genai.GenerativeModel(
-        model_name="gemini-1.5-flash",
-        generation_config=generation_config,
+
+def get_call_limit():
+    """
+    Return limit of the calls of the backend running at once in all
+    processes sharing the cache, including their retries
+    """
+    retries = settings.RECIPE_GENERATION_RETRIES
+    longest_call = (
+        settings.RECIPE_GENERATION_TIMEOUT * (retries + 1)
+        + settings.RECIPE_GENERATION_RETRY_BACKOFF * 2**retries
+    )
+    return CallLimit(
+        get_backend().name,
+        settings.RECIPE_GENERATION_CONCURRENCY,
+        math.ceil(longest_call),
     )
 
-    response = model.generate_content(prompt)
-    return json.loads(response.text)
+
+@contextlib.contextmanager
+def _timed_call(backend, kind):
+    # time of the calls includes retries, as seen by the users
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        yield
+        outcome = "success"
+    finally:
+        metrics.observe(
+            "recipes_generation_call_duration_seconds",
+            {"backend": backend.name, "kind": kind, "outcome": outcome},
+            time.perf_counter() - start,
+        )
+
+
+def get_generated_recipe(ingredients_description, recipe_description):
+    prompt = get_prompt(ingredients_description, recipe_description)
+    backend = get_backend()
+    with get_call_limit().slot(), _timed_call(backend, "generate"):
+        text = call_with_retries(get_breaker(), lambda: backend.generate(prompt))
+    return json.loads(text)
+
+
+def stream_generated_recipe(ingredients_description, recipe_description):
+    """
+    Yield the recipe as it is generated, every time it has a new field,
+    step or ingredient. The last yielded recipe is complete.
+    """
+    prompt = get_prompt(ingredients_description, recipe_description)
+    backend = get_backend()
+
+    parser = PartialJSONParser()
+    chunks = []
+    with get_call_limit().slot(), _timed_call(backend, "stream"):
+        for chunk in stream_with_retries(get_breaker(), lambda: backend.stream(prompt)):
+            chunks.append(chunk)
+            recipe = parser.feed(chunk)
+            if recipe is not None:
+                yield recipe
+
+    # the whole response is parsed again, so invalid JSON is not accepted
+    yield json.loads("".join(chunks))
@@ -8,4 +8,6 @@ class MainConfig(AppConfig):
     name = "main"
 
     def ready(self):
+        from . import checks  # noqa: F401
+
         genai.configure(api_key=settings.GEMINI_API_KEY)
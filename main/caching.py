@@ -0,0 +1,100 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+from . import metrics
+
+KEY_PREFIX = "recipes"
+
+
+def get_timeout():
+    return getattr(settings, "RECIPE_CACHE_TIMEOUT", 60 * 60)
+
+
+def _get_generation_key(user_id):
+    return f"{KEY_PREFIX}:generation:{user_id}"
+
+
+def get_generation(user_id):
+    """
+    Return current generation of the user's cached pages. Fresh generations
+    are based on time, so they never repeat generations evicted from cache.
+    """
+    return cache.get_or_set(_get_generation_key(user_id), time.time_ns, None)
+
+
+def _bump_generation(user_id):
+    try:
+        cache.incr(_get_generation_key(user_id))
+    except ValueError:
+        cache.set(_get_generation_key(user_id), time.time_ns(), None)
+
+
+def invalidate_user_cache(user_id):
+    """
+    Make all cached pages of the user stale. The generation is bumped
+    once more after the current transaction commits, so pages rendered
+    from data that was not committed yet are not served either.
+    """
+    _bump_generation(user_id)
+    transaction.on_commit(lambda: _bump_generation(user_id))
+
+
+def count(name):
+    """
+    Increment the counter with the given name. Counters are kept in the
+    cache, so they are shared by the processes that use the same cache
+    backend, and are counted by every process for a cache of its own.
+    """
+    metrics.increment("recipes_cache_events_total", {"event": name})
+    key = f"{KEY_PREFIX}:stats:{name}"
+    if not cache.add(key, 1, None):
+        cache.incr(key)
+
+
+def get_hit_rate(hits_name, misses_name):
+    keys = [f"{KEY_PREFIX}:stats:{hits_name}", f"{KEY_PREFIX}:stats:{misses_name}"]
+    stats = cache.get_many(keys)
+    hits = stats.get(keys[0], 0)
+    misses = stats.get(keys[1], 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+def get_cache_stats():
+    return get_hit_rate("hits", "misses")
+
+
+def _get_fragment_key(user_id, name, *parts):
+    digest = hashlib.md5(
+        "\n".join(str(part) for part in parts).encode("utf-8")
+    ).hexdigest()
+    return f"{KEY_PREFIX}:{user_id}:{get_generation(user_id)}:{name}:{digest}"
+
+
+def get_or_render_fragment(user_id, name, parts, render):
+    """
+    Return cached fragment of the user's page identified by name and parts,
+    or call render, cache the fragment it returns and return it.
+
+    Render may return None for fragments that must not be cached.
+    """
+    key = _get_fragment_key(user_id, name, *parts)
+
+    fragment = cache.get(key)
+    if fragment is not None:
+        count("hits")
+        return mark_safe(fragment)
+
+    count("misses")
+    fragment = render()
+    if fragment is not None:
+        cache.set(key, str(fragment), get_timeout())
+    return fragment
@@ -0,0 +1,61 @@
+"""System checks of the settings and the database that the project relies on"""
+
+from django.conf import settings
+from django.core import checks
+from django.db import connections
+
+# backends that keep the cache in the memory of each process or do not keep it
+PROCESS_CACHE_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.CACHES["default"]["BACKEND"] not in PROCESS_CACHE_BACKENDS:
+        return []
+    return [
+        checks.Warning(
+            "The default cache is not shared by processes.",
+            hint=(
+                "Generations of cached pages, the state of the generation "
+                "circuit breaker and the limit of generation calls must be "
+                "seen by the server, the worker and management commands, "
+                "set REDIS_URL to share them in Redis."
+            ),
+            id="main.W001",
+        )
+    ]
+
+
+@checks.register(checks.Tags.database)
+def check_search_dictionary(app_configs, databases=None, **kwargs):
+    errors = []
+    for alias in databases or []:
+        connection = connections[alias]
+        if connection.vendor != "postgresql":
+            continue
+        with connection.cursor() as cursor:
+            # the configuration is created by the migration of search documents,
+            # which leaves out the dictionary if it is not installed
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = %s) "
+                "AND NOT EXISTS (SELECT 1 FROM pg_ts_dict WHERE dictname = %s)",
+                ["recipes_uk", "recipes_uk_hunspell"],
+            )
+            if cursor.fetchone()[0]:
+                errors.append(
+                    checks.Warning(
+                        "The recipe search does not stem Ukrainian words in "
+                        f"the database '{alias}'.",
+                        hint=(
+                            "Install the Ukrainian hunspell dictionary as "
+                            "uk_ua.dict and uk_ua.affix in tsearch_data of the "
+                            "database server, like db/Dockerfile does, then "
+                            "run the rebuild_search_documents command."
+                        ),
+                        id="main.W002",
+                    )
+                )
+    return errors
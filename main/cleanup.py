@@ -0,0 +1,67 @@
+"""Deletion of media files in background"""
+
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_deletions = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _delete_files(storage, names, check=None):
+    if check is not None and not check():
+        return
+
+    for name in names:
+        try:
+            # missing files are ignored by the storage
+            storage.delete(name)
+        except OSError:
+            logger.warning("Could not delete %s", name, exc_info=True)
+
+
+def _work():
+    while True:
+        storage, names, check = _deletions.get()
+        try:
+            close_old_connections()
+            _delete_files(storage, names, check)
+        except Exception:
+            logger.exception("Could not delete %s", names)
+        finally:
+            _deletions.task_done()
+
+
+def delete_files(storage, names, check=None):
+    """
+    Delete files from the storage in background, right away when
+    RECIPE_MEDIA_DELETE_ASYNC is off.
+
+    If check is given, it is called right before the deletion and the files
+    are kept unless it returns True.
+
+    Deletions still queued when the process exits are lost, their files
+    are then removed as orphans by the gc_media command.
+    """
+    names = list(names)
+    if not settings.RECIPE_MEDIA_DELETE_ASYNC:
+        _delete_files(storage, names, check)
+        return
+
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name="media-deletion", daemon=True)
+            _worker.start()
+    _deletions.put((storage, names, check))
+
+
+def wait_for_deletions():
+    """Block until all queued files are deleted"""
+    _deletions.join()
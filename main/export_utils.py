@@ -1,8 +1,79 @@
-from io import BytesIO
+import csv
+import json
+import os
+import zipfile
 
 
-def export_recipe_to_text(recipe, ingredients, steps, tags):
-    text = f"{recipe.name}\n\
+class RecipeExporter:
+    """
+    Base class of recipe exporters.
+
+    Exporters yield the document in chunks, so neither a single recipe nor
+    a batch of recipes has to be kept in memory as a whole.
+    """
+
+    extension = ""
+    content_type = ""
+
+    def export_header(self):
+        return iter(())
+
+    def export_recipe(self, recipe, ingredients, steps, tags):
+        raise NotImplementedError
+
+    def export_separator(self):
+        return iter(())
+
+    def export_footer(self):
+        return iter(())
+
+    def export(self, recipe, ingredients, steps, tags):
+        """Yield document with one recipe"""
+        yield from self.export_many([(recipe, ingredients, steps, tags)])
+
+    def export_many(self, recipes):
+        """
+        Yield document with all recipes from an iterable of
+        (recipe, ingredients, steps, tags) tuples.
+        """
+        yield from self.export_header()
+        for number, (recipe, ingredients, steps, tags) in enumerate(recipes):
+            if number:
+                yield from self.export_separator()
+            yield from self.export_recipe(recipe, ingredients, steps, tags)
+        yield from self.export_footer()
+
+
+def sort_steps(steps):
+    return sorted(steps, key=lambda s: s.step_number)
+
+
+def recipe_to_dict(recipe, ingredients, steps, tags):
+    """Return recipe in the shape of the recipe generation response"""
+    return {
+        "name": recipe.name,
+        "description": recipe.description,
+        "cooking_time_in_minutes": recipe.cooking_time,
+        "category": recipe.category,
+        "steps": [step.step_description for step in sort_steps(steps)],
+        "ingredients": [
+            {
+                "name": ingredient.name,
+                "volume": ingredient.volume,
+                "volume_measure": ingredient.volume_measure,
+            }
+            for ingredient in ingredients
+        ],
+        "tags": [tag.tag_text for tag in tags],
+    }
+
+
+class TextExporter(RecipeExporter):
+    extension = "txt"
+    content_type = "text/plain; charset=utf-8"
+
+    def export_recipe(self, recipe, ingredients, steps, tags):
+        yield f"{recipe.name}\n\
 =====\n\
 \n\
 Інформація\n\
@@ -14,17 +85,213 @@ def export_recipe_to_text(recipe, ingredients, steps, tags):
 Інгредієнти\n\
 -----\n"
 
-    for ingredient in ingredients:
-        text += (
-            f"- {ingredient.name}: {ingredient.volume} {ingredient.volume_measure}\n"
+        for ingredient in ingredients:
+            yield f"- {ingredient.name}: {ingredient.volume} {ingredient.volume_measure}\n"
+
+        yield "\nКроки\n-----\n"
+        for number, step in enumerate(sort_steps(steps), start=1):
+            yield f"{number}) {step.step_description}\n"
+
+        yield "\nТеги\n-----\n"
+        for tag in tags:
+            yield f"- {tag.tag_text}\n"
+
+    def export_separator(self):
+        yield "\n\n"
+
+
+class MarkdownExporter(RecipeExporter):
+    extension = "md"
+    content_type = "text/markdown; charset=utf-8"
+
+    def export_recipe(self, recipe, ingredients, steps, tags):
+        yield f"# {recipe.name}\n\n"
+        yield "## Інформація\n\n"
+        yield f"{recipe.description}\n\n"
+        yield f"- **Час приготування, хв:** {recipe.cooking_time}\n"
+        yield f"- **Категорія:** {recipe.category}\n\n"
+
+        yield "## Інгредієнти\n\n"
+        for ingredient in ingredients:
+            yield f"- {ingredient.name}: {ingredient.volume} {ingredient.volume_measure}\n"
+
+        yield "\n## Кроки\n\n"
+        for number, step in enumerate(sort_steps(steps), start=1):
+            yield f"{number}. {step.step_description}\n"
+
+        yield "\n## Теги\n\n"
+        yield " ".join(f"`{tag.tag_text}`" for tag in tags) + "\n"
+
+    def export_separator(self):
+        yield "\n---\n\n"
+
+
+class JSONExporter(RecipeExporter):
+    """Exports a single recipe as an object and a batch as an array"""
+
+    extension = "json"
+    content_type = "application/json"
+
+    def export(self, recipe, ingredients, steps, tags):
+        yield from self.export_recipe(recipe, ingredients, steps, tags)
+
+    def export_header(self):
+        yield "["
+
+    def export_recipe(self, recipe, ingredients, steps, tags):
+        yield json.dumps(
+            recipe_to_dict(recipe, ingredients, steps, tags), ensure_ascii=False
+        )
+
+    def export_separator(self):
+        yield ",\n"
+
+    def export_footer(self):
+        yield "]"
+
+
+class _Echo:
+    """File-like object that returns written value instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+class CSVExporter(RecipeExporter):
+    """Exports a row per recipe, lists are stored in cells as JSON"""
+
+    extension = "csv"
+    content_type = "text/csv; charset=utf-8"
+    columns = [
+        "name",
+        "description",
+        "cooking_time_in_minutes",
+        "category",
+        "steps",
+        "ingredients",
+        "tags",
+    ]
+
+    def __init__(self):
+        self.writer = csv.writer(_Echo())
+
+    def export_header(self):
+        yield self.writer.writerow(self.columns)
+
+    def export_recipe(self, recipe, ingredients, steps, tags):
+        data = recipe_to_dict(recipe, ingredients, steps, tags)
+        yield self.writer.writerow(
+            [
+                (
+                    json.dumps(data[column], ensure_ascii=False)
+                    if isinstance(data[column], list)
+                    else data[column]
+                )
+                for column in self.columns
+            ]
         )
 
-    text += "\nКроки\n-----\n"
-    for number, step in enumerate(sorted(steps, key=lambda s: s.step_number), start=1):
-        text += f"{number}) {step.step_description}\n"
 
-    text += "\nТеги\n-----\n"
-    for tag in tags:
-        text += f"- {tag.tag_text}\n"
+EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in [TextExporter, MarkdownExporter, JSONExporter, CSVExporter]
+}
+
+
+def get_exporter(export_format):
+    """Return exporter for the format name or None if there is no such format"""
+    exporter = EXPORTERS.get(export_format)
+    return exporter() if exporter else None
+
+
+class _ZipStream:
+    """Unseekable file-like object that keeps written bytes until popped"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _get_recipe_directory(recipe):
+    # names of recipes are not unique, so the id is put first
+    name = "".join(c if c.isalnum() or c in " -_" else "_" for c in recipe.name)
+    return f"{recipe.pk}_{name.strip()}"
+
+
+def _get_zip_date_time(recipe):
+    # ZIP can not store dates before 1980
+    return max(recipe.updated_at.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def _write_zip(stream, recipes, exporter, file_chunk_size):
+    # yields whenever some data of the archive is written to the stream
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for recipe, ingredients, steps, tags in recipes:
+            directory = _get_recipe_directory(recipe)
+            date_time = _get_zip_date_time(recipe)
+
+            info = zipfile.ZipInfo(
+                f"{directory}/recipe.{exporter.extension}", date_time
+            )
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, "w") as document:
+                for chunk in exporter.export(recipe, ingredients, steps, tags):
+                    document.write(chunk.encode("utf-8"))
+            yield
+
+            # equal images of a recipe share one file
+            names = set()
+            for recipe_image in recipe.recipeimage_set.all():
+                image = recipe_image.image
+                if image.name in names:
+                    continue
+                names.add(image.name)
+
+                try:
+                    size = image.storage.size(image.name)
+                    source = image.storage.open(image.name, "rb")
+                except OSError:
+                    # file of the image is missing, the rest is still exported
+                    continue
+
+                info = zipfile.ZipInfo(
+                    f"{directory}/{os.path.basename(image.name)}", date_time
+                )
+                info.compress_type = zipfile.ZIP_STORED
+                # known size lets zipfile choose ZIP64 before writing the data
+                info.file_size = size
+                with source, archive.open(info, "w") as target:
+                    while chunk := source.read(file_chunk_size):
+                        target.write(chunk)
+                        yield
+                yield
+
+
+def export_recipes_to_zip(recipes, exporter, file_chunk_size=64 * 1024):
+    """
+    Yield ZIP archive with a document and images of every recipe from
+    an iterable of (recipe, ingredients, steps, tags) tuples. Images should
+    be prefetched with the recipes.
+
+    The archive is written to an unseekable stream and yielded as soon as
+    its pieces are ready, so only one chunk of an image is kept in memory.
+    Images, which are compressed already, are stored as is.
+    """
+    stream = _ZipStream()
+    for _ in _write_zip(stream, recipes, exporter, file_chunk_size):
+        if data := stream.pop():
+            yield data
 
-    return BytesIO(bytes(text, encoding="utf-8"))
+    # central directory written on closing the archive
+    yield stream.pop()
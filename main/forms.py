@@ -1,6 +1,10 @@
 from django import forms
+from django.conf import settings
 
-from .models import Recipe, RecipeIngredient, RecipeStep, RecipeTag
+from .models import Recipe, RecipeImage, RecipeIngredient, RecipeStep, RecipeTag
+
+# recipes generated at once for one prompt
+MAX_GENERATION_VARIANTS = 5
 
 
 class RecipeForm(forms.ModelForm):
@@ -11,9 +15,6 @@ class RecipeForm(forms.ModelForm):
             "description",
             "cooking_time",
             "category",
-            "image_1",
-            "image_2",
-            "image_3",
         ]
 
         labels = {
@@ -21,12 +22,30 @@ class RecipeForm(forms.ModelForm):
             "description": "Опис",
             "cooking_time": "Час приготування, хв",
             "category": "Категорія",
-            "image_1": "Зображення страви (1)",
-            "image_2": "Зображення страви (2)",
-            "image_3": "Зображення страви (3)",
         }
 
 
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleImageField(forms.ImageField):
+    """Image field that accepts any number of images and returns a list"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        if isinstance(data, (list, tuple)):
+            return [super(MultipleImageField, self).clean(d, initial) for d in data]
+        return [super().clean(data, initial)] if data else []
+
+
+class RecipeImagesForm(forms.Form):
+    images = MultipleImageField(required=False, label="Зображення страви")
+
+
 class RecipeIngredientForm(forms.ModelForm):
     class Meta:
         model = RecipeIngredient
@@ -39,15 +58,31 @@ class RecipeStepForm(forms.ModelForm):
         fields = ["step_description"]
 
 
+class RecipeStepPositionForm(forms.Form):
+    # id of the step before which a step is put, empty to put it to the end
+    before = forms.IntegerField(required=False, label="Перед кроком")
+
+
 class RecipeTagForm(forms.ModelForm):
     class Meta:
         model = RecipeTag
         fields = ["tag_text"]
 
 
+class RecipeChildFormSet(forms.BaseInlineFormSet):
+    """Inline formset that reuses recipe children prefetched by load_recipe"""
+
+    def get_queryset(self):
+        accessor = self.fk.remote_field.get_accessor_name()
+        if accessor in getattr(self.instance, "_prefetched_objects_cache", {}):
+            return getattr(self.instance, accessor).all()
+        return super().get_queryset()
+
+
 RecipeStepFormSet = forms.inlineformset_factory(
     parent_model=Recipe,
     model=RecipeStep,
+    formset=RecipeChildFormSet,
     fields=["step_description"],
     can_delete=True,
     extra=0,
@@ -60,6 +95,7 @@ RecipeStepFormSet = forms.inlineformset_factory(
 RecipeTagFormSet = forms.inlineformset_factory(
     parent_model=Recipe,
     model=RecipeTag,
+    formset=RecipeChildFormSet,
     fields=["tag_text"],
     can_delete=True,
     extra=0,
@@ -70,6 +106,7 @@ RecipeTagFormSet = forms.inlineformset_factory(
 RecipeIngredientFormSet = forms.inlineformset_factory(
     parent_model=Recipe,
     model=RecipeIngredient,
+    formset=RecipeChildFormSet,
     fields=["name", "volume", "volume_measure"],
     can_delete=True,
     extra=0,
@@ -81,6 +118,17 @@ RecipeIngredientFormSet = forms.inlineformset_factory(
 )
 
 
+# existing images can only be deleted, new ones are added with RecipeImagesForm
+RecipeImageFormSet = forms.inlineformset_factory(
+    parent_model=Recipe,
+    model=RecipeImage,
+    formset=RecipeChildFormSet,
+    fields=[],
+    can_delete=True,
+    extra=0,
+)
+
+
 class SearchForm(forms.Form):
     search_string = forms.CharField(required=True, label="Пошук")
     search_in_names = forms.BooleanField(
@@ -101,6 +149,40 @@ class SearchForm(forms.Form):
 class RecipeGenerationForm(forms.Form):
     ingredients_description = forms.CharField(required=True, label="Опис інгредієнтів")
     recipe_description = forms.CharField(required=True, label="Опис рецепту")
+    variants = forms.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=MAX_GENERATION_VARIANTS,
+        initial=1,
+        label="Кількість варіантів",
+    )
+
+    def clean_variants(self):
+        return self.cleaned_data["variants"] or 1
+
+
+class RecipeImportForm(forms.Form):
+    file = forms.FileField(label="Файл з рецептами")
+    format = forms.ChoiceField(
+        choices=[
+            ("", "За розширенням файлу"),
+            ("ndjson", "NDJSON"),
+            ("csv", "CSV"),
+            ("json", "JSON"),
+        ],
+        required=False,
+        label="Формат",
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data["file"]
+        max_size = settings.RECIPE_IMPORT_UPLOAD_MAX_SIZE
+        if file.size > max_size:
+            raise forms.ValidationError(
+                f"Файл більший за {max_size / 1024 / 1024:g} МБ, "
+                "розділіть його на кілька файлів"
+            )
+        return file
 
 
 class SortRecipeListForm(forms.Form):
@@ -0,0 +1,256 @@
+"""Recipe generation jobs processed outside of requests"""
+
+import datetime
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .ai import (
+    get_generated_recipe,
+    is_generation_available,
+    stream_generated_recipe,
+)
+from .generation_backends import GenerationUnavailable
+from .generation_cache import cache_recipe, get_cached_recipe
+from .models import GenerationJob
+
+logger = logging.getLogger(__name__)
+
+Status = GenerationJob.Status
+# candidates read at once by a worker looking for a job to claim
+CLAIM_BATCH_SIZE = 10
+GENERATION_ERROR_MESSAGE = "Не вдалося згенерувати рецепт, спробуйте ще раз"
+# seconds between the checks of a job by its event stream
+JOB_EVENTS_POLL_INTERVAL = 0.5
+
+
+def create_generation_job(
+    user, ingredients_description, recipe_description, variants=1, use_cache=True
+):
+    """
+    Create job generating a recipe, or the given number of its variants.
+    The job is done right away if the recipe was generated for the same
+    prompt before, unless use_cache is False. Variants are never cached.
+
+    Raise GenerationUnavailable if the recipe has to be generated while
+    the backend is failing.
+    """
+    job = GenerationJob(
+        user=user,
+        ingredients_description=ingredients_description,
+        recipe_description=recipe_description,
+        variants=variants,
+    )
+    if use_cache and variants == 1:
+        job.result = get_cached_recipe(ingredients_description, recipe_description)
+        if job.result is not None:
+            job.status = Status.DONE
+            job.finished_at = timezone.now()
+
+    if job.result is None and not is_generation_available():
+        raise GenerationUnavailable()
+
+    job.save()
+    return job
+
+
+def claim_job():
+    """
+    Mark the oldest pending job as running and return it, None if there is
+    no pending job. Several workers never claim the same job.
+    """
+    candidates = (
+        GenerationJob.objects.filter(status=Status.PENDING)
+        .order_by("id")
+        .values_list("id", flat=True)[:CLAIM_BATCH_SIZE]
+    )
+    for job_id in candidates:
+        # the conditional update fails if another worker claimed the job first
+        if GenerationJob.objects.filter(pk=job_id, status=Status.PENDING).update(
+            status=Status.RUNNING,
+            started_at=timezone.now(),
+            attempts=F("attempts") + 1,
+        ):
+            return GenerationJob.objects.get(pk=job_id)
+    return None
+
+
+def get_claimed(job):
+    """
+    Return queryset of the job while it is run by the attempt that claimed
+    it. It is empty once the job was returned to the queue as stale,
+    so the results of the stopped attempt do not overwrite the new one.
+    """
+    return GenerationJob.objects.filter(
+        pk=job.pk, status=Status.RUNNING, attempts=job.attempts
+    )
+
+
+def generate_streaming(job):
+    """Generate recipe of the job, storing it on the job while it grows"""
+    recipe = None
+    for recipe in stream_generated_recipe(
+        job.ingredients_description, job.recipe_description
+    ):
+        # partial recipes of running jobs are sent to the user by events
+        get_claimed(job).update(result=recipe)
+    return recipe
+
+
+def generate_variants(job):
+    """
+    Generate variants of the job's recipe concurrently, storing them on
+    the job as they are ready. Variants that failed are left out.
+    """
+    recipes = []
+    errors = []
+    # the calls are also limited by the limit shared by all threads
+    workers = min(job.variants, settings.RECIPE_GENERATION_CONCURRENCY)
+    with ThreadPoolExecutor(workers, thread_name_prefix="generation") as executor:
+        futures = [
+            executor.submit(
+                get_generated_recipe,
+                job.ingredients_description,
+                job.recipe_description,
+            )
+            for _ in range(job.variants)
+        ]
+        for future in as_completed(futures):
+            try:
+                recipes.append(future.result())
+            except Exception as error:
+                errors.append(error)
+                continue
+            get_claimed(job).update(result=recipes)
+
+    if not recipes:
+        raise errors[0]
+    if errors:
+        logger.warning(
+            "%s of %s variants of generation job %s failed",
+            len(errors),
+            job.variants,
+            job.pk,
+        )
+    return recipes
+
+
+def run_job(job):
+    try:
+        if job.variants > 1:
+            job.result = generate_variants(job)
+        elif settings.RECIPE_GENERATION_STREAM:
+            job.result = generate_streaming(job)
+        else:
+            job.result = get_generated_recipe(
+                job.ingredients_description, job.recipe_description
+            )
+        job.status = Status.DONE
+    except GenerationUnavailable as error:
+        job.status = Status.FAILED
+        job.result = None
+        job.error = str(error)
+    except Exception:
+        logger.exception("Generation job %s failed", job.pk)
+        job.status = Status.FAILED
+        job.result = None
+        job.error = GENERATION_ERROR_MESSAGE
+
+    job.finished_at = timezone.now()
+    if not get_claimed(job).update(
+        result=job.result,
+        status=job.status,
+        error=job.error,
+        finished_at=job.finished_at,
+    ):
+        logger.warning(
+            "Result of generation job %s attempt %s is discarded, "
+            "the job was recovered as stale",
+            job.pk,
+            job.attempts,
+        )
+        return
+
+    if job.status == Status.DONE and job.variants == 1:
+        cache_recipe(job.ingredients_description, job.recipe_description, job.result)
+
+
+def run_next_job():
+    """Run one pending job, return False if there was none"""
+    job = claim_job()
+    if job is None:
+        return False
+
+    run_job(job)
+    return True
+
+
+def recover_stale_jobs():
+    """
+    Return jobs of workers that stopped while running them to the queue,
+    or fail them if they were attempted too many times.
+    """
+    deadline = timezone.now() - datetime.timedelta(
+        seconds=settings.RECIPE_GENERATION_JOB_TIMEOUT
+    )
+    stale = GenerationJob.objects.filter(status=Status.RUNNING, started_at__lt=deadline)
+
+    failed = stale.filter(attempts__gte=settings.RECIPE_GENERATION_MAX_ATTEMPTS).update(
+        status=Status.FAILED,
+        error=GENERATION_ERROR_MESSAGE,
+        finished_at=timezone.now(),
+    )
+    retried = stale.update(status=Status.PENDING, started_at=None)
+    return retried, failed
+
+
+def delete_old_jobs():
+    deadline = timezone.now() - datetime.timedelta(
+        seconds=settings.RECIPE_GENERATION_JOB_RETENTION
+    )
+    return GenerationJob.objects.filter(finished_at__lt=deadline).delete()[0]
+
+
+def get_job_state(job):
+    """
+    Return state of the job shown to its user while it is generated,
+    with the part of the recipe generated so far
+    """
+    return {
+        "status": job.status,
+        "error": job.error,
+        "variants": job.variants,
+        "recipe": job.result,
+    }
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_job_events(job_id):
+    """
+    Yield Server-Sent Events with the state of the job whenever it changes,
+    including new parts of the recipe, until the job is finished or the
+    stream is open for too long.
+    """
+    # browsers reconnect after the stream ends while the page is open
+    yield f"retry: {int(JOB_EVENTS_POLL_INTERVAL * 1000)}\n\n"
+
+    deadline = time.monotonic() + settings.RECIPE_GENERATION_EVENTS_TIMEOUT
+    state = None
+    while True:
+        job = GenerationJob.objects.only("status", "error", "variants", "result").get(
+            pk=job_id
+        )
+        if get_job_state(job) != state:
+            state = get_job_state(job)
+            yield format_event("status", state)
+        if job.is_finished or time.monotonic() >= deadline:
+            return
+        time.sleep(JOB_EVENTS_POLL_INTERVAL)
@@ -0,0 +1,296 @@
+"""Backends of recipe generation and protection of the calls to them"""
+
+import contextlib
+import json
+import random
+import time
+import uuid
+
+import google.generativeai as genai
+from django.conf import settings
+from django.core.cache import cache
+from google.api_core import exceptions
+
+from .caching import KEY_PREFIX
+
+UNAVAILABLE_MESSAGE = (
+    "Генерування рецептів тимчасово недоступне, спробуйте через кілька хвилин"
+)
+
+# errors of Gemini that may not repeat on the next call
+TRANSIENT_ERRORS = (
+    exceptions.TooManyRequests,
+    exceptions.InternalServerError,
+    exceptions.ServiceUnavailable,
+    exceptions.GatewayTimeout,
+    exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class GenerationError(Exception):
+    pass
+
+
+class TransientGenerationError(GenerationError):
+    pass
+
+
+class GenerationUnavailable(GenerationError):
+    def __init__(self):
+        super().__init__(UNAVAILABLE_MESSAGE)
+
+
+class GenerationBackend:
+    """
+    Model that answers prompts with recipe JSON. A backend is created once
+    per process and reused for all calls, so it should keep its clients.
+
+    Backends raise TransientGenerationError for errors worth a retry.
+    """
+
+    # part of the keys of cached recipes, so recipes of other models are
+    # not reused
+    name = None
+
+    def __init__(self, timeout):
+        # seconds for one call, including the whole stream
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls, generation_config):
+        return cls(settings.RECIPE_GENERATION_TIMEOUT)
+
+    def generate(self, prompt):
+        """Return text of the answer"""
+        raise NotImplementedError
+
+    def stream(self, prompt):
+        """Yield text of the answer in chunks as they are generated"""
+        raise NotImplementedError
+
+
+class GeminiBackend(GenerationBackend):
+    def __init__(self, timeout, model_name, generation_config):
+        super().__init__(timeout)
+        self.name = f"gemini:{model_name}"
+        self.model = genai.GenerativeModel(
+            model_name=model_name, generation_config=generation_config
+        )
+
+    @classmethod
+    def from_settings(cls, generation_config):
+        return cls(
+            settings.RECIPE_GENERATION_TIMEOUT,
+            settings.RECIPE_GENERATION_MODEL,
+            generation_config,
+        )
+
+    def generate(self, prompt):
+        try:
+            return self.model.generate_content(
+                prompt, request_options={"timeout": self.timeout}
+            ).text
+        except TRANSIENT_ERRORS as error:
+            raise TransientGenerationError(str(error)) from error
+
+    def stream(self, prompt):
+        deadline = time.monotonic() + self.timeout
+        try:
+            response = self.model.generate_content(
+                prompt, stream=True, request_options={"timeout": self.timeout}
+            )
+            for chunk in response:
+                if time.monotonic() > deadline:
+                    raise TransientGenerationError("Generation timed out")
+                yield chunk.text
+        except TRANSIENT_ERRORS as error:
+            raise TransientGenerationError(str(error)) from error
+
+
+# recipe returned by the stub backend
+STUB_RECIPE = {
+    "name": "Овочевий суп",
+    "description": "Легкий суп з сезонних овочів.",
+    "cooking_time_in_minutes": 40,
+    "category": "Супи",
+    "steps": [
+        "Наріжте овочі кубиками.",
+        "Закип'ятіть воду та посоліть її.",
+        "Варіть овочі 30 хвилин.",
+    ],
+    "ingredients": [
+        {"name": "Картопля", "volume": 3, "volume_measure": "шт"},
+        {"name": "Морква", "volume": 1, "volume_measure": "шт"},
+        {"name": "Вода", "volume": 1.5, "volume_measure": "л"},
+    ],
+}
+STUB_CHUNK_SIZE = 24
+
+
+class StubBackend(GenerationBackend):
+    """
+    Local backend that always answers with STUB_RECIPE, streamed in small
+    chunks, for load tests, CI and work offline.
+    """
+
+    name = "stub"
+
+    def __init__(self, timeout, chunk_delay=0):
+        super().__init__(timeout)
+        self.chunk_delay = chunk_delay
+        self.text = json.dumps(STUB_RECIPE, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def from_settings(cls, generation_config):
+        return cls(
+            settings.RECIPE_GENERATION_TIMEOUT,
+            settings.RECIPE_GENERATION_STUB_CHUNK_DELAY,
+        )
+
+    def generate(self, prompt):
+        time.sleep(self.chunk_delay * len(self.text) / STUB_CHUNK_SIZE)
+        return self.text
+
+    def stream(self, prompt):
+        for start in range(0, len(self.text), STUB_CHUNK_SIZE):
+            time.sleep(self.chunk_delay)
+            yield self.text[start : start + STUB_CHUNK_SIZE]
+
+
+class CircuitBreaker:
+    """
+    Counter of consecutive failed calls kept in the cache. Failures are
+    recorded by the generation worker and checked by the server before
+    jobs are created, so the cache must be shared by them, see the
+    main.W001 check. After threshold failures calls are refused for
+    cooldown seconds, then they are let through again and the first
+    failure opens the breaker anew.
+    """
+
+    def __init__(self, name, threshold, cooldown):
+        self.failures_key = f"{KEY_PREFIX}:breaker:{name}:failures"
+        self.open_key = f"{KEY_PREFIX}:breaker:{name}:open_until"
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+    def is_open(self):
+        return time.time() < cache.get(self.open_key, 0)
+
+    def check(self):
+        if self.is_open():
+            raise GenerationUnavailable()
+
+    def record_success(self):
+        # successful calls are the usual case, so they only read the counter
+        if cache.get(self.failures_key):
+            cache.delete_many([self.failures_key, self.open_key])
+
+    def record_failure(self):
+        if cache.add(self.failures_key, 1, None):
+            failures = 1
+        else:
+            failures = cache.incr(self.failures_key)
+        if failures >= self.threshold:
+            cache.set(self.open_key, time.time() + self.cooldown, self.cooldown)
+
+
+class CallLimit:
+    """
+    Counting semaphore of calls running at once in all processes sharing
+    the cache. Its slots are cache keys added for ttl seconds, the longest
+    time a call may take, so slots of processes stopped during a call are
+    freed when they expire. A call waits for a slot for at most ttl seconds,
+    then GenerationUnavailable is raised.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, name, size, ttl):
+        self.keys = [f"{KEY_PREFIX}:call_limit:{name}:{slot}" for slot in range(size)]
+        self.ttl = ttl
+
+    def acquire(self):
+        """Take a free slot, return its key and the token of this call"""
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.ttl
+        # slots are tried from a random one, so waiting calls do not all
+        # compete for the first
+        start = random.randrange(len(self.keys))
+        keys = self.keys[start:] + self.keys[:start]
+        while True:
+            for key in keys:
+                if cache.add(key, token, self.ttl):
+                    return key, token
+            if time.monotonic() >= deadline:
+                raise GenerationUnavailable()
+            time.sleep(self.poll_interval)
+
+    def release(self, key, token):
+        # the slot may have expired and been taken by another call
+        if cache.get(key) == token:
+            cache.delete(key)
+
+    @contextlib.contextmanager
+    def slot(self):
+        key, token = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(key, token)
+
+
+def get_retry_delay(attempt):
+    # full jitter spreads the retries of many workers over time
+    return random.uniform(0, settings.RECIPE_GENERATION_RETRY_BACKOFF * 2**attempt)
+
+
+def call_with_retries(breaker, call):
+    """
+    Return result of the call, repeating it after transient errors. Every
+    error counts as a failure for the breaker. Raise GenerationUnavailable
+    without calling it if the breaker is open.
+    """
+    for attempt in range(settings.RECIPE_GENERATION_RETRIES + 1):
+        breaker.check()
+        try:
+            result = call()
+        except Exception as error:
+            breaker.record_failure()
+            if (
+                not isinstance(error, TransientGenerationError)
+                or attempt == settings.RECIPE_GENERATION_RETRIES
+            ):
+                raise
+            time.sleep(get_retry_delay(attempt))
+        else:
+            breaker.record_success()
+            return result
+
+
+def stream_with_retries(breaker, stream):
+    """
+    Yield chunks of the stream returned by calling stream, repeating the
+    call after transient errors until the first chunk is received.
+    """
+    for attempt in range(settings.RECIPE_GENERATION_RETRIES + 1):
+        breaker.check()
+        received = False
+        try:
+            for chunk in stream():
+                received = True
+                yield chunk
+        except Exception as error:
+            breaker.record_failure()
+            # the answer can not be restarted once a part of it is shown
+            if (
+                not isinstance(error, TransientGenerationError)
+                or received
+                or attempt == settings.RECIPE_GENERATION_RETRIES
+            ):
+                raise
+            time.sleep(get_retry_delay(attempt))
+        else:
+            breaker.record_success()
+            return
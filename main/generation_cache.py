@@ -0,0 +1,102 @@
+"""Persistent cache of generated recipes"""
+
+import datetime
+import functools
+import hashlib
+import json
+import unicodedata
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .ai import generation_config, get_backend
+from .caching import count, get_hit_rate
+from .models import GenerationCacheEntry
+
+
+def normalize_prompt_part(text):
+    # prompts differing only in case, spacing or Unicode forms are equal
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+@functools.cache
+def get_config_hash():
+    # the schema has no JSON form, its text representation is stable
+    config = json.dumps(generation_config, sort_keys=True, default=str)
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+
+def get_cache_key(ingredients_description, recipe_description):
+    parts = [
+        normalize_prompt_part(ingredients_description),
+        normalize_prompt_part(recipe_description),
+        get_backend().name,
+        get_config_hash(),
+    ]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def _get_expiry():
+    return timezone.now() - datetime.timedelta(
+        seconds=settings.RECIPE_GENERATION_CACHE_TTL
+    )
+
+
+def get_cached_recipe(ingredients_description, recipe_description):
+    """Return recipe generated for the prompt before or None"""
+    key = get_cache_key(ingredients_description, recipe_description)
+    result = (
+        GenerationCacheEntry.objects.filter(key=key, created_at__gte=_get_expiry())
+        .values_list("result", flat=True)
+        .first()
+    )
+    if result is None:
+        count("generation_misses")
+        return None
+
+    count("generation_hits")
+    GenerationCacheEntry.objects.filter(key=key).update(
+        used_at=timezone.now(), hits=F("hits") + 1
+    )
+    return result
+
+
+def cache_recipe(ingredients_description, recipe_description, recipe):
+    """
+    Store recipe generated for the prompt, evicting the least recently
+    used entries when there are more than RECIPE_GENERATION_CACHE_SIZE.
+    """
+    now = timezone.now()
+    GenerationCacheEntry.objects.bulk_create(
+        [
+            GenerationCacheEntry(
+                key=get_cache_key(ingredients_description, recipe_description),
+                result=recipe,
+                created_at=now,
+                used_at=now,
+            )
+        ],
+        update_conflicts=True,
+        unique_fields=["key"],
+        update_fields=["result", "created_at", "used_at"],
+    )
+
+    # entries are evicted on every write, so only a few are over the size
+    cutoff = (
+        GenerationCacheEntry.objects.order_by("-used_at")
+        .values_list("used_at", flat=True)[settings.RECIPE_GENERATION_CACHE_SIZE :]
+        .first()
+    )
+    if cutoff is not None:
+        GenerationCacheEntry.objects.filter(used_at__lte=cutoff).delete()
+
+
+def delete_expired_recipes():
+    return GenerationCacheEntry.objects.filter(created_at__lt=_get_expiry()).delete()[0]
+
+
+def get_generation_cache_stats():
+    stats = get_hit_rate("generation_hits", "generation_misses")
+    stats["entries"] = GenerationCacheEntry.objects.count()
+    return stats
@@ -0,0 +1,134 @@
+"""Resized variants of recipe images and removal of their metadata"""
+
+import os
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import ExifTags, Image, ImageOps
+
+VARIANT_WIDTHS = [320, 640, 1280]
+# extension of variant files and their Pillow format, preferred format first
+VARIANT_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+VARIANT_QUALITY = 80
+# variants keep the full name of their original, so it can be found by them
+VARIANTS_DIRECTORY = "variants"
+# keys of Image.info with metadata, like EXIF with the place of a photo
+METADATA_KEYS = ["exif", "xmp", "XML:com.adobe.xmp", "comment"]
+
+
+def strip_metadata(content):
+    """
+    Return the image file without EXIF and other metadata, with the
+    orientation from EXIF applied to its pixels. Files without metadata,
+    animations and files that are not images are returned as they are.
+    """
+    try:
+        image = Image.open(content)
+        has_metadata = any(key in image.info for key in METADATA_KEYS) or bool(
+            getattr(image, "text", None)
+        )
+        # the first frame of MPO files of phone cameras is the photo itself
+        if not has_metadata or (
+            getattr(image, "n_frames", 1) > 1 and image.format != "MPO"
+        ):
+            content.seek(0)
+            return content
+
+        params = {}
+        if image.info.get("icc_profile"):
+            params["icc_profile"] = image.info["icc_profile"]
+        orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+        buffer = BytesIO()
+        if image.format == "JPEG" and orientation == 1:
+            # quantization of the original is kept, so the quality is not lost
+            image.save(buffer, "JPEG", quality="keep", subsampling="keep", **params)
+        elif image.format in ("JPEG", "MPO"):
+            ImageOps.exif_transpose(image).save(buffer, "JPEG", quality=95, **params)
+        else:
+            ImageOps.exif_transpose(image).save(buffer, image.format, **params)
+    except (OSError, ValueError):
+        content.seek(0)
+        return content
+    return ContentFile(buffer.getvalue(), name=content.name)
+
+
+def get_variant_name(name, width, extension):
+    return f"{VARIANTS_DIRECTORY}/{width}/{name}.{extension}"
+
+
+def get_original_name(variant_name):
+    """Return name of the image of the variant or None for other files"""
+    directory, width, name = (variant_name.split("/", 2) + ["", ""])[:3]
+    if directory != VARIANTS_DIRECTORY or not width.isdigit() or not name:
+        return None
+    return os.path.splitext(name)[0]
+
+
+def get_variant_names(name):
+    return [
+        get_variant_name(name, width, extension)
+        for width in VARIANT_WIDTHS
+        for extension in VARIANT_FORMATS
+    ]
+
+
+def has_variants(image):
+    # the variants are written in order, so the last one exists only if
+    # all of them were created
+    return default_storage.exists(get_variant_names(image.name)[-1])
+
+
+def _resize(image, width):
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def create_variants(image):
+    """
+    Create resized WebP and JPEG variants of the image file, overwriting
+    existing ones. Images are never upscaled and variants have no EXIF data.
+
+    Raise OSError if the file is missing or is not an image.
+    """
+    # variants have names of their own, so they are saved to the default
+    # storage even when images are stored by their content
+    storage = default_storage
+    with image.storage.open(image.name, "rb") as file:
+        original = Image.open(file)
+        # JPEGs are decoded at a reduced scale when it is enough
+        # for the largest variant
+        original.draft("RGB", (max(VARIANT_WIDTHS), max(VARIANT_WIDTHS)))
+        # orientation is stored in EXIF, so it is applied to the pixels
+        original = ImageOps.exif_transpose(original).convert("RGB")
+
+    for width in VARIANT_WIDTHS:
+        resized = _resize(original, width)
+        for extension, image_format in VARIANT_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=VARIANT_QUALITY, optimize=True)
+
+            _replace_file(
+                storage, get_variant_name(image.name, width, extension), buffer
+            )
+
+
+def _replace_file(storage, name, buffer):
+    # variants are shared by equal images, so several processes may write
+    # the same one, the file is replaced atomically to keep its name
+    path = storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".variant-", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(buffer.getvalue())
+        if storage.file_permissions_mode is not None:
+            os.chmod(temp_path, storage.file_permissions_mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
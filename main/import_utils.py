@@ -0,0 +1,352 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from . import forms
+from .caching import invalidate_user_cache
+from .models import (
+    Recipe,
+    RecipeIngredient,
+    RecipeSearchDocument,
+    RecipeStep,
+    RecipeTag,
+)
+from .steps import STEP_NUMBER_GAP
+
+
+class RecipeImportError(ValueError):
+    pass
+
+
+def read_ndjson(file):
+    """Yield recipes from a file with a JSON object per line"""
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            raise RecipeImportError(f"Рядок {line_number}: {error}") from error
+
+
+def _decode_cell(value):
+    # lists are stored in cells as JSON by CSVExporter, a cell that is not
+    # JSON is left as is and rejected by the validation of its record
+    try:
+        return json.loads(value)
+    except (TypeError, json.JSONDecodeError):
+        return value
+
+
+def read_csv(file):
+    """Yield recipes from a file in the format of CSVExporter"""
+    # a quoted field that is not closed is an error, not the rest of the file
+    reader = csv.DictReader(file, strict=True)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            raise RecipeImportError(str(error)) from error
+        for column in ["steps", "ingredients", "tags"]:
+            if column in row:
+                row[column] = _decode_cell(row[column])
+        yield row
+
+
+# longest recipe of a JSON file in characters, larger ones are not buffered
+MAX_JSON_RECIPE_SIZE = 1024 * 1024
+
+
+def read_json(file, chunk_size=64 * 1024, max_recipe_size=MAX_JSON_RECIPE_SIZE):
+    """
+    Yield recipes from a file with an array of recipes or a single recipe.
+    The array is parsed one element at a time, so only a single recipe has
+    to be kept in memory. Raise RecipeImportError if the file is not valid
+    JSON or a recipe is longer than max_recipe_size characters.
+    """
+    too_large = f"Рецепт довший за {max_recipe_size} символів"
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while not buffer:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        buffer = chunk.lstrip()
+    if not buffer.startswith("["):
+        # a single recipe, as in documents of JSONExporter
+        buffer += file.read(max_recipe_size + 1 - len(buffer))
+        if len(buffer) > max_recipe_size:
+            raise RecipeImportError(too_large)
+        try:
+            yield json.loads(buffer)
+        except json.JSONDecodeError as error:
+            raise RecipeImportError(str(error)) from error
+        return
+
+    position = 1
+    is_eof = False
+    # an element or the end of the array is expected first, then a separator
+    # or the end of the array after every element
+    expects_element = True
+    is_empty = True
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n":
+            position += 1
+
+        error = None
+        if position < len(buffer):
+            if buffer[position] == "]" and (is_empty or not expects_element):
+                return
+            if not expects_element:
+                if buffer[position] != ",":
+                    raise RecipeImportError("Рецепти масиву мають розділятися комами")
+                position += 1
+                expects_element = True
+                continue
+
+            try:
+                recipe, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as decode_error:
+                # the element may be cut by the end of the chunk
+                error = decode_error
+            else:
+                # a value that ends with the buffer, like a number, may
+                # continue in the next chunk
+                if end < len(buffer) or is_eof:
+                    yield recipe
+                    buffer = buffer[end:]
+                    position = 0
+                    expects_element = is_empty = False
+                    continue
+
+        if is_eof:
+            if error is not None:
+                raise RecipeImportError(str(error)) from error
+            raise RecipeImportError("Масив рецептів не завершено")
+        if len(buffer) - position > max_recipe_size:
+            raise RecipeImportError(too_large)
+        chunk = file.read(chunk_size)
+        is_eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+READERS = {
+    "ndjson": read_ndjson,
+    "jsonl": read_ndjson,
+    "csv": read_csv,
+    "json": read_json,
+}
+
+
+def get_reader(import_format):
+    """Return reader for the format name or None if there is no such format"""
+    return READERS.get(import_format)
+
+
+def _get_form_errors(form):
+    return "; ".join(
+        f"{field}: {' '.join(errors)}" for field, errors in form.errors.items()
+    )
+
+
+def _validate(form):
+    if not form.is_valid():
+        raise RecipeImportError(_get_form_errors(form))
+    return form.cleaned_data
+
+
+def _clean_fields(form_class, data):
+    """
+    Return data cleaned by the fields of the form. Forms deep copy their
+    fields on creation, which takes the most time of the validation of
+    recipe children, so the fields of the form class are used directly.
+    """
+    cleaned_data, errors = {}, []
+    for name, field in form_class.base_fields.items():
+        try:
+            cleaned_data[name] = field.clean(data.get(name))
+        except ValidationError as error:
+            errors.append(f"{name}: {' '.join(error.messages)}")
+    if errors:
+        raise RecipeImportError("; ".join(errors))
+    return cleaned_data
+
+
+def _get_list(data, key):
+    value = data.get(key) or []
+    if not isinstance(value, list):
+        raise RecipeImportError(f"{key}: очікується список")
+    return value
+
+
+def get_recipe_objects(data, user):
+    """
+    Return unsaved recipe, its steps, ingredients and tags made from a recipe
+    in the shape of the recipe generation response, validated by the forms
+    of recipes. Raise RecipeImportError if the recipe is not valid.
+    """
+    if not isinstance(data, dict):
+        raise RecipeImportError("Рецепт має бути об'єктом")
+
+    recipe = Recipe(
+        user=user,
+        **_validate(
+            forms.RecipeForm(
+                {
+                    "name": data.get("name"),
+                    "description": data.get("description"),
+                    "cooking_time": data.get("cooking_time_in_minutes"),
+                    "category": data.get("category"),
+                }
+            )
+        ),
+    )
+
+    steps = [
+        RecipeStep(
+            step_number=number * STEP_NUMBER_GAP,
+            **_clean_fields(forms.RecipeStepForm, {"step_description": step}),
+        )
+        for number, step in enumerate(_get_list(data, "steps"))
+    ]
+
+    ingredients = []
+    for ingredient in _get_list(data, "ingredients"):
+        if not isinstance(ingredient, dict):
+            raise RecipeImportError("ingredients: інгредієнт має бути об'єктом")
+        ingredients.append(
+            RecipeIngredient(**_clean_fields(forms.RecipeIngredientForm, ingredient))
+        )
+
+    # tags of a recipe are unique
+    tags = {}
+    for tag in _get_list(data, "tags"):
+        tag_text = _clean_fields(forms.RecipeTagForm, {"tag_text": tag})["tag_text"]
+        tags.setdefault(tag_text, RecipeTag(tag_text=tag_text))
+
+    return recipe, steps, ingredients, list(tags.values())
+
+
+# columns of recipe children written by import
+CHILD_COLUMNS = {
+    RecipeStep: ["recipe", "step_number", "step_description"],
+    RecipeIngredient: ["recipe", "name", "volume", "volume_measure"],
+    RecipeTag: ["recipe", "tag_text"],
+}
+
+
+def copy_rows(model, objs):
+    """Write objects with PostgreSQL COPY, which is faster than INSERT"""
+    fields = [model._meta.get_field(name) for name in CHILD_COLUMNS[model]]
+    quote_name = connection.ops.quote_name
+    sql = "COPY {} ({}) FROM STDIN".format(
+        quote_name(model._meta.db_table),
+        ", ".join(quote_name(field.column) for field in fields),
+    )
+    with connection.cursor() as cursor:
+        with cursor.cursor.copy(sql) as copy:
+            for obj in objs:
+                copy.write_row([getattr(obj, field.attname) for field in fields])
+
+
+def write_children(model, objs):
+    if connection.vendor == "postgresql":
+        copy_rows(model, objs)
+    else:
+        model.objects.bulk_create(objs)
+
+
+def save_imported_recipes(recipes):
+    """
+    Save new recipes given as (recipe, steps, ingredients, tags) tuples
+    in one transaction with a bulk insert per table.
+    """
+    with transaction.atomic():
+        # ids of the recipes are returned by the insert
+        Recipe.objects.bulk_create([recipe for recipe, *_ in recipes])
+
+        children = {RecipeStep: [], RecipeIngredient: [], RecipeTag: []}
+        for recipe, *objs in recipes:
+            for model, model_objs in zip(children, objs):
+                for obj in model_objs:
+                    obj.recipe = recipe
+                children[model] += model_objs
+
+        for model, objs in children.items():
+            if objs:
+                write_children(model, objs)
+
+        RecipeSearchDocument.refresh([recipe.pk for recipe, *_ in recipes])
+
+
+def limit_recipes(recipes, max_recipes):
+    """Yield the recipes, raise RecipeImportError after max_recipes of them"""
+    for number, recipe in enumerate(recipes, start=1):
+        if number > max_recipes:
+            raise RecipeImportError(f"Файл містить більше {max_recipes} рецептів")
+        yield recipe
+
+
+def import_recipes(
+    recipes,
+    user,
+    batch_size=1000,
+    skip=0,
+    on_write=None,
+    on_batch=None,
+    on_error=None,
+):
+    """
+    Import recipes of the user from an iterable of recipe dicts.
+
+    Valid recipes are written in batches of batch_size, every batch in its
+    own transaction. The first skip recipes are left out, so an interrupted
+    import can be resumed. on_write is called in the transaction of every
+    batch with the number of processed recipes, counting the skipped ones,
+    so the progress it stores is committed together with the batch. After
+    every batch on_batch is called with the numbers of processed, imported
+    and failed recipes. Invalid recipes are left out and passed to on_error
+    with their number, starting from 1, and the error message.
+
+    Return the numbers of imported and failed recipes.
+    """
+    imported = failed = processed = 0
+    batch = []
+
+    def write_batch():
+        nonlocal imported
+        with transaction.atomic():
+            if batch:
+                save_imported_recipes(batch)
+            if on_write:
+                on_write(processed)
+        if batch:
+            imported += len(batch)
+            batch.clear()
+            # bulk operations do not send signals
+            invalidate_user_cache(user.pk)
+        if on_batch:
+            on_batch(processed, imported, failed)
+
+    for processed, data in enumerate(recipes, start=1):
+        if processed <= skip:
+            continue
+
+        try:
+            batch.append(get_recipe_objects(data, user))
+        except RecipeImportError as error:
+            failed += 1
+            if on_error:
+                on_error(processed, str(error))
+
+        if processed % batch_size == 0:
+            write_batch()
+
+    if batch or processed % batch_size:
+        write_batch()
+    return imported, failed
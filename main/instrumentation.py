@@ -0,0 +1,103 @@
+"""
+Hooks that record metrics of requests, profile them and log slow queries,
+see main.metrics, main.profiling and main.slow_queries
+"""
+
+import time
+
+from django.db import connection
+from django.template.backends import django as django_backend
+
+from . import metrics, profiling, slow_queries
+
+
+class MetricsMiddleware:
+    """
+    Record time, database queries and template rendering of every request
+    by the name of its view. Should be the first middleware, so the time
+    of the other ones is counted too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = metrics.RequestStats()
+        token = metrics.current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats.track_query):
+                response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        duration = time.perf_counter() - start
+
+        # names of views keep the number of series small, unlike paths
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        labels = {"view": view}
+        metrics.increment(
+            "recipes_http_requests_total",
+            {**labels, "method": request.method, "status": str(response.status_code)},
+        )
+        metrics.observe("recipes_http_request_duration_seconds", labels, duration)
+        metrics.observe("recipes_db_queries_per_request", labels, stats.queries)
+        metrics.increment(
+            "recipes_db_query_duration_seconds_total", labels, stats.query_seconds
+        )
+        metrics.increment(
+            "recipes_template_render_duration_seconds_total",
+            labels,
+            stats.template_seconds,
+        )
+        metrics.maybe_flush()
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Profile requests of staff users that ask for it, see main.profiling.
+    Should follow AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if profiling.is_profiling_requested(request):
+            return profiling.profile_request(request, self.get_response)
+        return self.get_response(request)
+
+
+class SlowQueryMiddleware:
+    """Log slow queries of requests, see main.slow_queries"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with connection.execute_wrapper(slow_queries.SlowQueryLog(request)):
+            return self.get_response(request)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        stats = metrics.current_request.get()
+        if stats is None:
+            return super().render(context, request)
+
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - start
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Django template backend that times rendering of templates"""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
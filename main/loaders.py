@@ -0,0 +1,62 @@
+from django.db.models import (
+    BooleanField,
+    ExpressionWrapper,
+    Prefetch,
+    Q,
+    prefetch_related_objects,
+)
+from django.shortcuts import get_object_or_404
+
+from .models import Recipe, RecipeImage, RecipeIngredient, RecipeStep, RecipeTag
+
+
+def get_recipe_children_prefetches():
+    return [
+        Prefetch(
+            "recipeingredient_set", queryset=RecipeIngredient.objects.order_by("id")
+        ),
+        Prefetch("recipestep_set", queryset=RecipeStep.objects.order_by("step_number")),
+        Prefetch("recipetag_set", queryset=RecipeTag.objects.order_by("id")),
+        Prefetch("recipeimage_set", queryset=RecipeImage.objects.order_by("id")),
+    ]
+
+
+def load_recipe(user, recipe_id, with_children=True):
+    """
+    Return recipe with given id annotated with ``is_owner``, whether it
+    belongs to the user. Raise Http404 if there is no such recipe.
+
+    Children of the recipe are prefetched only if the user owns it, so the
+    recipe is loaded in one query and its children in four more.
+    """
+    recipe = get_object_or_404(
+        Recipe.objects.annotate(
+            is_owner=ExpressionWrapper(Q(user=user), output_field=BooleanField())
+        ),
+        pk=recipe_id,
+    )
+
+    if recipe.is_owner and with_children:
+        prefetch_related_objects([recipe], *get_recipe_children_prefetches())
+
+    return recipe
+
+
+def iter_recipes_with_children(queryset, chunk_size=500):
+    """
+    Yield (recipe, ingredients, steps, tags) for every recipe of the queryset.
+
+    Recipes are read with a server-side cursor and children are prefetched
+    per chunk of recipes, so memory use does not depend on the number
+    of recipes.
+    """
+    recipes = queryset.prefetch_related(*get_recipe_children_prefetches()).iterator(
+        chunk_size=chunk_size
+    )
+    for recipe in recipes:
+        yield (
+            recipe,
+            recipe.recipeingredient_set.all(),
+            recipe.recipestep_set.all(),
+            recipe.recipetag_set.all(),
+        )
@@ -0,0 +1,130 @@
+import shutil
+import tempfile
+import time
+import uuid
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+
+from main.cleanup import wait_for_deletions
+from main.models import Recipe, RecipeImage
+from main.persistence import save_recipe
+
+
+def make_image(size):
+    buffer = BytesIO()
+    Image.effect_noise((size, size), 64).convert("RGB").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def build_recipe(user, image, images):
+    recipe = Recipe(
+        user=user,
+        name="benchmark",
+        description="benchmark recipe",
+        cooking_time=30,
+        category="benchmark",
+    )
+    # equal images would share files and their variants, the trailing bytes
+    # make every image unique and are ignored by decoders
+    return recipe, [
+        RecipeImage(image=ContentFile(image + uuid.uuid4().bytes, name="benchmark.jpg"))
+        for _ in range(images)
+    ]
+
+
+def legacy_save(recipe):
+    # the old pre_save receiver read the row again to find changed images
+    with transaction.atomic():
+        Recipe.objects.get(pk=recipe.pk)
+        recipe.save()
+
+
+def current_save(recipe):
+    with transaction.atomic():
+        recipe.save()
+
+
+def create(user, image, images):
+    recipe, recipe_images = build_recipe(user, image, images)
+    save_recipe(recipe, created=recipe_images)
+    return recipe
+
+
+def delete(recipe):
+    # synchronous deletion removes the files while the transaction commits
+    with transaction.atomic():
+        recipe.delete()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency of recipe saves with and without images and of "
+        "deletions with files removed synchronously or in background after "
+        "commit. Created data is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=3)
+        parser.add_argument("--image-size", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def measure(self, name, runs):
+        timings, queries = [], 0
+        for run in runs:
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = len(captured)
+
+        timings.sort()
+        self.stdout.write(
+            f"{name:<28} queries: {queries:>4}   "
+            f"median: {timings[len(timings) // 2]:8.2f} ms   "
+            f"max: {timings[-1]:8.2f} ms"
+        )
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                self.run(options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def run(self, options):
+        image = make_image(options["image_size"])
+        repeat = range(options["repeat"])
+        user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex}")
+
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING("save recipe"))
+            recipe = create(user, image, 0)
+            for name, save in [("legacy", legacy_save), ("current", current_save)]:
+                self.measure(name, [lambda save=save: save(recipe) for _ in repeat])
+
+            self.stdout.write(self.style.MIGRATE_HEADING("create recipe"))
+            for images in [0, options["images"]]:
+                self.measure(
+                    f"with {images} images",
+                    [lambda images=images: create(user, image, images) for _ in repeat],
+                )
+
+            self.stdout.write(self.style.MIGRATE_HEADING("delete recipe"))
+            for name, async_delete in [("synchronous", False), ("background", True)]:
+                recipes = [create(user, image, options["images"]) for _ in repeat]
+                with override_settings(RECIPE_MEDIA_DELETE_ASYNC=async_delete):
+                    self.measure(
+                        f"with {options['images']} images, {name}",
+                        [lambda recipe=recipe: delete(recipe) for recipe in recipes],
+                    )
+                    wait_for_deletions()
+        finally:
+            user.delete()
+            wait_for_deletions()
@@ -0,0 +1,177 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import signals
+from django.test.utils import CaptureQueriesContext
+
+from main.models import (
+    Recipe,
+    RecipeIngredient,
+    RecipeStep,
+    RecipeTag,
+    invalidate_cache_on_delete,
+    invalidate_cache_on_save,
+    update_search_document_on_child_delete,
+    update_search_document_on_child_save,
+    update_search_document_on_recipe_save,
+)
+from main.persistence import CHILD_FIELDS, save_recipe
+
+
+def build_recipe(user, ingredients, steps, tags):
+    recipe = Recipe(
+        user=user,
+        name="benchmark",
+        description="benchmark recipe",
+        cooking_time=30,
+        category="benchmark",
+    )
+    children = (
+        [
+            RecipeIngredient(name=f"ingredient {i}", volume=i, volume_measure="g")
+            for i in range(ingredients)
+        ]
+        + [
+            RecipeStep(step_number=i, step_description=f"step {i}")
+            for i in range(steps)
+        ]
+        + [RecipeTag(tag_text=f"tag {i}") for i in range(tags)]
+    )
+    return recipe, children
+
+
+# receivers added with the bulk write path, which refresh the search document
+# and the cache after every saved row
+RECIPE_RECEIVERS = (
+    [(signals.post_save, update_search_document_on_recipe_save, Recipe)]
+    + [
+        receiver
+        for sender in [RecipeIngredient, RecipeTag]
+        for receiver in [
+            (signals.post_save, update_search_document_on_child_save, sender),
+            (signals.post_delete, update_search_document_on_child_delete, sender),
+        ]
+    ]
+    + [
+        receiver
+        for sender in [Recipe, RecipeIngredient, RecipeStep, RecipeTag]
+        for receiver in [
+            (signals.post_save, invalidate_cache_on_save, sender),
+            (signals.post_delete, invalidate_cache_on_delete, sender),
+        ]
+    ]
+)
+
+
+@contextmanager
+def without_recipe_receivers():
+    """
+    Disconnect the receivers of the recipe tables, so the legacy write path
+    makes as many queries as it did before they were added
+    """
+    disconnected = [
+        (signal, receiver, sender)
+        for signal, receiver, sender in RECIPE_RECEIVERS
+        if signal.disconnect(receiver, sender=sender)
+    ]
+    try:
+        yield
+    finally:
+        for signal, receiver, sender in disconnected:
+            signal.connect(receiver, sender=sender)
+
+
+def legacy_create(recipe, children):
+    with without_recipe_receivers(), transaction.atomic():
+        recipe.save()
+        for child in children:
+            child.recipe = recipe
+            child.save()
+
+
+def legacy_update(recipe, updated, deleted):
+    with without_recipe_receivers(), transaction.atomic():
+        recipe.save()
+        for child in updated:
+            child.save()
+        for child in deleted:
+            child.delete()
+
+
+def bulk_create(recipe, children):
+    save_recipe(recipe, created=children)
+
+
+def bulk_update(recipe, updated, deleted):
+    save_recipe(recipe, updated=updated, deleted=deleted)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare round trips and latency of the legacy row by row and the bulk "
+        "recipe write paths. Created data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ingredients", type=int, default=40)
+        parser.add_argument("--steps", type=int, default=30)
+        parser.add_argument("--tags", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def measure(self, name, runs):
+        timings, queries = [], 0
+        for run in runs:
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries = len(captured)
+
+        timings.sort()
+        self.stdout.write(
+            f"{name:<16} queries: {queries:>4}   "
+            f"median: {timings[len(timings) // 2]:8.2f} ms   "
+            f"max: {timings[-1]:8.2f} ms"
+        )
+
+    def handle(self, *args, **options):
+        sizes = (options["ingredients"], options["steps"], options["tags"])
+        repeat = range(options["repeat"])
+
+        with transaction.atomic():
+            user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex}")
+
+            self.stdout.write(self.style.MIGRATE_HEADING("create recipe"))
+            for name, create in [("legacy", legacy_create), ("bulk", bulk_create)]:
+                self.measure(
+                    name,
+                    [
+                        lambda create=create: create(*build_recipe(user, *sizes))
+                        for _ in repeat
+                    ],
+                )
+
+            self.stdout.write(self.style.MIGRATE_HEADING("edit recipe"))
+            for name, update in [("legacy", legacy_update), ("bulk", bulk_update)]:
+                runs = []
+                for _ in repeat:
+                    recipe, children = build_recipe(user, *sizes)
+                    save_recipe(recipe, created=children)
+
+                    # every second child is changed, the rest are deleted
+                    for child in children[::2]:
+                        for field in CHILD_FIELDS[type(child)]:
+                            if field != "volume":
+                                setattr(child, field, f"{getattr(child, field)}!")
+                    runs.append(
+                        lambda update=update, recipe=recipe, children=children: (
+                            update(recipe, children[::2], children[1::2])
+                        )
+                    )
+                self.measure(name, runs)
+
+            transaction.set_rollback(True)
@@ -0,0 +1,81 @@
+import time
+import uuid
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from main.models import Recipe
+from main.search import SEARCH_FORM_FIELDS, search_recipes
+from main.seed import seed_recipes
+
+# lookups of the search that was used before search documents
+LEGACY_LOOKUPS = {
+    "name": "name__icontains",
+    "description": "description__icontains",
+    "category": "category__icontains",
+    "ingredients": "recipeingredient__name__icontains",
+    "tags": "recipetag__tag_text__icontains",
+}
+
+
+def legacy_search(user, search_string, fields):
+    return (
+        Recipe.objects.filter(
+            reduce(or_, (Q(**{LEGACY_LOOKUPS[f]: search_string}) for f in fields)),
+            user=user,
+        )
+        .distinct()
+        .order_by("name")
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare query plans and timings of the legacy and the full-text "
+        "recipe search on seeded data. Seeded data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=20000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--search-string", default="борщ")
+
+    def handle(self, *args, **options):
+        fields = list(SEARCH_FORM_FIELDS.values())
+
+        with transaction.atomic():
+            user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex}")
+            seed_recipes(user, options["recipes"], seed=options["seed"])
+
+            explain_options = {}
+            if connection.vendor == "postgresql":
+                explain_options = {"analyze": True, "buffers": True}
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+
+            for name, search in [
+                ("legacy", legacy_search),
+                ("full-text", search_recipes),
+            ]:
+                queryset = search(user, options["search_string"], fields)
+
+                timings = []
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    queryset.count()
+                    list(queryset.all()[:5])
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{name} search"))
+                self.stdout.write(queryset.explain(**explain_options))
+                self.stdout.write(
+                    f"count + first page: min {min(timings):.2f} ms, "
+                    f"max {max(timings):.2f} ms\n"
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,278 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.shortcuts import reverse
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from main.forms import SortRecipeListForm
+from main.models import Recipe
+from main.search import SEARCH_FORM_FIELDS
+from main.seed import INGREDIENTS, WORDS, seed_users
+
+SORTING_PARAMS = [
+    value for value, _ in SortRecipeListForm.base_fields["ordering"].choices
+]
+# shown by the page of a saved recipe, the edit page with validation errors
+# is answered with 200 too
+EDIT_SUCCESS_TEXT = "Рецепт успішно відредаговано".encode()
+# the benchmark clears the cache between requests, so it gets a cache of its
+# own instead of the default one, which may be shared with the running site
+BENCHMARK_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "benchmark-views",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+
+
+def get_edit_data(recipe, number):
+    """Return POST data of the edit page that changes the recipe description"""
+    data = {
+        "name": recipe.name,
+        "description": f"{recipe.description} {number}",
+        "cooking_time": recipe.cooking_time,
+        "category": recipe.category,
+        "recipeimage_set-TOTAL_FORMS": "0",
+        "recipeimage_set-INITIAL_FORMS": "0",
+    }
+    for prefix, children, fields in [
+        ("recipestep_set", recipe.recipestep_set.all(), ["step_description"]),
+        ("recipetag_set", recipe.recipetag_set.all(), ["tag_text"]),
+        (
+            "recipeingredient_set",
+            recipe.recipeingredient_set.all(),
+            ["name", "volume", "volume_measure"],
+        ),
+    ]:
+        data[f"{prefix}-TOTAL_FORMS"] = data[f"{prefix}-INITIAL_FORMS"] = len(children)
+        for i, child in enumerate(children):
+            data[f"{prefix}-{i}-id"] = child.pk
+            for field in fields:
+                data[f"{prefix}-{i}-{field}"] = getattr(child, field)
+    return data
+
+
+def get_scenarios(rng):
+    """
+    Return functions making the requests of every benchmarked page from
+    a client and a recipe of its user. The requests are picked by rng,
+    so every run makes the same ones.
+    """
+
+    def recipe_url(name):
+        return lambda client, recipe: client.get(
+            reverse(name, kwargs={"recipe_id": recipe.pk})
+        )
+
+    def edit_recipe_post(client, recipe):
+        response = client.post(
+            reverse("edit_recipe", kwargs={"recipe_id": recipe.pk}),
+            get_edit_data(recipe, rng.randrange(1000)),
+        )
+        if EDIT_SUCCESS_TEXT not in response.content:
+            raise RuntimeError(f"Recipe {recipe.pk} was not saved: {response}")
+        return response
+
+    return {
+        "recipe_list": lambda client, recipe: client.get(
+            reverse("list_recipes"),
+            {
+                "ordering": rng.choice(SORTING_PARAMS),
+                "is_descending": rng.choice(["", "on"]),
+            },
+        ),
+        "search_results": lambda client, recipe: client.get(
+            reverse("search_results"),
+            {
+                "search_string": rng.choice(WORDS + INGREDIENTS),
+                **{
+                    field: "on"
+                    for field in rng.sample(
+                        list(SEARCH_FORM_FIELDS),
+                        rng.randint(1, len(SEARCH_FORM_FIELDS)),
+                    )
+                },
+            },
+        ),
+        "recipe_details": recipe_url("recipe_details"),
+        "edit_recipe": recipe_url("edit_recipe"),
+        "edit_recipe_post": edit_recipe_post,
+        "download_recipe": recipe_url("download_recipe"),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_percentiles(timings):
+    # inclusive method gives the smallest and the largest timings as
+    # the 0th and the 100th percentiles, like most monitoring tools
+    percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "p50_ms": round(percentiles[49], 3),
+        "p95_ms": round(percentiles[94], 3),
+        "p99_ms": round(percentiles[98], 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def run_request(request, client, recipe):
+    response = request(client, recipe)
+    if response.streaming:
+        b"".join(response.streaming_content)
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.status_code} response: {response}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency percentiles, query counts and peak memory of the "
+        "recipe pages on seeded data and write them as JSON, so runs can be "
+        "compared across commits. Seeded data is rolled back afterwards. "
+        "All requests run in that transaction, so work done after commit, "
+        "like invalidation of cached pages and deletion of files, is not "
+        "measured."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--recipes", type=int, default=1000, help="Per user.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--requests", type=int, default=200, help="Per page.")
+        parser.add_argument("--warmup", type=int, default=10, help="Per page.")
+        parser.add_argument(
+            "--warm-cache",
+            action="store_true",
+            help="Keep cached pages between requests instead of clearing them.",
+        )
+        parser.add_argument(
+            "--pages",
+            nargs="+",
+            help="Names of the pages to benchmark, all of them by default.",
+        )
+        parser.add_argument("--output", help="File for the results, stdout if not set.")
+
+    def handle(self, *args, **options):
+        scenarios = get_scenarios(random.Random(options["seed"]))
+        pages = options["pages"] or list(scenarios)
+        unknown = set(pages) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown pages: {', '.join(sorted(unknown))}")
+        # percentiles need at least two timings, pages need a recipe
+        if options["requests"] < 2 or options["users"] < 1 or options["recipes"] < 1:
+            raise CommandError("At least 2 requests, 1 user and 1 recipe are needed")
+
+        results = {
+            "commit": get_commit(),
+            "database": connection.vendor,
+            "options": {
+                name: options[name]
+                for name in ["users", "recipes", "seed", "requests", "warm_cache"]
+            },
+            "pages": {},
+        }
+
+        # the test client is served as testserver
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            CACHES=BENCHMARK_CACHES,
+        ), transaction.atomic():
+            started_at = time.perf_counter()
+            users = seed_users(
+                options["users"], options["recipes"], seed=options["seed"]
+            )
+            results["seed_seconds"] = round(time.perf_counter() - started_at, 3)
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+
+            clients = []
+            for user in users:
+                client = Client()
+                client.force_login(user)
+                clients.append(client)
+            recipe_ids = {
+                user.pk: list(
+                    Recipe.objects.filter(user=user).values_list("id", flat=True)
+                )
+                for user in users
+            }
+
+            rng = random.Random(options["seed"])
+            for page in pages:
+                self.stderr.write(f"Benchmarking {page}")
+                results["pages"][page] = self.benchmark(
+                    scenarios[page], clients, users, recipe_ids, rng, options
+                )
+
+            transaction.set_rollback(True)
+            cache.clear()
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def benchmark(self, request, clients, users, recipe_ids, rng, options):
+        def get_request_args():
+            number = rng.randrange(len(users))
+            recipe = Recipe.objects.prefetch_related(
+                "recipestep_set", "recipetag_set", "recipeingredient_set"
+            ).get(pk=rng.choice(recipe_ids[users[number].pk]))
+            if not options["warm_cache"]:
+                cache.clear()
+            return clients[number], recipe
+
+        for _ in range(options["warmup"]):
+            run_request(request, *get_request_args())
+
+        timings, queries = [], []
+        for _ in range(options["requests"]):
+            args = get_request_args()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                run_request(request, *args)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured))
+
+        # tracing allocations slows requests down, so memory is measured
+        # by separate requests
+        peaks = []
+        for _ in range(min(options["requests"], 20)):
+            args = get_request_args()
+            tracemalloc.start()
+            try:
+                run_request(request, *args)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+        return {
+            "requests": len(timings),
+            **get_percentiles(timings),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "queries": {"min": min(queries), "max": max(queries)},
+            "peak_memory_kib": round(max(peaks) / 1024, 1),
+        }
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from main.images import create_variants, has_variants
+from main.models import RecipeImage
+
+
+class Command(BaseCommand):
+    help = "Create resized variants of recipe images that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Recreate variants of all images.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        images = (
+            RecipeImage.objects.only("image")
+            .order_by("id")
+            .iterator(chunk_size=options["batch_size"])
+        )
+
+        created = skipped = failed = 0
+        for recipe_image in images:
+            image = recipe_image.image
+            if not options["force"] and has_variants(image):
+                skipped += 1
+                continue
+
+            try:
+                create_variants(image)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f"{image.name}: {error}")
+            else:
+                created += 1
+
+        self.stdout.write(
+            f"Created variants of {created} images, "
+            f"skipped {skipped}, failed {failed}"
+        )
@@ -0,0 +1,130 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.images import VARIANTS_DIRECTORY, get_original_name
+from main.models import RecipeImage, is_image_file_old
+
+
+def walk_files(root, directory):
+    """
+    Yield (name relative to root, stat) of files under the directory.
+    Only one scandir iterator per level of the tree is open at a time.
+    """
+    stack = [os.path.join(root, directory)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                    yield name, entry.stat(follow_symlinks=False)
+
+
+def get_referenced(names):
+    """Return names of the batch that are referenced images"""
+    return set(
+        RecipeImage.objects.filter(image__in=names).values_list("image", flat=True)
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Find image files and variants that no recipe image references and "
+        "delete the ones older than the grace period."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--directory",
+            action="append",
+            dest="directories",
+            help="Directory of MEDIA_ROOT to scan, may be repeated. "
+            f'Defaults to "recipes" and "{VARIANTS_DIRECTORY}".',
+        )
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help="Files modified more recently are kept, as their images "
+            "may not be committed yet.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report orphaned files.",
+        )
+
+    def handle(self, *args, **options):
+        root = str(settings.MEDIA_ROOT)
+        directories = options["directories"] or ["recipes", VARIANTS_DIRECTORY]
+        self.dry_run = options["dry_run"]
+        self.verbosity = options["verbosity"]
+        self.deadline = time.time() - options["grace_hours"] * 60 * 60
+        self.scanned = self.orphans = self.size = 0
+
+        for directory in directories:
+            if not os.path.isdir(os.path.join(root, directory)):
+                continue
+
+            batch = []
+            for name, stat in walk_files(root, directory):
+                self.scanned += 1
+                batch.append((name, stat))
+                if len(batch) >= options["batch_size"]:
+                    self.collect(root, batch)
+                    batch = []
+            self.collect(root, batch)
+
+        action = "Would delete" if self.dry_run else "Deleted"
+        self.stdout.write(
+            f"Scanned {self.scanned} files. {action} {self.orphans} orphaned "
+            f"files of {self.size / 1024 / 1024:.1f} MiB."
+        )
+
+    def collect(self, root, batch):
+        # variants are referenced through their original images
+        images = {
+            name: get_original_name(name) or name
+            for name, stat in batch
+            if stat.st_mtime < self.deadline
+        }
+        if not images:
+            return
+
+        referenced = get_referenced(set(images.values()))
+        for name, stat in batch:
+            if name not in images or images[name] in referenced:
+                continue
+            if not self.dry_run and not self.is_orphaned(root, name, images[name]):
+                continue
+
+            self.orphans += 1
+            self.size += stat.st_size
+            if self.dry_run or self.verbosity > 1:
+                self.stdout.write(name)
+            if not self.dry_run:
+                try:
+                    os.remove(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+
+    def is_orphaned(self, root, name, original):
+        """
+        Check the file again right before it is deleted, as its image may
+        have been uploaded again or committed since the batch was scanned.
+        Uploads of an existing file only refresh its modification time.
+        """
+        try:
+            modified = os.stat(os.path.join(root, name)).st_mtime
+        except FileNotFoundError:
+            return False
+        return (
+            modified < self.deadline
+            and is_image_file_old(original)
+            and not RecipeImage.objects.filter(image=original).exists()
+        )
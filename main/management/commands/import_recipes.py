@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.import_utils import READERS, RecipeImportError, get_reader, import_recipes
+from main.models import ImportCheckpoint
+
+
+def read_checkpoint(name, input_path):
+    """Return number of recipes of the input processed before or 0"""
+    checkpoint = ImportCheckpoint.objects.filter(name=name).first()
+    if checkpoint is None:
+        return 0
+
+    if checkpoint.input != input_path:
+        raise CommandError(
+            f"Checkpoint {name} belongs to the import of {checkpoint.input}"
+        )
+    return checkpoint.processed
+
+
+def write_checkpoint(name, input_path, processed):
+    ImportCheckpoint.objects.update_or_create(
+        name=name, defaults={"input": input_path, "processed": processed}
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Import recipes of a user from NDJSON, CSV or JSON in the shape of "
+        "the recipe generation response, with an optional list of tags."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Path of the file, - for stdin.")
+        parser.add_argument("--user", required=True, help="Username of the owner.")
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="Format of the file, by default taken from its extension.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--checkpoint",
+            help=(
+                "Name of the checkpoint storing the number of processed "
+                "recipes in the database with every batch. A rerun with the "
+                "same checkpoint resumes the import."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        input_path = options["input"]
+        import_format = options["format"] or os.path.splitext(input_path)[1][1:]
+        reader = get_reader(import_format.lower())
+        if reader is None:
+            raise CommandError(f"Unknown format of {input_path}, set --format")
+
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"There is no user {options['user']}")
+
+        checkpoint = options["checkpoint"]
+        skip = 0
+        if checkpoint:
+            skip = read_checkpoint(checkpoint, os.path.abspath(input_path))
+            if skip:
+                self.stdout.write(f"Resuming after {skip} processed recipes.")
+
+        started_at = time.monotonic()
+
+        def on_write(processed):
+            write_checkpoint(checkpoint, os.path.abspath(input_path), processed)
+
+        def on_batch(processed, imported, failed):
+            rate = (processed - skip) / max(time.monotonic() - started_at, 1e-9)
+            self.stdout.write(
+                f"Processed {processed} recipes: {imported} imported, "
+                f"{failed} failed, {rate:.0f} recipes/s"
+            )
+
+        def on_error(number, message):
+            self.stderr.write(f"Recipe {number}: {message}")
+
+        file = (
+            sys.stdin
+            if input_path == "-"
+            else open(input_path, encoding="utf-8", newline="")
+        )
+        try:
+            imported, failed = import_recipes(
+                reader(file),
+                user,
+                batch_size=options["batch_size"],
+                skip=skip,
+                on_write=on_write if checkpoint else None,
+                on_batch=on_batch,
+                on_error=on_error,
+            )
+        except RecipeImportError as error:
+            # recipes of the written batches stay imported
+            raise CommandError(f"Could not read {input_path}: {error}")
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        self.stdout.write(
+            f"Imported {imported} recipes, {failed} failed, "
+            f"in {time.monotonic() - started_at:.1f} s."
+        )
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+from main.models import Recipe, RecipeSearchDocument
+
+# same dictionary as the migration of search documents creates, for servers
+# where the dictionary was installed after the migration
+CREATE_DICTIONARY_SQL = """
+CREATE TEXT SEARCH DICTIONARY recipes_uk_hunspell (
+    TEMPLATE = ispell, DictFile = uk_ua, AffFile = uk_ua
+);
+ALTER TEXT SEARCH CONFIGURATION recipes_uk
+    ALTER MAPPING FOR word, hword, hword_part
+    WITH recipes_uk_hunspell, simple;
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Add the Ukrainian hunspell dictionary to the search configuration if "
+        "it is missing and rebuild search documents of all recipes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def create_dictionary(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_ts_dict WHERE dictname = %s",
+                ["recipes_uk_hunspell"],
+            )
+            if cursor.fetchone() is not None:
+                return
+
+            try:
+                with transaction.atomic():
+                    cursor.execute(CREATE_DICTIONARY_SQL)
+            except DatabaseError as error:
+                raise CommandError(
+                    "Ukrainian hunspell dictionary is not available, install "
+                    "uk_ua.dict and uk_ua.affix in tsearch_data of the database "
+                    f"server: {error}"
+                ) from error
+        self.stdout.write("Added the Ukrainian dictionary to the search")
+
+    def handle(self, *args, **options):
+        if connection.vendor == "postgresql":
+            self.create_dictionary()
+
+        recipe_ids = Recipe.objects.order_by("pk").values_list("pk", flat=True)
+        batch_size = options["batch_size"]
+        last_id = 0
+        rebuilt = 0
+        while True:
+            batch = list(recipe_ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            RecipeSearchDocument.refresh(batch)
+            rebuilt += len(batch)
+            last_id = batch[-1]
+
+        self.stdout.write(f"Rebuilt search documents of {rebuilt} recipes")
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import metrics
+from main.generation import delete_old_jobs, recover_stale_jobs, run_next_job
+from main.generation_cache import delete_expired_recipes
+
+# seconds between the checks for stale and old jobs and cached recipes
+MAINTENANCE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate recipes of pending generation jobs. Several workers may run "
+        "at once, every one of them runs one job at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1,
+            help="Seconds to wait for new jobs when there are none.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when there are no pending jobs.",
+        )
+
+    def handle(self, *args, **options):
+        maintained_at = 0
+        while True:
+            close_old_connections()
+
+            if time.monotonic() - maintained_at >= MAINTENANCE_INTERVAL:
+                retried, failed = recover_stale_jobs()
+                deleted = delete_old_jobs()
+                expired = delete_expired_recipes()
+                maintained_at = time.monotonic()
+                if options["verbosity"] > 1 or retried or failed:
+                    self.stdout.write(
+                        f"Stale jobs: {retried} retried, {failed} failed. "
+                        f"Deleted {deleted} old jobs, "
+                        f"{expired} expired cached recipes."
+                    )
+
+            ran = run_next_job()
+            # the worker serves no requests, which flush metrics of web processes
+            metrics.maybe_flush()
+            if ran:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.slow_queries import aggregate, read_log
+
+ORDERINGS = {
+    "total": lambda query: query["total"],
+    "count": lambda query: query["count"],
+    "max": lambda query: query["max"],
+    "mean": lambda query: query["total"] / query["count"],
+}
+
+
+def format_counts(counts):
+    return ", ".join(
+        f"{name} ({count})"
+        for name, count in sorted(counts.items(), key=lambda item: -item[1])
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Aggregate the slow query log by fingerprints of queries, showing "
+        "their durations, views, lines of code that ran them and plans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "logs",
+            nargs="*",
+            help="Log files, RECIPE_SLOW_QUERY_LOG by default.",
+        )
+        parser.add_argument("--order-by", choices=sorted(ORDERINGS), default="total")
+        parser.add_argument("--limit", type=int, default=20)
+
+    def handle(self, *args, **options):
+        logs = options["logs"] or [settings.RECIPE_SLOW_QUERY_LOG]
+        if logs == [None]:
+            raise CommandError("RECIPE_SLOW_QUERY_LOG is not set, give the logs")
+
+        entries = []
+        for path in logs:
+            try:
+                with open(path, encoding="utf-8") as file:
+                    entries += read_log(file)
+            except FileNotFoundError:
+                raise CommandError(f"There is no log {path}")
+
+        queries = sorted(
+            aggregate(entries), key=ORDERINGS[options["order_by"]], reverse=True
+        )
+        self.stdout.write(
+            f"{len(entries)} slow queries of {len(queries)} kinds, "
+            f"ordered by {options['order_by']} duration."
+        )
+        for query in queries[: options["limit"]]:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{query['fingerprint']}"))
+            self.stdout.write(
+                f"count: {query['count']}   "
+                f"total: {query['total'] * 1000:.1f} ms   "
+                f"mean: {query['total'] / query['count'] * 1000:.1f} ms   "
+                f"max: {query['max'] * 1000:.1f} ms"
+            )
+            self.stdout.write(f"views: {format_counts(query['views'])}")
+            self.stdout.write(f"origins: {format_counts(query['origins'])}")
+            self.stdout.write(query["normalized_sql"])
+            if query["explain"]:
+                self.stdout.write(query["explain"])
@@ -0,0 +1,129 @@
+"""Sending of media files after the access to them is checked"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def get_etag(name, size):
+    """
+    Return strong ETag of the stored file. Names of images and their
+    variants hold the hash of the original content, which does not change
+    when a re-upload of the same image touches the file.
+    """
+    return f'"{name}-{size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) of the single byte range of the Range header,
+    with inclusive end, None if the header can not be used
+    or False if the range is outside the file.
+    """
+    # ranges with several parts are not supported, the whole file is sent
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        # the last bytes of the file
+        length = int(end)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _offload(response, name, path):
+    backend = settings.RECIPE_MEDIA_SENDFILE
+    if backend == "x-accel-redirect":
+        response["X-Accel-Redirect"] = settings.RECIPE_MEDIA_ACCEL_PREFIX + quote(name)
+    elif backend == "x-sendfile":
+        response["X-Sendfile"] = path
+    else:
+        raise ValueError(f"Unknown RECIPE_MEDIA_SENDFILE value: {backend}")
+
+
+def serve_media(request, name):
+    """
+    Return response with the media file, shown inline and cached
+    by the browser only. The file is validated by its ETag only, as its
+    modification time changes when the same image is uploaded again.
+
+    When RECIPE_MEDIA_SENDFILE is set, the response has no body and the file
+    is sent by the front-end server, which also handles Range requests.
+    Otherwise the file is streamed from Python.
+    """
+    path = default_storage.path(name)
+    stat = os.stat(path)
+    etag = get_etag(name, stat.st_size)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+        if settings.RECIPE_MEDIA_SENDFILE:
+            response = HttpResponse(content_type=content_type)
+            _offload(response, name, path)
+        else:
+            response = _serve_from_python(request, path, stat, etag, content_type)
+
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
+    patch_cache_control(response, private=True, max_age=settings.RECIPE_MEDIA_MAX_AGE)
+    return response
+
+
+def _serve_from_python(request, path, stat, etag, content_type):
+    size = stat.st_size
+    byte_range = None
+    # If-Range with a date can not be checked against a touched file
+    if "Range" in request.headers and request.headers.get("If-Range", etag) == etag:
+        byte_range = parse_range(request.headers["Range"], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        return FileResponse(
+            open(path, "rb"),
+            filename=os.path.basename(path),
+            content_type=content_type,
+        )
+
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        _read_range(path, start, end), status=206, content_type=content_type
+    )
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = str(end - start + 1)
+    return response
@@ -0,0 +1,246 @@
+"""
+Metrics of requests, queries, templates, caches and recipe generation,
+exported in the Prometheus text format.
+
+Metrics are aggregated in memory of every process. When
+RECIPE_METRICS_DIR is set, processes write their totals to files in it,
+at most every RECIPE_METRICS_FLUSH_INTERVAL seconds, and the totals of
+all processes, including the generation worker, are summed on export.
+Files of exited processes are kept, so counters do not go back, and
+the directory should be emptied when the whole service is restarted.
+"""
+
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from .profiling import explaining
+
+# seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# type, help and buckets of histograms
+METRICS = {
+    "recipes_http_requests_total": ("counter", "Requests by view and status", None),
+    "recipes_http_request_duration_seconds": (
+        "histogram",
+        "Time to the response by view, without streaming of the content",
+        DURATION_BUCKETS,
+    ),
+    "recipes_db_queries_per_request": (
+        "histogram",
+        "Database queries of a request by view",
+        QUERY_COUNT_BUCKETS,
+    ),
+    "recipes_db_query_duration_seconds_total": (
+        "counter",
+        "Time of database queries by view",
+        None,
+    ),
+    "recipes_template_render_duration_seconds_total": (
+        "counter",
+        "Time of rendering of templates by view",
+        None,
+    ),
+    "recipes_cache_events_total": (
+        "counter",
+        "Hits and misses of the page and generated recipe caches",
+        None,
+    ),
+    "recipes_generation_call_duration_seconds": (
+        "histogram",
+        "Time of calls of the generation backend with retries",
+        DURATION_BUCKETS,
+    ),
+}
+
+_lock = threading.Lock()
+# (name, labels) to a value of a counter or to bucket counts, sum
+# and count of a histogram
+_values = {}
+_pid = None
+_file_name = None
+_flushed_at = 0
+
+
+class RequestStats:
+    """Totals of the current request, collected by the hooks of the request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def track_query(self, execute, sql, params, many, context):
+        # database execute wrapper, plans captured by the profiler or the slow
+        # query log are not queries of the request
+        if explaining.get():
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - start
+
+
+# stats of the request being handled in the thread, None outside requests
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def _check_process():
+    # a forked process starts with the totals of its parent, which are
+    # already counted in the file of the parent
+    global _pid, _file_name
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _file_name = f"{_pid}-{uuid.uuid4().hex}.json"
+        _values.clear()
+
+
+def _get_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, labels, value=1):
+    key = _get_key(name, labels)
+    with _lock:
+        _check_process()
+        _values[key] = _values.get(key, 0) + value
+
+
+def observe(name, labels, value):
+    buckets = METRICS[name][2]
+    key = _get_key(name, labels)
+    with _lock:
+        _check_process()
+        histogram = _values.get(key)
+        if histogram is None:
+            histogram = _values[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        # counts are stored per bucket and accumulated on export
+        histogram[0][bisect.bisect_left(buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def _get_snapshot():
+    with _lock:
+        _check_process()
+        return [
+            [
+                name,
+                labels,
+                (
+                    value
+                    if isinstance(value, (int, float))
+                    else [list(value[0]), value[1], value[2]]
+                ),
+            ]
+            for (name, labels), value in _values.items()
+        ]
+
+
+def flush():
+    """Write totals of the process to RECIPE_METRICS_DIR if it is set"""
+    global _flushed_at
+    directory = settings.RECIPE_METRICS_DIR
+    if not directory:
+        return
+
+    snapshot = _get_snapshot()
+    _flushed_at = time.monotonic()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, _file_name)
+    # readers never see a partly written file
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(snapshot, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def maybe_flush():
+    if time.monotonic() - _flushed_at >= settings.RECIPE_METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def _merge(totals, snapshot):
+    for name, labels, value in snapshot:
+        key = (name, tuple(map(tuple, labels)))
+        if isinstance(value, list):
+            total = totals.setdefault(key, [[0] * len(value[0]), 0.0, 0])
+            total[0] = [a + b for a, b in zip(total[0], value[0])]
+            total[1] += value[1]
+            total[2] += value[2]
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def collect():
+    """Return totals of all processes, or of this one without RECIPE_METRICS_DIR"""
+    directory = settings.RECIPE_METRICS_DIR
+    if not directory:
+        totals = {}
+        _merge(totals, _get_snapshot())
+        return totals
+
+    flush()
+    totals = {}
+    for file_name in os.listdir(directory):
+        if not file_name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, file_name), encoding="utf-8") as file:
+                _merge(totals, json.load(file))
+        except (OSError, ValueError):
+            # the file is removed with the directory
+            continue
+    return totals
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(totals):
+    """Return totals in the Prometheus text exposition format"""
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        series = sorted(
+            (labels, value) for (key, labels), value in totals.items() if key == name
+        )
+        if not series:
+            continue
+
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in series:
+            if metric_type == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+                continue
+
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip([*buckets, "+Inf"], counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels([*labels, ("le", str(bound))])
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
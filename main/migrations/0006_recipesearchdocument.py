@@ -0,0 +1,161 @@
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+# Ukrainian words are stemmed with hunspell dictionary if it is installed
+# on the database server (files uk_ua.dict and uk_ua.affix in tsearch_data,
+# installed by db/Dockerfile), latin words are stemmed as English ones,
+# everything else is kept as is. Without the dictionary Ukrainian words are
+# only lowercased, which the main.W002 system check reports
+CREATE_SEARCH_CONFIG_SQL = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'recipes_uk') THEN
+        CREATE TEXT SEARCH CONFIGURATION recipes_uk (COPY = simple);
+        ALTER TEXT SEARCH CONFIGURATION recipes_uk
+            ALTER MAPPING FOR asciiword, asciihword, hword_asciipart
+            WITH english_stem;
+        BEGIN
+            CREATE TEXT SEARCH DICTIONARY recipes_uk_hunspell (
+                TEMPLATE = ispell, DictFile = uk_ua, AffFile = uk_ua
+            );
+            ALTER TEXT SEARCH CONFIGURATION recipes_uk
+                ALTER MAPPING FOR word, hword, hword_part
+                WITH recipes_uk_hunspell, simple;
+        EXCEPTION WHEN OTHERS THEN
+            RAISE WARNING 'Ukrainian hunspell dictionary is not available';
+        END;
+    END IF;
+END $$;
+"""
+
+
+FIELD_WEIGHTS = {
+    "name": "A",
+    "tags": "B",
+    "category": "B",
+    "ingredients": "C",
+    "description": "D",
+}
+
+BATCH_SIZE = 1000
+
+
+def create_search_config_and_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute(CREATE_SEARCH_CONFIG_SQL)
+    for field in FIELD_WEIGHTS:
+        schema_editor.execute(
+            f"CREATE INDEX main_recipesearchdocument_{field}_vector_gin "
+            f"ON main_recipesearchdocument USING gin ({field}_vector)"
+        )
+
+
+def drop_search_config_and_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    for field in FIELD_WEIGHTS:
+        schema_editor.execute(
+            f"DROP INDEX IF EXISTS main_recipesearchdocument_{field}_vector_gin"
+        )
+    schema_editor.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS recipes_uk")
+    schema_editor.execute("DROP TEXT SEARCH DICTIONARY IF EXISTS recipes_uk_hunspell")
+
+
+def build_search_documents(apps, schema_editor):
+    Recipe = apps.get_model("main", "Recipe")
+    RecipeSearchDocument = apps.get_model("main", "RecipeSearchDocument")
+    recipes = Recipe.objects.order_by("pk").prefetch_related(
+        "recipeingredient_set", "recipetag_set"
+    )
+
+    last_id = 0
+    while True:
+        batch = list(recipes.filter(pk__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+
+        RecipeSearchDocument.objects.bulk_create(
+            [
+                RecipeSearchDocument(
+                    recipe=recipe,
+                    name=recipe.name,
+                    description=recipe.description,
+                    category=recipe.category,
+                    ingredients="\n".join(
+                        i.name for i in recipe.recipeingredient_set.all()
+                    ),
+                    tags="\n".join(t.tag_text for t in recipe.recipetag_set.all()),
+                )
+                for recipe in batch
+            ]
+        )
+        last_id = batch[-1].pk
+
+    if schema_editor.connection.vendor == "postgresql":
+        RecipeSearchDocument.objects.update(
+            **{
+                f"{field}_vector": SearchVector(
+                    field, config="recipes_uk", weight=weight
+                )
+                for field, weight in FIELD_WEIGHTS.items()
+            }
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0005_alter_recipestep_options_alter_recipe_image_1_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeSearchDocument",
+            fields=[
+                (
+                    "recipe",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="main.recipe",
+                    ),
+                ),
+                ("name", models.TextField(default="")),
+                ("description", models.TextField(default="")),
+                ("category", models.TextField(default="")),
+                ("ingredients", models.TextField(default="")),
+                ("tags", models.TextField(default="")),
+                (
+                    "name_vector",
+                    django.contrib.postgres.search.SearchVectorField(null=True),
+                ),
+                (
+                    "description_vector",
+                    django.contrib.postgres.search.SearchVectorField(null=True),
+                ),
+                (
+                    "category_vector",
+                    django.contrib.postgres.search.SearchVectorField(null=True),
+                ),
+                (
+                    "ingredients_vector",
+                    django.contrib.postgres.search.SearchVectorField(null=True),
+                ),
+                (
+                    "tags_vector",
+                    django.contrib.postgres.search.SearchVectorField(null=True),
+                ),
+            ],
+        ),
+        migrations.RunPython(
+            create_search_config_and_indexes, drop_search_config_and_indexes
+        ),
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_recipesearchdocument"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # new indexes are created before the ones they replace are dropped
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["user", "name", "id"], name="recipe_user_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["user", "cooking_time", "id"], name="recipe_user_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["user", "category", "id"], name="recipe_user_category_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["user", "created_at", "id"], name="recipe_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["user", "updated_at", "id"], name="recipe_user_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipeingredient",
+            index=models.Index(fields=["recipe", "id"], name="ingredient_recipe_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="recipetag",
+            index=models.Index(fields=["recipe", "id"], name="tag_recipe_idx"),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipeingredient",
+            name="recipe",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="main.recipe",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipestep",
+            name="recipe",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="main.recipe",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipetag",
+            name="recipe",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="main.recipe",
+            ),
+        ),
+    ]
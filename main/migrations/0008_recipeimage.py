@@ -0,0 +1,117 @@
+import django.db.models.deletion
+import main.models
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+IMAGE_FIELDS = ["image_1", "image_2", "image_3"]
+
+
+def move_images(apps, schema_editor):
+    Recipe = apps.get_model("main", "Recipe")
+    RecipeImage = apps.get_model("main", "RecipeImage")
+    recipes = (
+        Recipe.objects.exclude(image_1="", image_2="", image_3="")
+        .order_by("pk")
+        .values_list("pk", "user_id", *IMAGE_FIELDS)
+    )
+
+    last_id = 0
+    while True:
+        batch = list(recipes.filter(pk__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+
+        RecipeImage.objects.bulk_create(
+            [
+                RecipeImage(recipe_id=recipe_id, user_id=user_id, image=image)
+                for recipe_id, user_id, *images in batch
+                for image in images
+                if image
+            ]
+        )
+        last_id = batch[-1][0]
+
+
+def restore_images(apps, schema_editor):
+    # only the first three images of a recipe fit into the old columns
+    Recipe = apps.get_model("main", "Recipe")
+    RecipeImage = apps.get_model("main", "RecipeImage")
+    images = RecipeImage.objects.order_by("recipe_id", "pk").values_list(
+        "recipe_id", "image"
+    )
+
+    last_id = 0
+    while True:
+        batch = list(images.filter(recipe_id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        # the last recipe of the batch may have more images in the next one
+        if len(batch) == BATCH_SIZE and batch[0][0] != batch[-1][0]:
+            batch = [row for row in batch if row[0] != batch[-1][0]]
+
+        by_recipe = {}
+        for recipe_id, image in batch:
+            by_recipe.setdefault(recipe_id, []).append(image)
+
+        recipes = Recipe.objects.filter(pk__in=by_recipe).only("pk")
+        for recipe in recipes:
+            for field, image in zip(IMAGE_FIELDS, by_recipe[recipe.pk]):
+                setattr(recipe, field, image)
+        Recipe.objects.bulk_update(recipes, IMAGE_FIELDS)
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0007_recipe_list_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeImage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "image",
+                    models.ImageField(
+                        max_length=255,
+                        unique=True,
+                        upload_to=main.models.get_recipe_image_path,
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="main.recipe",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(fields=["recipe", "id"], name="image_recipe_idx")
+                ],
+            },
+        ),
+        migrations.RunPython(move_images, restore_images),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0008_recipeimage"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="recipe",
+            name="image_1",
+        ),
+        migrations.RemoveField(
+            model_name="recipe",
+            name="image_2",
+        ),
+        migrations.RemoveField(
+            model_name="recipe",
+            name="image_3",
+        ),
+    ]
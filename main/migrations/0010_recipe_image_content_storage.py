@@ -0,0 +1,163 @@
+import hashlib
+import os
+import shutil
+from io import BytesIO
+
+# the storage is referenced by the field only, as Django requires
+import main.storage
+from django.conf import settings
+from django.db import migrations, models
+from PIL import ExifTags, Image, ImageOps
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+# variants at the time of the migration
+VARIANT_NAMES = [
+    f"variants/{width}/{{name}}.{extension}"
+    for width in [320, 640, 1280]
+    for extension in ["webp", "jpg"]
+]
+# keys of Image.info with metadata at the time of the migration
+METADATA_KEYS = ["exif", "xmp", "XML:com.adobe.xmp", "comment"]
+
+
+def strip_metadata(file):
+    """
+    Return the content of the image without metadata, as uploads were
+    stored at the time of the migration, or None if it has no metadata.
+    This is a copy, so later changes of uploads do not change the migration.
+    """
+    try:
+        image = Image.open(file)
+        has_metadata = any(key in image.info for key in METADATA_KEYS) or bool(
+            getattr(image, "text", None)
+        )
+        if not has_metadata or (
+            getattr(image, "n_frames", 1) > 1 and image.format != "MPO"
+        ):
+            return None
+
+        params = {}
+        if image.info.get("icc_profile"):
+            params["icc_profile"] = image.info["icc_profile"]
+        orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+        buffer = BytesIO()
+        if image.format == "JPEG" and orientation == 1:
+            image.save(buffer, "JPEG", quality="keep", subsampling="keep", **params)
+        elif image.format in ("JPEG", "MPO"):
+            ImageOps.exif_transpose(image).save(buffer, "JPEG", quality=95, **params)
+        else:
+            ImageOps.exif_transpose(image).save(buffer, image.format, **params)
+    except (OSError, ValueError):
+        return None
+    return buffer.getvalue()
+
+
+def get_content_name(digest, name):
+    extension = os.path.splitext(name)[1].lower()
+    return f"recipes/{digest[:2]}/{digest}{extension}"
+
+
+def link(source, target):
+    if os.path.exists(target) or not os.path.exists(source):
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def store_by_content(root, name):
+    """
+    Store the image under the name of its content without metadata, as
+    uploads are stored, and return the name. The original is linked to the
+    name when it has no metadata, otherwise the stripped copy is written.
+    """
+    path = os.path.join(root, name)
+    with open(path, "rb") as file:
+        content = strip_metadata(file)
+
+    digest = hashlib.sha256()
+    if content is None:
+        with open(path, "rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                digest.update(chunk)
+    else:
+        digest.update(content)
+    new_name = get_content_name(digest.hexdigest(), name)
+    new_path = os.path.join(root, new_name)
+
+    if content is None:
+        link(path, new_path)
+    elif not os.path.exists(new_path):
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        with open(f"{new_path}.migration", "wb") as new_file:
+            new_file.write(content)
+        os.replace(f"{new_path}.migration", new_path)
+    return new_name
+
+
+def rename_images(apps, schema_editor):
+    """
+    Give the stored images names of their content without metadata, so
+    they are shared with equal uploads. The files are linked or copied
+    to the new names, the old ones are left to the gc_media command.
+    """
+    RecipeImage = apps.get_model("main", "RecipeImage")
+    root = str(settings.MEDIA_ROOT)
+    images = RecipeImage.objects.exclude(image="").order_by("pk").only("image")
+
+    last_id = 0
+    while True:
+        batch = list(images.filter(pk__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+
+        changed = []
+        for recipe_image in batch:
+            name = recipe_image.image.name
+            path = os.path.join(root, name)
+            if not os.path.isfile(path):
+                continue
+
+            new_name = store_by_content(root, name)
+            if new_name == name:
+                continue
+
+            for variant_name in VARIANT_NAMES:
+                link(
+                    os.path.join(root, variant_name.format(name=name)),
+                    os.path.join(root, variant_name.format(name=new_name)),
+                )
+            recipe_image.image = new_name
+            changed.append(recipe_image)
+
+        RecipeImage.objects.bulk_update(changed, ["image"])
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0009_remove_recipe_image_columns"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipeimage",
+            name="image",
+            field=models.ImageField(
+                max_length=255,
+                storage=main.storage.get_recipe_image_storage,
+                upload_to="recipes/",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipeimage",
+            index=models.Index(fields=["image", "user"], name="image_path_user_idx"),
+        ),
+        # names given by content are valid for the old field as well
+        migrations.RunPython(rename_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0011_generationjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GenerationCacheEntry",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("result", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("used_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("hits", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0012_generationcacheentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="generationjob",
+            name="variants",
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
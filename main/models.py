@@ -1,32 +1,69 @@
+import logging
 import os
+import threading
+import time
 import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.core.files.storage import default_storage
+from django.db import connection, models, transaction
 from django.dispatch import receiver
 
+from .caching import invalidate_user_cache
+from .cleanup import delete_files
+from .images import create_variants, get_variant_names, has_variants
+from .storage import get_recipe_image_storage, recipe_image_storage
 
+logger = logging.getLogger(__name__)
+
+# text search configuration created by migration 0006 on PostgreSQL
+SEARCH_CONFIG = "recipes_uk"
+
+
+# used by migrations from the time images were stored under unique names
 def get_recipe_image_path(instance, filename):
     return f"recipes/{str(uuid.uuid4())}_{filename}"
 
 
 # Create your models here.
 class Recipe(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # user lookups are covered by the composite indexes below
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     name = models.CharField(max_length=128)
     description = models.TextField()
     # in minutes
     cooking_time = models.PositiveIntegerField()
     category = models.CharField(max_length=128)
-    image_1 = models.ImageField(upload_to=get_recipe_image_path, blank=True, default="")
-    image_2 = models.ImageField(upload_to=get_recipe_image_path, blank=True, default="")
-    image_3 = models.ImageField(upload_to=get_recipe_image_path, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # one index per ordering of the recipe list, id breaks ties
+        indexes = [
+            models.Index(fields=["user", "name", "id"], name="recipe_user_name_idx"),
+            models.Index(
+                fields=["user", "cooking_time", "id"], name="recipe_user_time_idx"
+            ),
+            models.Index(
+                fields=["user", "category", "id"], name="recipe_user_category_idx"
+            ),
+            models.Index(
+                fields=["user", "created_at", "id"], name="recipe_user_created_idx"
+            ),
+            models.Index(
+                fields=["user", "updated_at", "id"], name="recipe_user_updated_idx"
+            ),
+        ]
+
 
 class RecipeStep(models.Model):
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    # recipe lookups are covered by the unique index
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
     step_number = models.PositiveIntegerField()
     step_description = models.CharField(max_length=512)
 
@@ -36,69 +73,366 @@ class RecipeStep(models.Model):
 
 
 class RecipeTag(models.Model):
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    # recipe lookups are covered by the indexes below
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
     tag_text = models.CharField(max_length=80)
 
     class Meta:
         unique_together = ["recipe", "tag_text"]
+        # formsets list tags in the order of creation
+        indexes = [
+            models.Index(fields=["recipe", "id"], name="tag_recipe_idx"),
+        ]
 
 
 class RecipeIngredient(models.Model):
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    # recipe lookups are covered by the index below
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
     name = models.CharField(max_length=128)
     volume = models.FloatField()
     volume_measure = models.CharField(max_length=12)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["recipe", "id"], name="ingredient_recipe_idx"),
+        ]
 
-@receiver(models.signals.post_delete, sender=Recipe)
-def auto_delete_file_on_delete(sender, instance, **kwargs):
+
+class RecipeImage(models.Model):
+    # recipe lookups are covered by the index below
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, db_index=False)
+    # owner of the recipe, so access to an image is checked without a join
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # images with equal content share one file, which is stored by its hash
+    image = models.ImageField(
+        upload_to="recipes/", storage=get_recipe_image_storage, max_length=255
+    )
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["recipe", "id"], name="image_recipe_idx"),
+            # access to an image file is checked by its path and the user,
+            # the number of rows with a path is the number of its references
+            models.Index(fields=["image", "user"], name="image_path_user_idx"),
+        ]
+
+
+class GenerationJob(models.Model):
+    """
+    Request to generate a recipe, processed by the run_generation_worker
+    command, so views do not wait for the model.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Очікує"
+        RUNNING = "running", "Генерується"
+        DONE = "done", "Готово"
+        FAILED = "failed", "Помилка"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    ingredients_description = models.TextField()
+    recipe_description = models.TextField()
+    # number of recipes generated at once for the prompt
+    variants = models.PositiveSmallIntegerField(default=1)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING
+    )
+    # recipe in the schema of main.ai.generation_config, or the list of
+    # recipes generated so far if the job has several variants
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # workers take pending jobs in the order of creation
+            models.Index(fields=["status", "id"], name="generation_job_status_idx"),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in [self.Status.DONE, self.Status.FAILED]
+
+
+class GenerationCacheEntry(models.Model):
     """
-    Deletes images from filesystem
-    when corresponding Recipe object is deleted.
+    Recipe generated for a prompt, reused when the same prompt is
+    submitted again to the same model.
     """
-    if instance.image_1:
-        if os.path.isfile(instance.image_1.path):
-            os.remove(instance.image_1.path)
 
-    if instance.image_2:
-        if os.path.isfile(instance.image_2.path):
-            os.remove(instance.image_2.path)
+    # hash of the normalized prompt, the model name and its configuration
+    key = models.CharField(max_length=64, primary_key=True)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # entries used least recently are evicted first
+    used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Number of processed recipes of a file imported by the import_recipes
+    command, updated in the transaction of every batch, so a resumed import
+    neither repeats nor skips recipes.
+    """
 
-    if instance.image_3:
-        if os.path.isfile(instance.image_3.path):
-            os.remove(instance.image_3.path)
+    name = models.CharField(max_length=255, primary_key=True)
+    # absolute path of the imported file
+    input = models.TextField()
+    processed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
-@receiver(models.signals.pre_save, sender=Recipe)
-def auto_delete_file_on_change(sender, instance, **kwargs):
+class RecipeSearchDocument(models.Model):
     """
-    Deletes old images from filesystem
-    when corresponding Recipe object is updated
-    with new images.
+    Denormalized search document of a recipe.
+
+    Text fields are plain copies of the searchable recipe data and are
+    used as is on databases without full-text search support. On PostgreSQL
+    every text field also has a weighted, GIN-indexed tsvector counterpart.
     """
-    if not instance.pk:
-        return False
 
+    # weights of the search document fields, used in ranking
+    FIELD_WEIGHTS = {
+        "name": "A",
+        "tags": "B",
+        "category": "B",
+        "ingredients": "C",
+        "description": "D",
+    }
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search_document",
+    )
+    name = models.TextField(default="")
+    description = models.TextField(default="")
+    category = models.TextField(default="")
+    ingredients = models.TextField(default="")
+    tags = models.TextField(default="")
+    name_vector = SearchVectorField(null=True)
+    description_vector = SearchVectorField(null=True)
+    category_vector = SearchVectorField(null=True)
+    ingredients_vector = SearchVectorField(null=True)
+    tags_vector = SearchVectorField(null=True)
+
+    @classmethod
+    def refresh(cls, recipe_ids):
+        """Rebuild search documents of the recipes with given ids"""
+        documents = {
+            recipe.pop("id"): recipe
+            for recipe in Recipe.objects.filter(pk__in=recipe_ids).values(
+                "id", "name", "description", "category"
+            )
+        }
+        if not documents:
+            return
+
+        ingredients = defaultdict(list)
+        for recipe_id, name in (
+            RecipeIngredient.objects.filter(recipe_id__in=documents)
+            .order_by("pk")
+            .values_list("recipe_id", "name")
+        ):
+            ingredients[recipe_id].append(name)
+
+        tags = defaultdict(list)
+        for recipe_id, tag_text in (
+            RecipeTag.objects.filter(recipe_id__in=documents)
+            .order_by("pk")
+            .values_list("recipe_id", "tag_text")
+        ):
+            tags[recipe_id].append(tag_text)
+
+        cls.objects.bulk_create(
+            [
+                cls(
+                    recipe_id=recipe_id,
+                    ingredients="\n".join(ingredients[recipe_id]),
+                    tags="\n".join(tags[recipe_id]),
+                    **recipe,
+                )
+                for recipe_id, recipe in documents.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["recipe"],
+            update_fields=list(cls.FIELD_WEIGHTS),
+        )
+
+        if connection.vendor == "postgresql":
+            cls.objects.filter(recipe_id__in=documents).update(
+                **{
+                    f"{field}_vector": SearchVector(
+                        field, config=SEARCH_CONFIG, weight=weight
+                    )
+                    for field, weight in cls.FIELD_WEIGHTS.items()
+                }
+            )
+
+
+_deferred_updates = threading.local()
+
+
+@contextmanager
+def deferred_recipe_updates():
+    """
+    Collect search document updates and cache invalidations requested
+    inside the block and run them in one batch when it exits without errors.
+    """
+    if getattr(_deferred_updates, "search", None) is not None:
+        # updates are already deferred by an outer block
+        yield
+        return
+
+    _deferred_updates.search = set()
+    _deferred_updates.cache = set()
     try:
-        old_obj = sender.objects.get(pk=instance.pk)
-        old_image_1 = old_obj.image_1
-        old_image_2 = old_obj.image_2
-        old_image_3 = old_obj.image_3
-
-        new_image_1 = instance.image_1
-        new_image_2 = instance.image_2
-        new_image_3 = instance.image_3
-
-        if not old_image_1 == new_image_1:
-            if old_image_1 and os.path.isfile(old_image_1.path):
-                os.remove(old_image_1.path)
-
-        if not old_image_2 == new_image_2:
-            if old_image_2 and os.path.isfile(old_image_2.path):
-                os.remove(old_image_2.path)
-
-        if not old_image_3 == new_image_3:
-            if old_image_3 and os.path.isfile(old_image_3.path):
-                os.remove(old_image_3.path)
-    except sender.DoesNotExist:
-        return False
+        yield
+        search_recipe_ids = _deferred_updates.search
+        cache_recipe_ids = _deferred_updates.cache
+    finally:
+        _deferred_updates.search = None
+        _deferred_updates.cache = None
+
+    if search_recipe_ids:
+        RecipeSearchDocument.refresh(search_recipe_ids)
+    if cache_recipe_ids:
+        for user_id in set(
+            Recipe.objects.filter(pk__in=cache_recipe_ids).values_list(
+                "user_id", flat=True
+            )
+        ):
+            invalidate_user_cache(user_id)
+
+
+def update_search_document(recipe_id):
+    recipe_ids = getattr(_deferred_updates, "search", None)
+    if recipe_ids is None:
+        RecipeSearchDocument.refresh([recipe_id])
+    else:
+        recipe_ids.add(recipe_id)
+
+
+def invalidate_recipe_cache(instance):
+    """Invalidate cached pages of the owner of the recipe or the recipe child"""
+    if isinstance(instance, (Recipe, RecipeImage)):
+        invalidate_user_cache(instance.user_id)
+    elif type(instance).recipe.is_cached(instance):
+        invalidate_user_cache(instance.recipe.user_id)
+    elif getattr(_deferred_updates, "cache", None) is not None:
+        _deferred_updates.cache.add(instance.recipe_id)
+    else:
+        user_id = (
+            Recipe.objects.filter(pk=instance.recipe_id)
+            .values_list("user_id", flat=True)
+            .first()
+        )
+        if user_id is not None:
+            invalidate_user_cache(user_id)
+
+
+@receiver(models.signals.post_save, sender=Recipe)
+def update_search_document_on_recipe_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_search_document(instance.pk)
+
+
+@receiver(models.signals.post_save, sender=RecipeIngredient)
+@receiver(models.signals.post_save, sender=RecipeTag)
+def update_search_document_on_child_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_search_document(instance.recipe_id)
+
+
+@receiver(models.signals.post_delete, sender=RecipeIngredient)
+@receiver(models.signals.post_delete, sender=RecipeTag)
+def update_search_document_on_child_delete(sender, instance, origin=None, **kwargs):
+    # when a recipe (or its owner) is deleted, its document is deleted too
+    origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    if origin_model is sender:
+        update_search_document(instance.recipe_id)
+
+
+@receiver(models.signals.post_save, sender=Recipe)
+@receiver(models.signals.post_save, sender=RecipeStep)
+@receiver(models.signals.post_save, sender=RecipeIngredient)
+@receiver(models.signals.post_save, sender=RecipeTag)
+@receiver(models.signals.post_save, sender=RecipeImage)
+def invalidate_cache_on_save(sender, instance, **kwargs):
+    invalidate_recipe_cache(instance)
+
+
+@receiver(models.signals.post_delete, sender=Recipe)
+@receiver(models.signals.post_delete, sender=RecipeStep)
+@receiver(models.signals.post_delete, sender=RecipeIngredient)
+@receiver(models.signals.post_delete, sender=RecipeTag)
+@receiver(models.signals.post_delete, sender=RecipeImage)
+def invalidate_cache_on_delete(sender, instance, origin=None, **kwargs):
+    # children deleted together with their recipe are covered by its signal
+    origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    if sender is Recipe or origin_model is sender:
+        invalidate_recipe_cache(instance)
+
+
+def is_image_file_old(name):
+    # a file may be uploaded again by a transaction that is not committed
+    # yet, such uploads refresh its modification time
+    try:
+        modified = os.path.getmtime(recipe_image_storage.path(name))
+    except FileNotFoundError:
+        return True
+    return modified <= time.time() - settings.RECIPE_MEDIA_DEDUP_GRACE
+
+
+def delete_unreferenced_image(name, using):
+    # the index on the image path makes the count of references cheap
+    if RecipeImage.objects.using(using).filter(image=name).exists():
+        return
+
+    delete_files(
+        default_storage,
+        [name, *get_variant_names(name)],
+        check=partial(is_image_file_old, name),
+    )
+
+
+@receiver(models.signals.post_delete, sender=RecipeImage)
+def auto_delete_file_on_delete(sender, instance, using, **kwargs):
+    """
+    Deletes image and its variants from filesystem
+    when the last RecipeImage object with the image is deleted
+    and the transaction commits.
+    """
+    if instance.image:
+        transaction.on_commit(
+            partial(delete_unreferenced_image, instance.image.name, using),
+            using=using,
+        )
+
+
+def create_image_variants(recipe_image):
+    # images with equal content share their variants
+    if has_variants(recipe_image.image):
+        return
+
+    try:
+        create_variants(recipe_image.image)
+    except OSError:
+        # the original is still served when there are no variants
+        logger.warning("Could not create variants of %s", recipe_image.image.name)
+
+
+@receiver(models.signals.post_save, sender=RecipeImage)
+def create_image_variants_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Creates resized variants of a new image if its file has none yet.
+    Images are never changed, they are replaced by new ones.
+    """
+    if created and not raw:
+        create_image_variants(instance)
@@ -0,0 +1,170 @@
+import datetime
+from functools import reduce
+from operator import or_
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class KeysetPage:
+    """Page of keyset paginator, mimics the interface of Django's Page"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.encode_cursor(self.object_list[-1], reverse=False)
+        return ""
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.encode_cursor(self.object_list[0], reverse=True)
+        return ""
+
+    @property
+    def last_cursor(self):
+        return self.paginator.last_cursor
+
+
+class KeysetPaginator:
+    """
+    Paginator that seeks pages by the values of ordering fields of the last
+    seen row instead of using OFFSET, so every page costs the same.
+
+    The queryset must be ordered by plain fields or annotations, the last of
+    which must be unique (for example ``id``) to break ties.
+    """
+
+    salt = "main.pagination"
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [
+            (name.lstrip("-"), name.startswith("-")) for name in queryset.query.order_by
+        ]
+
+    @property
+    def last_cursor(self):
+        """Cursor of the last page, that is the first page in reverse order"""
+        return signing.dumps(
+            {"o": self.queryset.query.order_by, "k": None, "r": True}, salt=self.salt
+        )
+
+    def encode_cursor(self, obj, reverse):
+        key = [getattr(obj, field) for field, _ in self.ordering]
+        key = [
+            (
+                value.isoformat()
+                if isinstance(value, (datetime.date, datetime.time))
+                else value
+            )
+            for value in key
+        ]
+        return signing.dumps(
+            {"o": self.queryset.query.order_by, "k": key, "r": reverse},
+            salt=self.salt,
+        )
+
+    def decode_cursor(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            raise InvalidCursor("Некоректний курсор сторінки")
+
+        if data["o"] != list(self.queryset.query.order_by):
+            raise InvalidCursor("Курсор сторінки створено для іншого сортування")
+
+        key = data["k"]
+        if key is not None:
+            key = [
+                self._to_python(field, value)
+                for (field, _), value in zip(self.ordering, key)
+            ]
+        return key, data["r"]
+
+    def _to_python(self, field, value):
+        try:
+            return self.queryset.model._meta.get_field(field).to_python(value)
+        except FieldDoesNotExist:
+            # annotations are stored as is
+            return value
+
+    def _seek(self, queryset, key, reverse):
+        """Filter rows that go after the key in ordering of the queryset"""
+        conditions = []
+        for i, (field, descending) in enumerate(self.ordering):
+            lookup = "lt" if descending != reverse else "gt"
+            equal = {f: v for (f, _), v in zip(self.ordering[:i], key)}
+            conditions.append(Q(**equal, **{f"{field}__{lookup}": key[i]}))
+
+        # redundant condition on the first field lets the database seek an index
+        first_field, descending = self.ordering[0]
+        lookup = "lte" if descending != reverse else "gte"
+        return queryset.filter(
+            Q(**{f"{first_field}__{lookup}": key[0]}), reduce(or_, conditions)
+        )
+
+    def get_page(self, cursor=None):
+        key, reverse = None, False
+        if cursor:
+            key, reverse = self.decode_cursor(cursor)
+
+        queryset = self.queryset.reverse() if reverse else self.queryset
+        if key is not None:
+            queryset = self._seek(queryset, key, reverse)
+
+        object_list = list(queryset[: self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[: self.per_page]
+
+        if reverse:
+            object_list.reverse()
+            return KeysetPage(
+                object_list, self, has_next=key is not None, has_previous=has_more
+            )
+        return KeysetPage(
+            object_list, self, has_next=has_more, has_previous=key is not None
+        )
+
+
+class KeysetPaginationMixin:
+    """ListView mixin that replaces page numbers with keyset pagination cursors"""
+
+    cursor_kwarg = "cursor"
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
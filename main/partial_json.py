@@ -0,0 +1,92 @@
+"""Parsing of JSON objects while they are being received"""
+
+import json
+
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class PartialJSONParser:
+    """
+    Incremental parser of a JSON object that is received in chunks.
+
+    Every chunk is scanned once. The parser remembers the last place where
+    a member of the object or an item of an array member was complete, and
+    a chunk that moves this place returns the object received so far, with
+    the open containers closed. Members and items are only returned whole,
+    so strings and numbers are never cut.
+    """
+
+    def __init__(self, max_depth=2):
+        # containers nested deeper are returned only when they are complete
+        self.max_depth = max_depth
+        self.text = []
+        self.length = 0
+        self.stack = []
+        # for every open object whether its next string is a key
+        self.expects_key = []
+        self.in_string = False
+        self.escaped = False
+        self.string_is_key = False
+        self.cut = 0
+        self.cut_closers = ""
+        self.received = None
+
+    def _mark_cut(self, position):
+        if len(self.stack) <= self.max_depth:
+            self.cut = position
+            self.cut_closers = "".join(CLOSERS[c] for c in reversed(self.stack))
+
+    def _scan(self, chunk, offset):
+        for index, char in enumerate(chunk, offset):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if not self.string_is_key:
+                        self._mark_cut(index + 1)
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_is_key = bool(self.stack) and self.stack[-1] == "{"
+                if self.string_is_key:
+                    self.string_is_key = self.expects_key[-1]
+                    self.expects_key[-1] = False
+            elif char in "{[":
+                self.stack.append(char)
+                if char == "{":
+                    self.expects_key.append(True)
+            elif char in "}]":
+                if self.stack.pop() == "{":
+                    self.expects_key.pop()
+                self._mark_cut(index + 1)
+            elif char == ",":
+                # values without quotes end at the comma
+                self._mark_cut(index)
+                if self.stack and self.stack[-1] == "{":
+                    self.expects_key[-1] = True
+
+    def feed(self, chunk):
+        """
+        Add the next chunk of the text and return the object received so far
+        if it has more members or items than before, otherwise None.
+        """
+        cut = self.cut
+        self._scan(chunk, self.length)
+        self.text.append(chunk)
+        self.length += len(chunk)
+        if self.cut == cut:
+            return None
+
+        text = "".join(self.text)
+        # the chunks are joined once per update only
+        self.text = [text]
+        received = json.loads(text[: self.cut] + self.cut_closers)
+        # a comma after a complete value moves the place but adds nothing
+        if received == self.received:
+            return None
+        self.received = received
+        return received
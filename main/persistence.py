@@ -0,0 +1,114 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import (
+    RecipeImage,
+    RecipeIngredient,
+    RecipeStep,
+    RecipeTag,
+    create_image_variants,
+    deferred_recipe_updates,
+    update_search_document,
+)
+from .steps import STEP_NUMBER_GAP, get_next_step_number
+
+# fields of recipe children that can be changed by the user
+CHILD_FIELDS = {
+    RecipeStep: ["step_description"],
+    RecipeTag: ["tag_text"],
+    RecipeIngredient: ["name", "volume", "volume_measure"],
+}
+
+
+def get_formset_changes(*formsets):
+    """
+    Return lists of new, changed and deleted objects from valid formsets.
+    Objects of unchanged forms are not included.
+    """
+    created, updated, deleted = [], [], []
+    for formset in formsets:
+        for form in formset:
+            if not form.has_changed():
+                continue
+
+            obj = form.instance
+            if form.cleaned_data.get("DELETE"):
+                if obj.pk is not None:
+                    deleted.append(obj)
+            elif obj.pk is None:
+                created.append(obj)
+            else:
+                updated.append(obj)
+
+    return created, updated, deleted
+
+
+def save_recipe(recipe, created=(), updated=(), deleted=()):
+    """
+    Save recipe together with its new, changed and deleted children.
+
+    Children are written with one bulk delete, one bulk update and one bulk
+    create per child table, and the search document is rebuilt once.
+    Deletions go first, so new children may reuse tags and step numbers
+    of the deleted ones. New steps without numbers are appended to the end.
+    New images get the owner of the recipe and their resized variants.
+    """
+    by_model = defaultdict(lambda: {"created": [], "updated": [], "deleted": []})
+    for kind, objs in [
+        ("created", created),
+        ("updated", updated),
+        ("deleted", deleted),
+    ]:
+        for obj in objs:
+            by_model[type(obj)][kind].append(obj)
+
+    with transaction.atomic(), deferred_recipe_updates():
+        is_new = recipe.pk is None
+        # saving the recipe locks its row, so concurrent saves of the recipe
+        # see steps appended by each other
+        recipe.save()
+
+        new_steps = [
+            step for step in by_model[RecipeStep]["created"] if step.step_number is None
+        ]
+        if new_steps:
+            start = 0 if is_new else get_next_step_number(recipe)
+            for i, step in enumerate(new_steps):
+                step.step_number = start + i * STEP_NUMBER_GAP
+
+        for model, changes in by_model.items():
+            if changes["deleted"]:
+                model.objects.filter(
+                    recipe=recipe, pk__in=[obj.pk for obj in changes["deleted"]]
+                ).delete()
+
+        for model, changes in by_model.items():
+            if changes["updated"]:
+                model.objects.bulk_update(changes["updated"], CHILD_FIELDS[model])
+
+            for obj in changes["created"]:
+                obj.recipe = recipe
+                if model is RecipeImage:
+                    obj.user_id = recipe.user_id
+            if changes["created"]:
+                # files of new images are saved to the storage here
+                model.objects.bulk_create(changes["created"])
+
+        for image in by_model[RecipeImage]["created"]:
+            create_image_variants(image)
+
+        # bulk operations do not send signals
+        update_search_document(recipe.pk)
+
+    return recipe
+
+
+def save_recipes(recipes):
+    """
+    Save new recipes given as (recipe, children) pairs in one transaction,
+    rebuilding their search documents in one batch.
+    """
+    with transaction.atomic(), deferred_recipe_updates():
+        for recipe, created in recipes:
+            save_recipe(recipe, created=created)
@@ -0,0 +1,272 @@
+"""
+Profiling of single requests of staff users on demand.
+
+A request is profiled when a staff user sends it with the X-Profile
+header or the _profile query parameter. The profile of cProfile and the
+SQL of the request, with plans of the slowest SELECT statements, are
+saved to RECIPE_PROFILE_DIR, which keeps the last RECIPE_PROFILE_LIMIT
+captures. Content of streaming responses is profiled while it is sent.
+
+Since Python 3.12 cProfile is built on sys.monitoring, which allows one
+profiler in the interpreter and records calls of all threads, so requests
+are profiled one at a time and a profile may include calls of requests
+served at the same time.
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+# functions listed in the summary of a profile
+SUMMARY_FUNCTIONS = 40
+
+# held from the start of a profiled request until its content is sent
+_lock = threading.Lock()
+
+
+def is_profiling_requested(request):
+    # the user is only loaded for requests that ask for profiling
+    return bool(
+        (request.headers.get("X-Profile") or "_profile" in request.GET)
+        and request.user.is_active
+        and request.user.is_staff
+    )
+
+
+class QueryLog:
+    """Database execute wrapper that keeps the executed statements"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "sql": sql,
+                    "params": params,
+                    "many": many,
+                    "duration": time.perf_counter() - start,
+                }
+            )
+
+
+# set while the plan of a statement is captured, so hooks skip its queries
+explaining = contextvars.ContextVar("explaining", default=False)
+
+
+def explain(sql, params):
+    """Return plan of the statement, without running it, or the error"""
+    token = explaining.set(True)
+    try:
+        # a failed statement must not break the transaction of the request
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            return "\n".join(" ".join(map(str, row)) for row in cursor.fetchall())
+    except DatabaseError as error:
+        return f"EXPLAIN failed: {error}"
+    finally:
+        explaining.reset(token)
+
+
+def _explain_slowest(queries):
+    selects = [
+        query
+        for query in queries
+        if not query["many"] and query["sql"].lstrip().upper().startswith("SELECT")
+    ]
+    selects.sort(key=lambda query: query["duration"], reverse=True)
+    for query in selects[: settings.RECIPE_PROFILE_EXPLAIN_COUNT]:
+        query["explain"] = explain(query["sql"], query["params"])
+
+
+def _get_summary(profiler):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_FUNCTIONS)
+    return stream.getvalue()
+
+
+def get_profile_path(profile_id, extension):
+    return os.path.join(settings.RECIPE_PROFILE_DIR, f"{profile_id}.{extension}")
+
+
+def _delete_old_profiles():
+    # names start with the time of capture, so they sort from the oldest
+    names = sorted(
+        name
+        for name in os.listdir(settings.RECIPE_PROFILE_DIR)
+        if name.endswith(".json")
+    )
+    for name in names[: -settings.RECIPE_PROFILE_LIMIT or None]:
+        profile_id = name.removesuffix(".json")
+        for extension in ["json", "prof"]:
+            try:
+                os.remove(get_profile_path(profile_id, extension))
+            except FileNotFoundError:
+                # deleted by a concurrent capture
+                pass
+
+
+def new_profile_id():
+    return f"{timezone.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:8]}"
+
+
+def save_profile(profile_id, profiler, info):
+    """Save profile with its info"""
+    os.makedirs(settings.RECIPE_PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(get_profile_path(profile_id, "prof"))
+
+    # the info is written last, so only complete captures are listed
+    path = get_profile_path(profile_id, "json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump({"id": profile_id, **info}, file, ensure_ascii=False, default=repr)
+    os.replace(f"{path}.tmp", path)
+
+    _delete_old_profiles()
+
+
+class RequestProfile:
+    """Profile and queries of a request, recorded while it is running"""
+
+    def __init__(self, request):
+        self.request = request
+        self.profile_id = new_profile_id()
+        self.profiler = cProfile.Profile()
+        self.query_log = QueryLog()
+        # without the time of sending the content of streaming responses
+        self.duration = 0.0
+
+    @contextlib.contextmanager
+    def running(self):
+        start = time.perf_counter()
+        with connection.execute_wrapper(self.query_log):
+            self.profiler.enable()
+            try:
+                yield
+            finally:
+                self.profiler.disable()
+                self.duration += time.perf_counter() - start
+
+    def save(self, response):
+        queries = self.query_log.queries
+        _explain_slowest(queries)
+        match = self.request.resolver_match
+        save_profile(
+            self.profile_id,
+            self.profiler,
+            {
+                "created_at": timezone.now().isoformat(),
+                "method": self.request.method,
+                "path": self.request.get_full_path(),
+                "view": match.view_name if match else None,
+                "user": self.request.user.get_username(),
+                "status": response.status_code,
+                "duration": self.duration,
+                "query_count": len(queries),
+                "query_duration": sum(query["duration"] for query in queries),
+                "queries": queries,
+                "summary": _get_summary(self.profiler),
+            },
+        )
+
+
+class ProfiledContent:
+    """
+    Iterator over content of a streaming response that profiles producing
+    of every chunk and saves the profile when the response is closed
+    """
+
+    def __init__(self, profile, response, content):
+        self.profile = profile
+        self.response = response
+        self.iterator = iter(content)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.profile.running():
+            return next(self.iterator)
+
+    def close(self):
+        # called by the server, also when the client disconnects
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.profile.save(self.response)
+        finally:
+            _lock.release()
+
+
+def profile_request(request, get_response):
+    """
+    Return response to the request, saving its profile. A request is
+    answered without a profile while another one is profiled.
+    """
+    if not _lock.acquire(blocking=False):
+        return get_response(request)
+
+    streamed = False
+    try:
+        profile = RequestProfile(request)
+        with profile.running():
+            response = get_response(request)
+        response["X-Profile-Id"] = profile.profile_id
+
+        if response.streaming:
+            # the response is closed after its content is sent
+            response.streaming_content = ProfiledContent(
+                profile, response, response.streaming_content
+            )
+            streamed = True
+        else:
+            profile.save(response)
+    finally:
+        if not streamed:
+            _lock.release()
+    return response
+
+
+def get_profiles():
+    """Return info of the saved profiles from the newest, without the details"""
+    try:
+        names = sorted(
+            (
+                name
+                for name in os.listdir(settings.RECIPE_PROFILE_DIR)
+                if name.endswith(".json")
+            ),
+            reverse=True,
+        )
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for name in names:
+        try:
+            with open(
+                os.path.join(settings.RECIPE_PROFILE_DIR, name), encoding="utf-8"
+            ) as file:
+                info = json.load(file)
+        except FileNotFoundError:
+            continue
+        del info["queries"], info["summary"]
+        profiles.append(info)
+    return profiles
@@ -0,0 +1,70 @@
+from functools import reduce
+from operator import add, or_
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+from .models import SEARCH_CONFIG, Recipe
+
+# SearchForm checkboxes and corresponding fields of RecipeSearchDocument
+SEARCH_FORM_FIELDS = {
+    "search_in_names": "name",
+    "search_in_descriptions": "description",
+    "search_in_categories": "category",
+    "search_in_ingredients": "ingredients",
+    "search_in_tags": "tags",
+}
+
+
+def get_search_fields(cleaned_data):
+    """Return search document fields chosen in a valid SearchForm"""
+    return [
+        field
+        for form_field, field in SEARCH_FORM_FIELDS.items()
+        if cleaned_data[form_field]
+    ]
+
+
+def search_recipes(user, search_string, fields):
+    """
+    Return user's recipes that match search string in any of given fields
+    of their search documents.
+
+    On PostgreSQL GIN-indexed full-text search is used and results are ordered
+    by rank, on other databases fields are matched by substring and results
+    are ordered by name. Ties are broken by id for keyset pagination.
+    """
+    if not fields:
+        return Recipe.objects.none()
+
+    recipes = Recipe.objects.filter(user=user)
+
+    if connection.vendor == "postgresql":
+        query = SearchQuery(
+            search_string, config=SEARCH_CONFIG, search_type="websearch"
+        )
+        vectors = [F(f"search_document__{field}_vector") for field in fields]
+        return (
+            recipes.filter(
+                reduce(or_, (Q(**{vector.name: query}) for vector in vectors))
+            )
+            # ranks are real numbers, which are compared with the double
+            # precision values of pagination cursors exactly only when cast
+            .annotate(
+                rank=Cast(
+                    reduce(add, (SearchRank(v, query) for v in vectors)), FloatField()
+                )
+            ).order_by("-rank", "name", "id")
+        )
+
+    return recipes.filter(
+        reduce(
+            or_,
+            (
+                Q(**{f"search_document__{field}__icontains": search_string})
+                for field in fields
+            ),
+        )
+    ).order_by("name", "id")
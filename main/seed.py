@@ -0,0 +1,217 @@
+"""Deterministic generation of recipes for benchmarks and query plan tests"""
+
+import math
+import random
+
+from django.contrib.auth.models import User
+
+from .caching import invalidate_user_cache
+from .models import (
+    Recipe,
+    RecipeImage,
+    RecipeIngredient,
+    RecipeSearchDocument,
+    RecipeStep,
+    RecipeTag,
+)
+from .steps import STEP_NUMBER_GAP
+
+WORDS = [
+    "борщ",
+    "вареники",
+    "деруни",
+    "голубці",
+    "пампушки",
+    "узвар",
+    "млинці",
+    "сирники",
+    "куліш",
+    "юшка",
+    "салат",
+    "пиріг",
+    "запіканка",
+    "котлети",
+    "соус",
+]
+
+# ordered from the most to the least common
+INGREDIENTS = [
+    "сіль",
+    "олія",
+    "цибуля",
+    "картопля",
+    "морква",
+    "буряк",
+    "капуста",
+    "часник",
+    "сметана",
+    "борошно",
+    "яйце",
+    "сир",
+    "apple",
+    "pear",
+    "strawberry",
+    "tomato",
+    "rice",
+    "курка",
+    "свинина",
+    "гриби",
+    "квасоля",
+    "перець",
+]
+
+CATEGORIES = ["перші страви", "другі страви", "десерти", "випічка", "напої"]
+
+TAGS = ["швидко", "вегетаріанське", "святкове", "дитяче", "гостре", "пісне"]
+
+MEASURES = ["г", "мл", "шт", "ст. л."]
+
+
+# numbers of tags of recipes and their frequencies
+TAG_COUNTS = [0, 1, 2, 3, 4]
+TAG_COUNT_WEIGHTS = [20, 35, 25, 15, 5]
+
+# numbers of images of recipes and their frequencies
+IMAGE_COUNTS = [0, 1, 2, 3, 4]
+IMAGE_COUNT_WEIGHTS = [30, 35, 20, 10, 5]
+
+
+def _get_zipf_weights(items):
+    # a few words are much more common than the rest, as in real recipes
+    return [1 / rank for rank in range(1, len(items) + 1)]
+
+
+WORD_WEIGHTS = _get_zipf_weights(WORDS)
+INGREDIENT_WEIGHTS = _get_zipf_weights(INGREDIENTS)
+CATEGORY_WEIGHTS = _get_zipf_weights(CATEGORIES)
+TAG_WEIGHTS = _get_zipf_weights(TAGS)
+
+
+def _sample(rng, items, weights, k):
+    """Return k distinct items, choosing items with larger weights more often"""
+    # weighted sampling without replacement by Efraimidis and Spirakis
+    keys = [
+        (rng.random() ** (1 / weight), item) for item, weight in zip(items, weights)
+    ]
+    return [item for _, item in sorted(keys, reverse=True)[:k]]
+
+
+def _get_count(rng, low, high, mode):
+    # most recipes are short, a few are much longer
+    return round(rng.triangular(low, high, mode))
+
+
+def _get_text(rng, low, high, mode):
+    return " ".join(
+        rng.choices(
+            WORDS + INGREDIENTS,
+            WORD_WEIGHTS + INGREDIENT_WEIGHTS,
+            k=_get_count(rng, low, high, mode),
+        )
+    )
+
+
+def seed_recipes(user, count, seed=0, batch_size=1000):
+    """
+    Create count recipes of the user with ingredients, steps, tags
+    and search documents. The same seed always gives the same data.
+
+    Words, ingredients, categories and tags follow Zipf's law, numbers of
+    children and cooking times are skewed towards small values.
+    """
+    rng = random.Random(seed)
+
+    for start in range(0, count, batch_size):
+        recipes = Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    user=user,
+                    name=(
+                        f"{rng.choices(WORDS, WORD_WEIGHTS)[0]} "
+                        f"{rng.choices(INGREDIENTS, INGREDIENT_WEIGHTS)[0]} {number}"
+                    ),
+                    description=_get_text(rng, 5, 80, 20),
+                    cooking_time=min(
+                        max(round(rng.lognormvariate(math.log(40), 0.7)), 5), 600
+                    ),
+                    category=rng.choices(CATEGORIES, CATEGORY_WEIGHTS)[0],
+                )
+                for number in range(start, min(start + batch_size, count))
+            ]
+        )
+
+        ingredients, steps, tags = [], [], []
+        for recipe in recipes:
+            ingredients += [
+                RecipeIngredient(
+                    recipe=recipe,
+                    name=name,
+                    volume=rng.randint(1, 500),
+                    volume_measure=rng.choice(MEASURES),
+                )
+                for name in _sample(
+                    rng, INGREDIENTS, INGREDIENT_WEIGHTS, _get_count(rng, 2, 15, 6)
+                )
+            ]
+            steps += [
+                RecipeStep(
+                    recipe=recipe,
+                    step_number=step_number * STEP_NUMBER_GAP,
+                    step_description=_get_text(rng, 3, 30, 8),
+                )
+                for step_number in range(_get_count(rng, 2, 20, 5))
+            ]
+            tags += [
+                RecipeTag(recipe=recipe, tag_text=tag_text)
+                for tag_text in _sample(
+                    rng,
+                    TAGS,
+                    TAG_WEIGHTS,
+                    rng.choices(TAG_COUNTS, TAG_COUNT_WEIGHTS)[0],
+                )
+            ]
+
+        RecipeIngredient.objects.bulk_create(ingredients)
+        RecipeStep.objects.bulk_create(steps)
+        RecipeTag.objects.bulk_create(tags)
+        RecipeSearchDocument.refresh([recipe.pk for recipe in recipes])
+
+    # bulk_create does not send signals
+    invalidate_user_cache(user.pk)
+
+
+def seed_users(users, recipes, seed=0, batch_size=1000):
+    """
+    Create users with recipes seeded by seed_recipes and return them.
+    Every user gets its own seed derived from seed, so users have
+    different recipes.
+    """
+    created = User.objects.bulk_create(
+        [User(username=f"seed-{seed}-{number}") for number in range(users)]
+    )
+    for number, user in enumerate(created):
+        seed_recipes(user, recipes, seed=seed * users + number, batch_size=batch_size)
+    return created
+
+
+def seed_images(recipes, seed=0, batch_size=1000):
+    """
+    Create image rows for the recipes, most recipes get one or two
+    images. Only the rows are created, their files do not exist.
+    The same seed always gives the same data.
+    """
+    rng = random.Random(seed)
+
+    images = []
+    for recipe in recipes:
+        for _ in range(rng.choices(IMAGE_COUNTS, IMAGE_COUNT_WEIGHTS)[0]):
+            # names look like names of content-addressed files
+            digest = f"{rng.getrandbits(256):064x}"
+            images.append(
+                RecipeImage(
+                    recipe=recipe,
+                    user_id=recipe.user_id,
+                    image=f"recipes/{digest[:2]}/{digest}.jpg",
+                )
+            )
+    RecipeImage.objects.bulk_create(images, batch_size=batch_size)
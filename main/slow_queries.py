@@ -0,0 +1,173 @@
+"""
+Log of database queries slower than RECIPE_SLOW_QUERY_THRESHOLD seconds.
+
+Slow queries are logged by the main.slow_queries logger as JSON lines with
+the view and the line of the project code that ran them. Queries are
+grouped by fingerprints, their SQL with values replaced by placeholders,
+and the plan of a query is captured the first time its fingerprint is
+seen by the processes sharing the cache. The slow_query_report command
+aggregates the log.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import traceback
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .caching import KEY_PREFIX
+from .profiling import explain, explaining
+
+logger = logging.getLogger(__name__)
+
+# statements that EXPLAIN shows the plan of without running them
+EXPLAINED_STATEMENTS = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_SPACE = re.compile(r"\s+")
+# lists of values of IN and rows of bulk inserts
+_VALUE_LIST = re.compile(r"\(\?(?:, \?)*\)")
+_REPEATED_LIST = re.compile(r"\(\.\.\.\)(?:, \(\.\.\.\))+")
+
+
+def normalize_sql(sql):
+    """Return SQL with values replaced, so equal queries have equal SQL"""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip()
+    sql = _VALUE_LIST.sub("(...)", sql)
+    return _REPEATED_LIST.sub("(...)", sql)
+
+
+def get_fingerprint(normalized_sql):
+    return hashlib.sha256(normalized_sql.encode("utf-8")).hexdigest()[:16]
+
+
+# modules of the hooks of requests, which are never the origin of a query
+_HOOK_FILES = {
+    os.path.join(os.path.dirname(__file__), name)
+    for name in ["instrumentation.py", "metrics.py", "profiling.py", "slow_queries.py"]
+}
+
+
+def get_origin():
+    """Return the innermost line of the project code that ran the current query"""
+    base_dir = str(settings.BASE_DIR) + os.sep
+    frames = [frame for frame, _ in traceback.walk_stack(None)]
+    # execute wrappers of the hooks are called inside _execute_with_wrappers,
+    # the code that ran the query is outside of it
+    names = [frame.f_code.co_name for frame in frames]
+    if "_execute_with_wrappers" in names:
+        frames = frames[names.index("_execute_with_wrappers") + 1 :]
+
+    for frame in frames:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(base_dir)
+            and "site-packages" not in filename
+            and filename not in _HOOK_FILES
+        ):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+    return None
+
+
+def _is_new_fingerprint(fingerprint):
+    return cache.add(f"{KEY_PREFIX}:slow_query:{fingerprint}", True, None)
+
+
+class SlowQueryLog:
+    """Database execute wrapper that logs slow queries of a request"""
+
+    def __init__(self, request=None):
+        self.request = request
+
+    def get_view(self):
+        match = self.request.resolver_match if self.request else None
+        return match.view_name if match else None
+
+    def __call__(self, execute, sql, params, many, context):
+        threshold = settings.RECIPE_SLOW_QUERY_THRESHOLD
+        # statements capturing plans for this log or the profiler are skipped
+        if threshold is None or explaining.get():
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= threshold:
+                self.log(sql, params, many, duration)
+
+    def log(self, sql, params, many, duration):
+        normalized_sql = normalize_sql(sql)
+        fingerprint = get_fingerprint(normalized_sql)
+        entry = {
+            "time": timezone.now().isoformat(),
+            "duration": duration,
+            "fingerprint": fingerprint,
+            "normalized_sql": normalized_sql,
+            "sql": sql,
+            "view": self.get_view(),
+            "origin": get_origin(),
+        }
+
+        if (
+            not many
+            and sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS)
+            and _is_new_fingerprint(fingerprint)
+        ):
+            entry["explain"] = explain(sql, params)
+
+        logger.warning(json.dumps(entry, ensure_ascii=False))
+
+
+def read_log(lines):
+    """Yield entries of the slow query log, skipping lines of other records"""
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict) and "fingerprint" in entry:
+            yield entry
+
+
+def aggregate(entries):
+    """
+    Return statistics of slow queries by fingerprint: count, total and
+    maximal duration, counts of views and origins and the captured plan
+    """
+    stats = {}
+    for entry in entries:
+        fingerprint = entry["fingerprint"]
+        query = stats.get(fingerprint)
+        if query is None:
+            query = stats[fingerprint] = {
+                "fingerprint": fingerprint,
+                "normalized_sql": entry["normalized_sql"],
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "views": {},
+                "origins": {},
+                "explain": None,
+            }
+        query["count"] += 1
+        query["total"] += entry["duration"]
+        query["max"] = max(query["max"], entry["duration"])
+        for key, value in [("views", entry["view"]), ("origins", entry["origin"])]:
+            query[key][value] = query[key].get(value, 0) + 1
+        if entry.get("explain"):
+            query["explain"] = entry["explain"]
+    return list(stats.values())
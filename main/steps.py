@@ -0,0 +1,91 @@
+from django.db.models import Max
+
+from .models import RecipeStep
+
+# steps are numbered with gaps, so a step can be put between two other steps
+# by changing only its own number
+STEP_NUMBER_GAP = 1024
+
+
+def get_next_step_number(recipe):
+    """Return number for a step appended to the end of the recipe"""
+    last = RecipeStep.objects.filter(recipe=recipe).aggregate(Max("step_number"))[
+        "step_number__max"
+    ]
+    return 0 if last is None else last + STEP_NUMBER_GAP
+
+
+def get_step_number_between(previous_number, next_number):
+    """
+    Return free step number between the numbers of two neighbouring steps,
+    any of which may be None, or None if there is no gap between them.
+    """
+    if next_number is None:
+        return 0 if previous_number is None else previous_number + STEP_NUMBER_GAP
+    if previous_number is None:
+        if next_number >= STEP_NUMBER_GAP:
+            return next_number - STEP_NUMBER_GAP
+        return next_number // 2 if next_number > 0 else None
+    if next_number - previous_number > 1:
+        return (previous_number + next_number) // 2
+    return None
+
+
+def renumber_steps(steps):
+    """
+    Give steps evenly spaced numbers in the order of the list with one UPDATE.
+
+    New numbers are all either below or above the current ones, so rows never
+    collide on the unique (recipe, step_number) index in the middle of
+    the statement.
+    """
+    current = [step.step_number for step in steps if step.pk is not None]
+    highest_new = (len(steps) - 1) * STEP_NUMBER_GAP
+    if current and min(current) <= highest_new:
+        start = max(current) + STEP_NUMBER_GAP
+    else:
+        start = 0
+
+    for i, step in enumerate(steps):
+        step.step_number = start + i * STEP_NUMBER_GAP
+
+    RecipeStep.objects.bulk_update(
+        [step for step in steps if step.pk is not None], ["step_number"]
+    )
+
+
+def place_step(recipe, step, before=None):
+    """
+    Put new or existing step of the recipe before other step of the recipe,
+    or to the end if before is None, save it and return all steps
+    of the recipe in their new order.
+
+    The recipe must be locked by the caller to serialize concurrent changes
+    of its steps.
+    """
+    steps = [
+        s
+        for s in RecipeStep.objects.filter(recipe=recipe).order_by("step_number")
+        if s.pk != step.pk
+    ]
+    index = steps.index(before) if before is not None else len(steps)
+    steps.insert(index, step)
+    step.recipe = recipe
+
+    number = get_step_number_between(
+        steps[index - 1].step_number if index > 0 else None,
+        steps[index + 1].step_number if index + 1 < len(steps) else None,
+    )
+    if number is None:
+        # existing steps, including the placed one, are saved by renumbering
+        renumber_steps(steps)
+        if step.pk is None:
+            step.save()
+    elif step.pk is None:
+        step.step_number = number
+        step.save()
+    else:
+        step.step_number = number
+        step.save(update_fields=["step_number"])
+
+    return steps
@@ -0,0 +1,74 @@
+"""Deduplicating storage of recipe images"""
+
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+from .images import strip_metadata
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that saves files under the SHA-256 hash of their
+    content, so the same file saved many times is stored once. Only the
+    directory and the extension of the name given to save are kept.
+
+    Files are shared, so they must be deleted only when nothing refers
+    to them any more. Metadata of images, like the place where a photo was
+    taken, is removed before they are stored.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # equal names mean equal content, so existing files are reused
+        return name
+
+    def get_content_name(self, directory, digest, extension):
+        return f"{directory}/{digest[:2]}/{digest}{extension}".lstrip("/")
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        content = strip_metadata(content)
+
+        # the file is hashed while it is written to a temporary file next to
+        # its final place, so it is moved there atomically
+        temp_directory = self.path(directory)
+        os.makedirs(temp_directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=".upload-", dir=temp_directory)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, "wb") as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+
+            name = self.get_content_name(directory, digest.hexdigest(), extension)
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                # newer modification time protects the file from deletion
+                # that was requested before this upload is committed
+                os.utime(path)
+            except FileNotFoundError:
+                # the file did not exist or was just deleted, the new content
+                # takes its place
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, path)
+            else:
+                os.remove(temp_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return name
+
+
+recipe_image_storage = ContentAddressedStorage()
+
+
+def get_recipe_image_storage():
+    return recipe_image_storage
@@ -0,0 +1,39 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..images import VARIANT_FORMATS, VARIANT_WIDTHS
+
+register = template.Library()
+
+
+def _get_srcset(image, extension):
+    return ", ".join(
+        f"{image.url}?width={width}&format={extension} {width}w"
+        for width in VARIANT_WIDTHS
+    )
+
+
+@register.simple_tag
+def recipe_picture(image, width, alt=""):
+    """
+    Render picture element with resized variants of the recipe image
+    shown with the given width in CSS pixels.
+    """
+    *sources, fallback = VARIANT_FORMATS
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}px" width="{}" alt="{}"'
+        ' loading="lazy"></picture>',
+        format_html_join(
+            "",
+            '<source type="image/{}" srcset="{}" sizes="{}px">',
+            (
+                (extension, _get_srcset(image, extension), width)
+                for extension in sources
+            ),
+        ),
+        f"{image.url}?width={VARIANT_WIDTHS[0]}&format={fallback}",
+        _get_srcset(image, fallback),
+        width,
+        width,
+        alt,
+    )
@@ -1,11 +1,84 @@
+import csv
 import datetime
-from io import StringIO
-
+import json
+import os
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
 from django.shortcuts import reverse
-from django.test import TestCase
-
-from .models import Recipe, RecipeIngredient, RecipeStep, RecipeTag
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import metrics, profiling
+from .ai import get_backend, get_generated_recipe, stream_generated_recipe
+from .caching import get_cache_stats
+from .checks import check_shared_cache
+from .cleanup import wait_for_deletions
+from .export_utils import get_exporter, recipe_to_dict
+from .generation import claim_job, recover_stale_jobs, run_job, run_next_job
+from .generation_backends import (
+    STUB_RECIPE,
+    CallLimit,
+    CircuitBreaker,
+    GenerationUnavailable,
+    StubBackend,
+    TransientGenerationError,
+    call_with_retries,
+    stream_with_retries,
+)
+from .generation_cache import (
+    cache_recipe,
+    delete_expired_recipes,
+    get_cached_recipe,
+    get_generation_cache_stats,
+)
+from .images import (
+    VARIANT_FORMATS,
+    VARIANT_WIDTHS,
+    create_variants,
+    get_original_name,
+    get_variant_name,
+    get_variant_names,
+    has_variants,
+    strip_metadata,
+)
+from .import_utils import RecipeImportError, read_json
+from .loaders import iter_recipes_with_children
+from .metrics import DURATION_BUCKETS
+from .models import (
+    GenerationCacheEntry,
+    GenerationJob,
+    ImportCheckpoint,
+    Recipe,
+    RecipeImage,
+    RecipeIngredient,
+    RecipeSearchDocument,
+    RecipeStep,
+    RecipeTag,
+)
+from .partial_json import PartialJSONParser
+from .search import SEARCH_FORM_FIELDS
+from .seed import seed_images, seed_recipes, seed_users
+from .slow_queries import normalize_sql
+from .steps import STEP_NUMBER_GAP
 
 
 class ListRecipesViewTest(TestCase):
@@ -80,6 +153,102 @@ class ListRecipesViewTest(TestCase):
                     ),
                 )
 
+    def test_invalid_sorting(self):
+        for sorting_param in ["user__password", "user", "id; DROP", ""]:
+            with self.subTest(sorting_param=sorting_param):
+                response = self.client.get(
+                    reverse("list_recipes"), data={"ordering": sorting_param}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    list(response.context["object_list"]),
+                    sorted(self.recipes, key=lambda r: r.name),
+                )
+                self.assertEqual(
+                    response.context["sort_form"].initial["ordering"], "name"
+                )
+
+
+class KeysetPaginationTest(TestCase):
+    SORTING_PARAMS = ["name", "cooking_time", "category", "created_at", "updated_at"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+        # recipes have repeated values to check that ties are broken by id
+        cls.recipes = [
+            Recipe.objects.create(
+                user=cls.user,
+                name=f"test {i % 4}",
+                description="test",
+                cooking_time=10 * (i % 3),
+                category=f"test {i % 2}",
+            )
+            for i in range(12)
+        ]
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+
+    def get_pages(self, params, cursor, direction, url_name="list_recipes"):
+        pages = []
+        while True:
+            response = self.client.get(
+                reverse(url_name), data={**params, "cursor": cursor}
+            )
+            page = response.context["page_obj"]
+            pages.append(list(page))
+            cursor = getattr(page, f"{direction}_cursor")
+            if not cursor:
+                return pages
+
+    def test_pages_cover_ordering(self):
+        for sorting_param in self.SORTING_PARAMS:
+            for is_descending in ["", "on"]:
+                with self.subTest(
+                    sorting_param=sorting_param, is_descending=is_descending
+                ):
+                    params = {"ordering": sorting_param, "is_descending": is_descending}
+                    expected = sorted(
+                        self.recipes,
+                        key=lambda r: (getattr(r, sorting_param), r.pk),
+                        reverse=bool(is_descending),
+                    )
+
+                    pages = self.get_pages(params, "", "next")
+                    self.assertEqual([len(page) for page in pages], [5, 5, 2])
+                    self.assertEqual(sum(pages, []), expected)
+
+                    first_page = self.client.get(
+                        reverse("list_recipes"), data=params
+                    ).context["page_obj"]
+                    pages = self.get_pages(params, first_page.last_cursor, "previous")
+                    self.assertEqual([len(page) for page in pages], [5, 5, 2])
+                    self.assertEqual(sum(reversed(pages), []), expected)
+
+    @unittest.skipUnless(
+        connection.vendor == "postgresql", "ranks are computed by PostgreSQL"
+    )
+    def test_search_pages_with_tied_ranks(self):
+        # all recipes match the same way, so their ranks are equal
+        params = {"search_string": "test", "search_in_descriptions": "on"}
+
+        pages = self.get_pages(params, "", "next", url_name="search_results")
+
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(
+            [recipe.pk for recipe in sum(pages, [])],
+            [
+                recipe.pk
+                for recipe in sorted(self.recipes, key=lambda r: (r.name, r.pk))
+            ],
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("list_recipes"), data={"cursor": "bad"})
+        self.assertEqual(response.status_code, 404)
+
 
 class SearchViewTest(TestCase):
     @classmethod
@@ -181,6 +350,57 @@ class SearchViewTest(TestCase):
                 )
 
 
+class RecipeSearchDocumentTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+        cls.recipe = Recipe.objects.create(
+            user=cls.user,
+            name="test 1",
+            description="test",
+            cooking_time=30,
+            category="test a",
+        )
+        cls.ingredient = RecipeIngredient.objects.create(
+            recipe=cls.recipe, name="apple", volume=1.0, volume_measure="pcs"
+        )
+        cls.tag = RecipeTag.objects.create(recipe=cls.recipe, tag_text="tag")
+
+    def test_document_follows_recipe_changes(self):
+        self.recipe.name = "test 2"
+        self.recipe.save()
+        self.ingredient.name = "pear"
+        self.ingredient.save()
+        self.tag.delete()
+
+        document = RecipeSearchDocument.objects.get(recipe=self.recipe)
+        self.assertEqual(document.name, "test 2")
+        self.assertEqual(document.ingredients, "pear")
+        self.assertEqual(document.tags, "")
+
+    def test_document_is_deleted_with_recipe(self):
+        self.recipe.delete()
+
+        self.assertFalse(RecipeSearchDocument.objects.exists())
+
+    def test_rebuild_search_documents(self):
+        RecipeSearchDocument.objects.all().delete()
+
+        try:
+            call_command("rebuild_search_documents", stdout=StringIO())
+        except CommandError:
+            # the dictionary is added to the search on PostgreSQL first
+            if connection.vendor != "postgresql":
+                raise
+            self.skipTest("Ukrainian dictionary is not installed on the server")
+
+        document = RecipeSearchDocument.objects.get(recipe=self.recipe)
+        self.assertEqual(document.name, "test 1")
+        self.assertEqual(document.ingredients, "apple")
+        self.assertEqual(document.tags, "tag")
+
+
 class CreateRecipeViewTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -291,6 +511,8 @@ class EditRecipeViewTest(TestCase):
             "new_ingredient_name": ["strawberry"],
             "new_ingredient_volume": [1],
             "new_ingredient_volume_measure": ["pcs"],
+            "recipeimage_set-TOTAL_FORMS": "0",
+            "recipeimage_set-INITIAL_FORMS": "0",
             "recipetag_set-TOTAL_FORMS": "2",
             "recipetag_set-INITIAL_FORMS": "2",
             "recipetag_set-0-id": cls.tags[0].pk,
@@ -332,6 +554,130 @@ class EditRecipeViewTest(TestCase):
         self.assertCountEqual([t.tag_text for t in tags], ["tag 1 updated", "tag 3"])
 
 
+class RecipeStepOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+        User.objects.create_user(username="other", password="123456")
+
+        cls.recipe = Recipe.objects.create(
+            user=cls.user,
+            name="test",
+            description="test",
+            cooking_time=30,
+            category="test",
+        )
+        # consecutive numbers, as steps were numbered before gaps were used
+        cls.steps = [
+            RecipeStep.objects.create(
+                recipe=cls.recipe, step_number=i, step_description=f"step {i}"
+            )
+            for i in range(3)
+        ]
+
+        other_recipe = Recipe.objects.create(
+            user=cls.user,
+            name="other",
+            description="test",
+            cooking_time=30,
+            category="test",
+        )
+        RecipeStep.objects.create(
+            recipe=other_recipe, step_number=10**6, step_description="step"
+        )
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+
+    def get_step_order(self):
+        return list(
+            RecipeStep.objects.filter(recipe=self.recipe)
+            .order_by("step_number")
+            .values_list("step_description", flat=True)
+        )
+
+    def move(self, step, before=None):
+        return self.client.post(
+            reverse(
+                "move_recipe_step",
+                kwargs={"recipe_id": self.recipe.pk, "step_id": step.pk},
+            ),
+            data={"before": before.pk if before else ""},
+        )
+
+    def test_new_steps_are_numbered_per_recipe(self):
+        self.client.post(
+            reverse("edit_recipe", kwargs={"recipe_id": self.recipe.pk}),
+            data={
+                "name": "test",
+                "description": "test",
+                "cooking_time": 30,
+                "category": "test",
+                "recipestep_set-TOTAL_FORMS": "0",
+                "recipestep_set-INITIAL_FORMS": "0",
+                "recipeingredient_set-TOTAL_FORMS": "0",
+                "recipeingredient_set-INITIAL_FORMS": "0",
+                "recipetag_set-TOTAL_FORMS": "0",
+                "recipetag_set-INITIAL_FORMS": "0",
+                "recipeimage_set-TOTAL_FORMS": "0",
+                "recipeimage_set-INITIAL_FORMS": "0",
+                "new_step_description": ["step 3", "step 4"],
+            },
+        )
+
+        self.assertEqual(
+            list(
+                RecipeStep.objects.filter(recipe=self.recipe)
+                .order_by("step_number")
+                .values_list("step_number", flat=True)
+            ),
+            [0, 1, 2, 2 + STEP_NUMBER_GAP, 2 + 2 * STEP_NUMBER_GAP],
+        )
+
+    def test_move_without_gap_renumbers_steps(self):
+        response = self.move(self.steps[2], before=self.steps[0])
+
+        self.assertEqual(self.get_step_order(), ["step 2", "step 0", "step 1"])
+        self.assertEqual(
+            response.json()["steps"], [self.steps[i].pk for i in [2, 0, 1]]
+        )
+
+    def test_move_into_gap_changes_one_step(self):
+        self.move(self.steps[2], before=self.steps[0])
+        numbers = dict(
+            RecipeStep.objects.filter(recipe=self.recipe).values_list(
+                "pk", "step_number"
+            )
+        )
+
+        self.move(self.steps[1])
+        self.move(self.steps[0], before=self.steps[2])
+
+        self.assertEqual(self.get_step_order(), ["step 0", "step 2", "step 1"])
+        self.assertEqual(
+            RecipeStep.objects.get(pk=self.steps[2].pk).step_number,
+            numbers[self.steps[2].pk],
+        )
+
+    def test_insert_step(self):
+        self.client.post(
+            reverse("insert_recipe_step", kwargs={"recipe_id": self.recipe.pk}),
+            data={"step_description": "new step", "before": self.steps[1].pk},
+        )
+
+        self.assertEqual(
+            self.get_step_order(), ["step 0", "new step", "step 1", "step 2"]
+        )
+
+    def test_move_foreign_step(self):
+        self.client.login(username="other", password="123456")
+
+        response = self.move(self.steps[2], before=self.steps[0])
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.get_step_order(), ["step 0", "step 1", "step 2"])
+
+
 class DownloadRecipeViewTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -378,7 +724,9 @@ class DownloadRecipeViewTest(TestCase):
             reverse("download_recipe", kwargs={"recipe_id": self.recipe.pk})
         )
 
-        self.assertEqual(response.filename, f"{self.recipe.name}.txt")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="Test.txt"'
+        )
 
         downloaded_recipe = b"".join(response.streaming_content).decode("utf-8")
         expected_recipe = f"""{self.recipe.name}
@@ -408,121 +756,2262 @@ class DownloadRecipeViewTest(TestCase):
 
         self.assertEqual(downloaded_recipe, expected_recipe)
 
+    def download(self, export_format):
+        response = self.client.get(
+            reverse("download_recipe", kwargs={"recipe_id": self.recipe.pk}),
+            {"format": export_format},
+        )
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="{self.recipe.name}.{export_format}"',
+        )
+        return b"".join(response.streaming_content).decode("utf-8")
 
-class RecipeDetailsViewTest(TestCase):
+    def test_downloaded_recipe_markdown(self):
+        downloaded_recipe = self.download("md")
+
+        self.assertTrue(downloaded_recipe.startswith(f"# {self.recipe.name}\n"))
+        self.assertIn("1. step 1\n2. step 2\n", downloaded_recipe)
+        self.assertIn("- apple: 1.0 pcs\n", downloaded_recipe)
+        self.assertIn("`tag 1` `tag 2`", downloaded_recipe)
+
+    def test_downloaded_recipe_json(self):
+        downloaded_recipe = json.loads(self.download("json"))
+
+        self.assertEqual(
+            downloaded_recipe,
+            {
+                "name": "Test",
+                "description": "test recipe",
+                "cooking_time_in_minutes": 30,
+                "category": "test",
+                "steps": ["step 1", "step 2"],
+                "ingredients": [
+                    {"name": "apple", "volume": 1.0, "volume_measure": "pcs"},
+                    {"name": "pear", "volume": 1.0, "volume_measure": "pcs"},
+                ],
+                "tags": ["tag 1", "tag 2"],
+            },
+        )
+
+    def test_downloaded_recipe_csv(self):
+        rows = list(csv.DictReader(StringIO(self.download("csv"))))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["name"], "Test")
+        self.assertEqual(rows[0]["cooking_time_in_minutes"], "30")
+        self.assertEqual(json.loads(rows[0]["steps"]), ["step 1", "step 2"])
+        self.assertEqual(json.loads(rows[0]["tags"]), ["tag 1", "tag 2"])
+
+    def test_non_ascii_file_name(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(name="Борщ")
+
+        response = self.client.get(
+            reverse("download_recipe", kwargs={"recipe_id": self.recipe.pk})
+        )
+
+        self.assertEqual(
+            response["Content-Disposition"],
+            "attachment; filename*=utf-8''%D0%91%D0%BE%D1%80%D1%89.txt",
+        )
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            reverse("download_recipe", kwargs={"recipe_id": self.recipe.pk}),
+            {"format": "exe"},
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_many(self):
+        items = [(self.recipe, self.ingredients, self.steps, self.tags)] * 2
+
+        exported = json.loads("".join(get_exporter("json").export_many(items)))
+        self.assertEqual([recipe["name"] for recipe in exported], ["Test", "Test"])
+
+        exported = "".join(get_exporter("csv").export_many(items))
+        self.assertEqual(len(list(csv.DictReader(StringIO(exported)))), 2)
+
+
+def make_image(width, height, image_format="JPEG"):
+    exif = Image.Exif()
+    # orientation and camera model
+    exif[0x0112] = 1
+    exif[0x0110] = "test camera"
+
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, image_format, exif=exif)
+    return buffer.getvalue()
+
+
+def add_image(recipe, name, content):
+    return RecipeImage.objects.create(
+        recipe=recipe, user=recipe.user, image=ContentFile(content, name=name)
+    )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ExportRecipesViewTest(TestCase):
     @classmethod
     def setUpTestData(cls):
+        cls.addClassCleanup(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
         cls.user = User.objects.create_user(username="user", password="123456")
+        other_user = User.objects.create_user(username="other", password="123456")
 
-        cls.recipe = Recipe.objects.create(
-            user=cls.user,
-            name="Test",
-            description="test recipe",
-            cooking_time=30,
-            category="test",
-            created_at=datetime.datetime(2025, 1, 13, 14, 30),
-            updated_at=datetime.datetime(2025, 1, 13, 15, 30),
+        seed_recipes(cls.user, 3)
+        seed_recipes(other_user, 2)
+
+        cls.recipe = Recipe.objects.filter(user=cls.user).order_by("id").first()
+        cls.recipe_image = add_image(cls.recipe, "photo.jpg", make_image(100, 100))
+        with cls.recipe_image.image.open("rb") as file:
+            cls.image = file.read()
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+
+    def download(self, **params):
+        response = self.client.get(reverse("export_recipes"), params)
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="recipes.zip"'
         )
+        return zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
 
-        cls.steps = [
-            RecipeStep.objects.create(
-                recipe=cls.recipe, step_number=0, step_description="step 1"
-            ),
-            RecipeStep.objects.create(
-                recipe=cls.recipe, step_number=1, step_description="step 2"
-            ),
-        ]
+    def test_archive_content(self):
+        archive = self.download()
+        names = archive.namelist()
 
-        cls.ingredients = [
-            RecipeIngredient.objects.create(
-                recipe=cls.recipe, name="apple", volume=1.0, volume_measure="pcs"
-            ),
-            RecipeIngredient.objects.create(
-                recipe=cls.recipe, name="pear", volume=1.0, volume_measure="pcs"
-            ),
-        ]
+        recipes = Recipe.objects.filter(user=self.user).order_by("id")
+        documents = [name for name in names if name.endswith("/recipe.json")]
+        self.assertEqual(len(documents), recipes.count())
+        for document, recipe in zip(documents, recipes):
+            self.assertEqual(json.loads(archive.read(document))["name"], recipe.name)
 
-        cls.tags = [
-            RecipeTag.objects.create(recipe=cls.recipe, tag_text="tag 1"),
-            RecipeTag.objects.create(recipe=cls.recipe, tag_text="tag 2"),
-        ]
+        image_name = os.path.basename(self.recipe_image.image.name)
+        images = [name for name in names if name.endswith(image_name)]
+        self.assertEqual(len(images), 1)
+        self.assertEqual(archive.read(images[0]), self.image)
 
-    def setUp(self):
-        self.client.login(username="user", password="123456")
+    def test_text_format(self):
+        archive = self.download(format="txt")
 
-    def test_recipe_details_content(self):
-        response = self.client.get(
-            reverse("recipe_details", kwargs={"recipe_id": self.recipe.pk})
+        self.assertEqual(
+            len([name for name in archive.namelist() if name.endswith(".txt")]), 3
         )
 
-        self.assertEqual(response.context["recipe"], self.recipe)
-        self.assertEqual(list(response.context["ingredients"]), self.ingredients)
-        self.assertEqual(list(response.context["steps"]), self.steps)
-        self.assertEqual(list(response.context["tags"]), self.tags)
+    def test_missing_image_is_skipped(self):
+        path = self.recipe_image.image.path
+        os.rename(path, f"{path}.moved")
+        self.addCleanup(os.rename, f"{path}.moved", path)
 
+        archive = self.download()
 
-class RecipeDeletionTest(TestCase):
+        self.assertEqual(len(archive.namelist()), 3)
+
+    def test_queries_do_not_depend_on_number_of_recipes(self):
+        response = self.client.get(reverse("export_recipes"))
+
+        # recipes and a query per child table for each chunk of recipes
+        with self.assertNumQueries(5):
+            b"".join(response.streaming_content)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RECIPE_MEDIA_DEDUP_GRACE=0)
+class RecipeImageVariantsTest(TestCase):
     @classmethod
     def setUpTestData(cls):
+        cls.addClassCleanup(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
         cls.user = User.objects.create_user(username="user", password="123456")
+        User.objects.create_user(username="other", password="123456")
 
-        cls.recipe = Recipe.objects.create(
-            user=cls.user,
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+        self.recipe = Recipe.objects.create(
+            user=self.user,
             name="Test",
             description="test recipe",
             cooking_time=30,
             category="test",
-            created_at=datetime.datetime(2025, 1, 13, 14, 30),
-            updated_at=datetime.datetime(2025, 1, 13, 15, 30),
         )
+        self.recipe_image = add_image(self.recipe, "photo.jpg", make_image(2000, 1000))
 
-        cls.steps = [
-            RecipeStep.objects.create(
-                recipe=cls.recipe, step_number=0, step_description="step 1"
-            ),
-            RecipeStep.objects.create(
-                recipe=cls.recipe, step_number=1, step_description="step 2"
-            ),
-        ]
+    def open_variant(self, width, extension):
+        return Image.open(
+            default_storage.open(
+                get_variant_name(self.recipe_image.image.name, width, extension)
+            )
+        )
 
-        cls.ingredients = [
-            RecipeIngredient.objects.create(
-                recipe=cls.recipe, name="apple", volume=1.0, volume_measure="pcs"
-            ),
-            RecipeIngredient.objects.create(
-                recipe=cls.recipe, name="pear", volume=1.0, volume_measure="pcs"
+    def get_image(self, **params):
+        return self.client.get(
+            reverse(
+                "recipe-image-download",
+                kwargs={"relative_path": self.recipe_image.image.name},
             ),
-        ]
+            params,
+        )
 
-        cls.tags = [
-            RecipeTag.objects.create(recipe=cls.recipe, tag_text="tag 1"),
-            RecipeTag.objects.create(recipe=cls.recipe, tag_text="tag 2"),
-        ]
+    def test_variants_are_created_on_upload(self):
+        for width in VARIANT_WIDTHS:
+            for extension, image_format in VARIANT_FORMATS.items():
+                with self.open_variant(width, extension) as variant:
+                    self.assertEqual(variant.format, image_format)
+                    self.assertEqual(variant.size, (width, width // 2))
+                    self.assertNotIn(0x0110, variant.getexif())
 
-    def setUp(self):
-        self.client.login(username="user", password="123456")
+    def test_metadata_of_original_is_removed(self):
+        with Image.open(self.recipe_image.image.path) as original:
+            self.assertEqual(dict(original.getexif()), {})
+            self.assertEqual(original.size, (2000, 1000))
 
-    def test_recipe_details_content(self):
-        recipe_pk = self.recipe.pk
-        steps_pks = [s.pk for s in self.steps]
-        ingredients_pks = [i.pk for i in self.ingredients]
-        tags_pks = [t.pk for t in self.tags]
+    def test_rotated_original_is_transposed(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new("RGB", (40, 20), "red").save(buffer, "JPEG", exif=exif)
+        rotated = add_image(self.recipe, "rotated.jpg", buffer.getvalue())
 
-        response = self.client.post(
-            reverse("delete_recipe", kwargs={"recipe_id": self.recipe.pk})
+        with Image.open(rotated.image.path) as original:
+            self.assertEqual(dict(original.getexif()), {})
+            self.assertEqual(original.size, (20, 40))
+
+    def test_variants_are_replaced(self):
+        name = get_variant_name(self.recipe_image.image.name, 640, "webp")
+        with default_storage.open(name) as file:
+            content = file.read()
+
+        create_variants(self.recipe_image.image)
+
+        files = default_storage.listdir(os.path.dirname(name))[1]
+        self.assertIn(os.path.basename(name), files)
+        self.assertFalse([file for file in files if file.startswith(".variant-")])
+        with default_storage.open(name) as file:
+            self.assertEqual(file.read(), content)
+
+    def test_small_image_is_not_upscaled(self):
+        small = add_image(self.recipe, "small.png", make_image(100, 50, "PNG"))
+
+        variant_name = get_variant_name(small.image.name, 1280, "webp")
+        with Image.open(default_storage.open(variant_name)) as variant:
+            self.assertEqual(variant.size, (100, 50))
+
+    def test_variant_is_served(self):
+        response = self.get_image(width=640, format="webp")
+
+        self.assertEqual(response.status_code, 200)
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as variant:
+            self.assertEqual(variant.format, "WEBP")
+            self.assertEqual(variant.width, 640)
+
+    def test_unknown_variant(self):
+        self.assertEqual(self.get_image(width=100, format="webp").status_code, 404)
+        self.assertEqual(self.get_image(width=640, format="gif").status_code, 404)
+
+    def test_variant_of_other_user_image(self):
+        self.client.login(username="other", password="123456")
+
+        self.assertEqual(self.get_image(width=640, format="webp").status_code, 404)
+
+    def test_details_page_has_srcset(self):
+        response = self.client.get(
+            reverse("recipe_details", kwargs={"recipe_id": self.recipe.pk})
         )
 
-        with self.assertRaises(Recipe.DoesNotExist):
-            Recipe.objects.get(pk=recipe_pk)
+        self.assertContains(response, '<source type="image/webp" srcset="')
+        self.assertContains(response, "?width=1280&amp;format=jpg 1280w")
 
-        with self.assertRaises(RecipeStep.DoesNotExist):
-            for pk in steps_pks:
-                RecipeStep.objects.get(pk=pk)
+    def test_variants_are_deleted_with_recipe(self):
+        names = get_variant_names(self.recipe_image.image.name)
 
-        with self.assertRaises(RecipeIngredient.DoesNotExist):
-            for pk in ingredients_pks:
-                RecipeIngredient.objects.get(pk=pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        wait_for_deletions()
 
-        with self.assertRaises(RecipeTag.DoesNotExist):
-            for pk in tags_pks:
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+    def test_backfill_command(self):
+        names = get_variant_names(self.recipe_image.image.name)
+        for name in names:
+            default_storage.delete(name)
+
+        call_command("create_image_variants", stdout=StringIO())
+
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RECIPE_MEDIA_DEDUP_GRACE=0)
+class RecipeImagesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.addClassCleanup(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+
+    def test_recipe_creation_with_images(self):
+        images = [
+            SimpleUploadedFile(f"photo{i}.jpg", make_image(10, 10), "image/jpeg")
+            for i in range(4)
+        ]
+
+        self.client.post(
+            reverse("create_recipe"),
+            data={
+                "name": "Test",
+                "description": "test recipe",
+                "cooking_time": 10,
+                "category": "test",
+                "images": images,
+            },
+        )
+
+        recipe = Recipe.objects.get(name="Test")
+        recipe_images = RecipeImage.objects.filter(recipe=recipe)
+        self.assertEqual(len(recipe_images), 4)
+        for recipe_image in recipe_images:
+            self.assertEqual(recipe_image.user, self.user)
+            self.assertTrue(has_variants(recipe_image.image))
+
+    def test_image_deletion(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=10,
+            category="test",
+        )
+        kept = add_image(recipe, "kept.jpg", make_image(10, 10))
+        deleted = add_image(recipe, "deleted.jpg", make_image(20, 20))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("edit_recipe", kwargs={"recipe_id": recipe.pk}),
+                data={
+                    "name": "Test",
+                    "description": "test recipe",
+                    "cooking_time": 10,
+                    "category": "test",
+                    "recipestep_set-TOTAL_FORMS": "0",
+                    "recipestep_set-INITIAL_FORMS": "0",
+                    "recipeingredient_set-TOTAL_FORMS": "0",
+                    "recipeingredient_set-INITIAL_FORMS": "0",
+                    "recipetag_set-TOTAL_FORMS": "0",
+                    "recipetag_set-INITIAL_FORMS": "0",
+                    "recipeimage_set-TOTAL_FORMS": "2",
+                    "recipeimage_set-INITIAL_FORMS": "2",
+                    "recipeimage_set-0-id": kept.pk,
+                    "recipeimage_set-1-id": deleted.pk,
+                    "recipeimage_set-1-DELETE": "on",
+                },
+            )
+        wait_for_deletions()
+
+        self.assertEqual(list(RecipeImage.objects.filter(recipe=recipe)), [kept])
+        self.assertTrue(os.path.isfile(kept.image.path))
+        self.assertFalse(os.path.isfile(deleted.image.path))
+
+    def test_files_are_kept_on_rollback(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=10,
+            category="test",
+        )
+        recipe_image = add_image(recipe, "photo.jpg", make_image(10, 10))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    recipe.delete()
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        wait_for_deletions()
+
+        self.assertTrue(RecipeImage.objects.filter(pk=recipe_image.pk).exists())
+        self.assertTrue(os.path.isfile(recipe_image.image.path))
+
+    def test_recipe_save_does_not_read_images(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=10,
+            category="test",
+        )
+        add_image(recipe, "photo.jpg", make_image(10, 10))
+
+        recipe.name = "Test 2"
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save()
+
+        self.assertFalse(any("main_recipeimage" in q["sql"] for q in queries))
+
+    def test_image_access_is_checked_with_one_query(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=10,
+            category="test",
+        )
+        recipe_image = add_image(recipe, "photo.jpg", make_image(10, 10))
+        url = reverse(
+            "recipe-image-download", kwargs={"relative_path": recipe_image.image.name}
+        )
+
+        # session, user and the image
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        url = reverse(
+            "recipe-image-download", kwargs={"relative_path": "recipes/missing.jpg"}
+        )
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_equal_images_share_file(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=10,
+            category="test",
+        )
+        content = make_image(30, 30)
+        first = add_image(recipe, "first.jpg", content)
+        second = add_image(recipe, "second.JPG", content)
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^recipes/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+        with first.image.open("rb") as file:
+            self.assertEqual(file.read(), strip_metadata(ContentFile(content)).read())
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory), [os.path.basename(first.image.path)])
+
+    def test_file_deleted_during_upload_is_saved_again(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=10,
+            category="test",
+        )
+        content = make_image(40, 40)
+        first = add_image(recipe, "first.jpg", content)
+        with first.image.open("rb") as file:
+            stored = file.read()
+        utime = os.utime
+
+        def delete_and_touch(path, *args, **kwargs):
+            # deletion of the previous reference runs between the checks
+            os.remove(path)
+            return utime(path, *args, **kwargs)
+
+        with mock.patch("main.storage.os.utime", side_effect=delete_and_touch):
+            second = add_image(recipe, "second.jpg", content)
+
+        with second.image.open("rb") as file:
+            self.assertEqual(file.read(), stored)
+
+    def test_shared_file_is_deleted_with_last_reference(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=10,
+            category="test",
+        )
+        content = make_image(40, 40)
+        first = add_image(recipe, "first.jpg", content)
+        second = add_image(recipe, "second.jpg", content)
+        names = [first.image.name, *get_variant_names(first.image.name)]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        wait_for_deletions()
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        wait_for_deletions()
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+    @override_settings(RECIPE_MEDIA_DEDUP_GRACE=60 * 60)
+    def test_recently_uploaded_file_is_kept(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=10,
+            category="test",
+        )
+        recipe_image = add_image(recipe, "photo.jpg", make_image(50, 50))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe_image.delete()
+        wait_for_deletions()
+
+        self.assertTrue(os.path.isfile(recipe_image.image.path))
+
+    def test_shared_file_of_other_user(self):
+        other = User.objects.create_user(username="other", password="123456")
+        content = make_image(60, 60)
+        recipes = [
+            Recipe.objects.create(
+                user=user,
+                name="Test",
+                description="test recipe",
+                cooking_time=10,
+                category="test",
+            )
+            for user in [self.user, other]
+        ]
+        own, others = [add_image(recipe, "photo.jpg", content) for recipe in recipes]
+        url = reverse("recipe-image-download", kwargs={"relative_path": own.image.name})
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        own.delete()
+        # the file of another user is not told apart from a missing one
+        self.assertEqual(self.client.get(url).status_code, 404)
+        others.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GarbageCollectMediaTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.addClassCleanup(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+    def setUp(self):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=10,
+            category="test",
+        )
+        self.recipe_image = add_image(recipe, "photo.jpg", make_image(10, 10))
+
+        self.old_orphans = [
+            default_storage.save("recipes/orphan.jpg", ContentFile(b"orphan")),
+            default_storage.save(
+                get_variant_name("recipes/orphan.jpg", 320, "webp"),
+                ContentFile(b"orphan"),
+            ),
+            default_storage.save("recipes/nested/orphan.jpg", ContentFile(b"orphan")),
+        ]
+        self.new_orphan = default_storage.save("recipes/new.jpg", ContentFile(b"new"))
+
+        day_ago = time.time() - 25 * 60 * 60
+        for name in [
+            self.recipe_image.image.name,
+            *get_variant_names(self.recipe_image.image.name),
+            *self.old_orphans,
+        ]:
+            os.utime(default_storage.path(name), (day_ago, day_ago))
+
+    def gc_media(self, *args):
+        out = StringIO()
+        call_command("gc_media", *args, "--batch-size", "2", stdout=out)
+        return out.getvalue()
+
+    def test_dry_run(self):
+        output = self.gc_media("--dry-run")
+
+        for name in self.old_orphans:
+            self.assertIn(name, output)
+            self.assertTrue(default_storage.exists(name))
+        self.assertNotIn(self.new_orphan, output)
+
+    def test_files_used_after_scan_are_kept(self):
+        variant, uploaded = self.old_orphans[1:]
+        original = get_original_name(variant)
+
+        def get_referenced(names):
+            # the images are saved again after the first batch was scanned
+            if not RecipeImage.objects.filter(image=original).exists():
+                RecipeImage.objects.create(
+                    recipe=self.recipe_image.recipe, user=self.user, image=original
+                )
+                os.utime(default_storage.path(uploaded))
+            return set()
+
+        with mock.patch(
+            "main.management.commands.gc_media.get_referenced", get_referenced
+        ):
+            self.gc_media()
+
+        self.assertTrue(default_storage.exists(variant))
+        self.assertTrue(default_storage.exists(uploaded))
+
+    def test_old_orphans_are_deleted(self):
+        self.gc_media()
+
+        for name in self.old_orphans:
+            self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(self.new_orphan))
+        for name in [
+            self.recipe_image.image.name,
+            *get_variant_names(self.recipe_image.image.name),
+        ]:
+            self.assertTrue(default_storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RECIPE_MEDIA_SENDFILE="")
+class RecipeImageServingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.addClassCleanup(shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+        cls.recipe = Recipe.objects.create(
+            user=cls.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=30,
+            category="test",
+        )
+        cls.recipe_image = add_image(cls.recipe, "photo.jpg", make_image(64, 64))
+        with cls.recipe_image.image.open("rb") as file:
+            cls.image = file.read()
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+        self.url = reverse(
+            "recipe-image-download",
+            kwargs={"relative_path": self.recipe_image.image.name},
+        )
+
+    def test_image_is_shown_inline_and_cached_privately(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.image)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertTrue(response["Content-Disposition"].startswith("inline"))
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("max-age=", response["Cache-Control"])
+        self.assertIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_is_kept_on_upload_of_same_image(self):
+        etag = self.client.get(self.url)["ETag"]
+        os.utime(self.recipe_image.image.path, (0, 0))
+        add_image(self.recipe, "again.jpg", self.image)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=10-19")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.image[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(self.image)}")
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-5")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.image[-5:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.image)}-")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.image)}")
+
+    def test_range_of_touched_file(self):
+        etag = self.client.get(self.url)["ETag"]
+        os.utime(self.recipe_image.image.path, (0, 0))
+
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE=etag
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.image[10:20])
+
+    def test_range_with_date_validator(self):
+        response = self.client.get(
+            self.url,
+            HTTP_RANGE="bytes=10-19",
+            HTTP_IF_RANGE="Sat, 01 Jan 2000 00:00:00 GMT",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.image)
+
+    def test_range_of_changed_file(self):
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"stale"'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.image)
+
+    @override_settings(RECIPE_MEDIA_SENDFILE="x-accel-redirect")
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            f"/protected-media/{self.recipe_image.image.name}",
+        )
+        self.assertIn("ETag", response)
+
+    @override_settings(RECIPE_MEDIA_SENDFILE="x-sendfile")
+    def test_sendfile(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response["X-Sendfile"], self.recipe_image.image.path)
+
+    def test_missing_file(self):
+        path = self.recipe_image.image.path
+        os.rename(path, f"{path}.moved")
+        self.addCleanup(os.rename, f"{path}.moved", path)
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class RecipeDetailsViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+        cls.recipe = Recipe.objects.create(
+            user=cls.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=30,
+            category="test",
+            created_at=datetime.datetime(2025, 1, 13, 14, 30),
+            updated_at=datetime.datetime(2025, 1, 13, 15, 30),
+        )
+
+        cls.steps = [
+            RecipeStep.objects.create(
+                recipe=cls.recipe, step_number=0, step_description="step 1"
+            ),
+            RecipeStep.objects.create(
+                recipe=cls.recipe, step_number=1, step_description="step 2"
+            ),
+        ]
+
+        cls.ingredients = [
+            RecipeIngredient.objects.create(
+                recipe=cls.recipe, name="apple", volume=1.0, volume_measure="pcs"
+            ),
+            RecipeIngredient.objects.create(
+                recipe=cls.recipe, name="pear", volume=1.0, volume_measure="pcs"
+            ),
+        ]
+
+        cls.tags = [
+            RecipeTag.objects.create(recipe=cls.recipe, tag_text="tag 1"),
+            RecipeTag.objects.create(recipe=cls.recipe, tag_text="tag 2"),
+        ]
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+
+    def test_recipe_details_content(self):
+        response = self.client.get(
+            reverse("recipe_details", kwargs={"recipe_id": self.recipe.pk})
+        )
+
+        self.assertEqual(response.context["recipe"], self.recipe)
+        self.assertEqual(list(response.context["ingredients"]), self.ingredients)
+        self.assertEqual(list(response.context["steps"]), self.steps)
+        self.assertEqual(list(response.context["tags"]), self.tags)
+
+
+class RecipeViewsQueryBudgetTest(TestCase):
+    # session and user of the request, recipe with the ownership check,
+    # its ingredients, steps, tags and images
+    QUERY_BUDGET = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+        User.objects.create_user(username="other", password="123456")
+
+        seed_recipes(cls.user, 3)
+        cls.recipe = Recipe.objects.filter(user=cls.user).first()
+
+    def setUp(self):
+        # budgets are for pages that are not cached
+        cache.clear()
+        self.client.login(username="user", password="123456")
+
+    def test_query_budget(self):
+        for url_name in ["recipe_details", "edit_recipe", "download_recipe"]:
+            with self.subTest(url_name=url_name):
+                with self.assertNumQueries(self.QUERY_BUDGET):
+                    response = self.client.get(
+                        reverse(url_name, kwargs={"recipe_id": self.recipe.pk})
+                    )
+                    if response.streaming:
+                        b"".join(response.streaming_content)
+
+    def test_query_budget_does_not_depend_on_recipe_size(self):
+        for i in range(20):
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, name=f"extra {i}", volume=1, volume_measure="g"
+            )
+            RecipeStep.objects.create(
+                recipe=self.recipe, step_number=100 + i, step_description="extra"
+            )
+            RecipeTag.objects.create(recipe=self.recipe, tag_text=f"extra {i}")
+
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            self.client.get(
+                reverse("edit_recipe", kwargs={"recipe_id": self.recipe.pk})
+            )
+
+    def test_foreign_recipe_query_budget(self):
+        self.client.login(username="other", password="123456")
+
+        # children of a foreign recipe are not loaded
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse("recipe_details", kwargs={"recipe_id": self.recipe.pk})
+            )
+        self.assertTemplateUsed(response, "access_denied.html")
+
+
+class RecipePageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+        User.objects.create_user(username="other", password="123456")
+
+        cls.recipe = Recipe.objects.create(
+            user=cls.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=30,
+            category="test",
+        )
+        cls.ingredient = RecipeIngredient.objects.create(
+            recipe=cls.recipe, name="apple", volume=1.0, volume_measure="pcs"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username="user", password="123456")
+
+    def get_details(self):
+        return self.client.get(
+            reverse("recipe_details", kwargs={"recipe_id": self.recipe.pk})
+        )
+
+    def test_cache_hit_skips_recipe_queries(self):
+        first = self.get_details()
+
+        # only the session and the user of the request are loaded
+        with self.assertNumQueries(2):
+            second = self.get_details()
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(get_cache_stats()["hits"], 1)
+        self.assertEqual(get_cache_stats()["misses"], 1)
+
+    def test_child_change_invalidates_details(self):
+        self.get_details()
+
+        self.ingredient.name = "pear"
+        self.ingredient.save()
+
+        self.assertContains(self.get_details(), "pear")
+
+    def test_new_recipe_invalidates_list(self):
+        self.client.get(reverse("list_recipes"))
+
+        self.client.post(
+            reverse("create_recipe"),
+            data={
+                "name": "New",
+                "description": "new recipe",
+                "cooking_time": 10,
+                "category": "test",
+            },
+        )
+
+        self.assertContains(self.client.get(reverse("list_recipes")), "New")
+
+    def test_foreign_recipe_is_not_cached(self):
+        self.client.login(username="other", password="123456")
+        self.get_details()
+
+        self.client.login(username="user", password="123456")
+        self.assertContains(self.get_details(), "apple")
+        self.assertEqual(get_cache_stats()["misses"], 2)
+
+
+class RecipeDeletionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+        cls.recipe = Recipe.objects.create(
+            user=cls.user,
+            name="Test",
+            description="test recipe",
+            cooking_time=30,
+            category="test",
+            created_at=datetime.datetime(2025, 1, 13, 14, 30),
+            updated_at=datetime.datetime(2025, 1, 13, 15, 30),
+        )
+
+        cls.steps = [
+            RecipeStep.objects.create(
+                recipe=cls.recipe, step_number=0, step_description="step 1"
+            ),
+            RecipeStep.objects.create(
+                recipe=cls.recipe, step_number=1, step_description="step 2"
+            ),
+        ]
+
+        cls.ingredients = [
+            RecipeIngredient.objects.create(
+                recipe=cls.recipe, name="apple", volume=1.0, volume_measure="pcs"
+            ),
+            RecipeIngredient.objects.create(
+                recipe=cls.recipe, name="pear", volume=1.0, volume_measure="pcs"
+            ),
+        ]
+
+        cls.tags = [
+            RecipeTag.objects.create(recipe=cls.recipe, tag_text="tag 1"),
+            RecipeTag.objects.create(recipe=cls.recipe, tag_text="tag 2"),
+        ]
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+
+    def test_recipe_details_content(self):
+        recipe_pk = self.recipe.pk
+        steps_pks = [s.pk for s in self.steps]
+        ingredients_pks = [i.pk for i in self.ingredients]
+        tags_pks = [t.pk for t in self.tags]
+
+        response = self.client.post(
+            reverse("delete_recipe", kwargs={"recipe_id": self.recipe.pk})
+        )
+
+        with self.assertRaises(Recipe.DoesNotExist):
+            Recipe.objects.get(pk=recipe_pk)
+
+        with self.assertRaises(RecipeStep.DoesNotExist):
+            for pk in steps_pks:
+                RecipeStep.objects.get(pk=pk)
+
+        with self.assertRaises(RecipeIngredient.DoesNotExist):
+            for pk in ingredients_pks:
+                RecipeIngredient.objects.get(pk=pk)
+
+        with self.assertRaises(RecipeTag.DoesNotExist):
+            for pk in tags_pks:
                 RecipeTag.objects.get(pk=pk)
+
+
+class QueryPlanTest(TestCase):
+    """
+    Plans that the database chooses for the queries of the hot views, on
+    analyzed tables of realistic size, must contain neither sequential
+    scans nor explicit sorts of the recipe tables.
+    """
+
+    SORTING_PARAMS = ["name", "cooking_time", "category", "created_at", "updated_at"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+        # the user has a small part of the recipes, like every user of the site
+        seed_recipes(cls.user, 500)
+        seed_users(19, 500, seed=1)
+        seed_images(Recipe.objects.order_by("id"))
+        # the checked recipe has images, so their query returns rows
+        cls.recipe = Recipe.objects.filter(
+            user=cls.user, recipeimage__isnull=False
+        ).first()
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        # plans are checked for pages that are not cached
+        cache.clear()
+        self.client.login(username="user", password="123456")
+
+    def get_plans(self, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data=data)
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                # tables of sessions and users are not checked
+                if (
+                    not query["sql"].startswith("SELECT")
+                    or '"main_' not in query["sql"]
+                ):
+                    continue
+                if connection.vendor == "postgresql":
+                    cursor.execute(f"EXPLAIN {query['sql']}")
+                else:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                plans.append(
+                    (query["sql"], "\n".join(str(row[-1]) for row in cursor.fetchall()))
+                )
+        return response, plans
+
+    def assertIndexedPlans(self, plans, sorted_results=False):
+        """
+        Check that plans use indexes, sorted_results allows sorting of the
+        results, which can not be ordered by an index, like ranks of search
+        """
+        if connection.vendor == "postgresql":
+            forbidden = r"Seq Scan on main_\w+"
+            if not sorted_results:
+                forbidden += r"|Sort\b"
+        else:
+            forbidden = r"\bSCAN\b"
+            if not sorted_results:
+                forbidden += r"|TEMP B-TREE"
+
+        for sql, plan in plans:
+            with self.subTest(sql=sql):
+                self.assertIsNone(re.search(forbidden, plan), plan)
+
+    def test_recipe_list_plans(self):
+        for sorting_param in self.SORTING_PARAMS:
+            for is_descending in ["", "on"]:
+                with self.subTest(
+                    sorting_param=sorting_param, is_descending=is_descending
+                ):
+                    params = {"ordering": sorting_param, "is_descending": is_descending}
+                    response, plans = self.get_plans(reverse("list_recipes"), params)
+                    self.assertIndexedPlans(plans)
+
+                    page = response.context["page_obj"]
+                    for cursor in [page.next_cursor, page.last_cursor]:
+                        _, plans = self.get_plans(
+                            reverse("list_recipes"), {**params, "cursor": cursor}
+                        )
+                        self.assertIndexedPlans(plans)
+
+    def test_search_plans(self):
+        for fields in [["search_in_names"], list(SEARCH_FORM_FIELDS)]:
+            with self.subTest(fields=fields):
+                params = {"search_string": "борщ", **dict.fromkeys(fields, "on")}
+                response, plans = self.get_plans(reverse("search_results"), params)
+                self.assertTrue(response.context["page_obj"].has_next())
+                self.assertIndexedPlans(plans, sorted_results=True)
+
+                _, plans = self.get_plans(
+                    reverse("search_results"),
+                    {**params, "cursor": response.context["page_obj"].next_cursor},
+                )
+                self.assertIndexedPlans(plans, sorted_results=True)
+
+    def test_recipe_views_plans(self):
+        for url_name in ["recipe_details", "edit_recipe", "download_recipe"]:
+            with self.subTest(url_name=url_name):
+                _, plans = self.get_plans(
+                    reverse(url_name, kwargs={"recipe_id": self.recipe.pk})
+                )
+                self.assertIndexedPlans(plans)
+
+
+class ViewBenchmarkTest(TestCase):
+    def test_seeded_data_is_deterministic(self):
+        def get_recipes(user):
+            return [
+                (
+                    recipe.name,
+                    recipe.cooking_time,
+                    len(recipe.recipeingredient_set.all()),
+                )
+                for recipe in Recipe.objects.filter(user=user)
+                .prefetch_related("recipeingredient_set")
+                .order_by("id")
+            ]
+
+        first, second = seed_users(2, 5)
+        self.assertEqual(User.objects.filter(username__startswith="seed-0-").count(), 2)
+        self.assertEqual(len(get_recipes(first)), 5)
+        self.assertNotEqual(get_recipes(first), get_recipes(second))
+
+        with transaction.atomic():
+            recipes = get_recipes(first)
+            Recipe.objects.all().delete()
+            seed_recipes(first, 5)
+            self.assertEqual(get_recipes(first), recipes)
+
+    def test_failed_edit_is_reported(self):
+        with mock.patch(
+            "main.management.commands.benchmark_views.get_edit_data",
+            return_value={"name": ""},
+        ), self.assertRaisesMessage(RuntimeError, "was not saved"):
+            call_command(
+                "benchmark_views",
+                "--users=1",
+                "--recipes=1",
+                "--requests=2",
+                "--warmup=1",
+                "--pages=edit_recipe_post",
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+
+    def test_benchmark_results(self):
+        # entries of the default cache, which may be shared, are kept
+        cache.set("benchmark-test", "kept")
+        self.addCleanup(cache.delete, "benchmark-test")
+        out = StringIO()
+        call_command(
+            "benchmark_views",
+            "--users=2",
+            "--recipes=3",
+            "--requests=2",
+            "--warmup=1",
+            stdout=out,
+            stderr=StringIO(),
+        )
+
+        results = json.loads(out.getvalue())
+        self.assertEqual(
+            set(results["pages"]),
+            {
+                "recipe_list",
+                "search_results",
+                "recipe_details",
+                "edit_recipe",
+                "edit_recipe_post",
+                "download_recipe",
+            },
+        )
+        for page in results["pages"].values():
+            self.assertEqual(page["requests"], 2)
+            self.assertLessEqual(page["p50_ms"], page["p99_ms"])
+            self.assertGreater(page["queries"]["max"], 0)
+            self.assertGreater(page["peak_memory_kib"], 0)
+        # seeded data is rolled back
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self.assertEqual(cache.get("benchmark-test"), "kept")
+
+
+GENERATED_RECIPE = {
+    "name": "Згенерований суп",
+    "description": "Суп з овочів",
+    "cooking_time_in_minutes": 40,
+    "category": "Супи",
+    "steps": ["Нарізати овочі", "Зварити"],
+    "ingredients": [{"name": "Морква", "volume": 2, "volume_measure": "шт"}],
+}
+
+
+@override_settings(RECIPE_GENERATION_STREAM=False)
+class GenerationJobTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+        User.objects.create_user(username="other", password="123456")
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+
+    def create_job(self):
+        response = self.client.post(
+            reverse("generate_recipe"),
+            {"ingredients_description": "овочі", "recipe_description": "суп"},
+        )
+        job = GenerationJob.objects.latest("id")
+        self.assertRedirects(
+            response, reverse("generation_job", kwargs={"job_id": job.pk})
+        )
+        return job
+
+    @mock.patch("main.generation.get_generated_recipe")
+    def test_generation_does_not_wait_for_model(self, get_generated_recipe):
+        job = self.create_job()
+
+        get_generated_recipe.assert_not_called()
+        self.assertEqual(job.status, GenerationJob.Status.PENDING)
+        response = self.client.get(reverse("generation_job", kwargs={"job_id": job.pk}))
+        self.assertContains(response, "Рецепт генерується")
+        self.assertNotContains(response, "Редагування рецепту")
+
+    @mock.patch("main.generation.get_generated_recipe", return_value=GENERATED_RECIPE)
+    def test_result_is_rendered_from_job(self, get_generated_recipe):
+        job = self.create_job()
+
+        self.assertTrue(run_next_job())
+        self.assertFalse(run_next_job())
+
+        get_generated_recipe.assert_called_once_with("овочі", "суп")
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.Status.DONE)
+        response = self.client.get(reverse("generation_job", kwargs={"job_id": job.pk}))
+        self.assertTemplateUsed(response, "main/generating_recipe_result.html")
+        self.assertContains(response, "Згенерований суп")
+        self.assertContains(response, "Нарізати овочі")
+
+    @mock.patch("main.generation.get_generated_recipe", side_effect=ValueError)
+    def test_failed_job(self, get_generated_recipe):
+        job = self.create_job()
+
+        with self.assertLogs("main.generation", "ERROR"):
+            run_next_job()
+
+        response = self.client.get(reverse("generation_job", kwargs={"job_id": job.pk}))
+        self.assertTemplateUsed(response, "main/generating_recipe_input.html")
+        self.assertContains(response, "Не вдалося згенерувати рецепт")
+        self.assertContains(response, "овочі")
+
+    def test_job_is_claimed_once(self):
+        job = self.create_job()
+
+        self.assertEqual(claim_job(), job)
+        self.assertIsNone(claim_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.Status.RUNNING)
+        self.assertEqual(job.attempts, 1)
+
+    @override_settings(
+        RECIPE_GENERATION_JOB_TIMEOUT=0, RECIPE_GENERATION_MAX_ATTEMPTS=2
+    )
+    def test_stale_job_is_retried(self):
+        job = self.create_job()
+
+        claim_job()
+        self.assertEqual(recover_stale_jobs(), (1, 0))
+        self.assertEqual(claim_job(), job)
+        self.assertEqual(recover_stale_jobs(), (0, 1))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.Status.FAILED)
+
+    @override_settings(RECIPE_GENERATION_JOB_TIMEOUT=0)
+    @mock.patch("main.generation.get_generated_recipe", return_value=GENERATED_RECIPE)
+    def test_result_of_stale_attempt_is_discarded(self, get_generated_recipe):
+        self.create_job()
+        stale = claim_job()
+        recover_stale_jobs()
+        claim_job()
+
+        with self.assertLogs("main.generation", "WARNING"):
+            run_job(stale)
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, GenerationJob.Status.RUNNING)
+        self.assertEqual(stale.attempts, 2)
+        self.assertIsNone(stale.result)
+
+    def test_status_and_events(self):
+        job = self.create_job()
+        status_url = reverse("generation_job_status", kwargs={"job_id": job.pk})
+
+        self.assertEqual(self.client.get(status_url).json()["status"], "pending")
+
+        job.status = GenerationJob.Status.DONE
+        job.save()
+        with self.settings(RECIPE_GENERATION_EVENTS=True):
+            response = self.client.get(
+                reverse("generation_job_events", kwargs={"job_id": job.pk})
+            )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = b"".join(response.streaming_content).decode()
+        self.assertIn('event: status\ndata: {"status": "done", "error": ""', events)
+
+        self.client.login(username="other", password="123456")
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+
+@override_settings(
+    RECIPE_GENERATION_BACKEND="main.generation_backends.StubBackend",
+    RECIPE_GENERATION_STUB_CHUNK_DELAY=0,
+    RECIPE_GENERATION_STREAM=True,
+)
+class GenerationStreamingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+
+    def test_partial_json_parser(self):
+        text = json.dumps(
+            {"name": 'Суп "1", {новий}', "time": 10, "steps": ["а", "б"]}, indent=2
+        )
+        parser = PartialJSONParser()
+        received = [parser.feed(char) for char in text]
+
+        self.assertEqual(
+            [recipe for recipe in received if recipe is not None],
+            [
+                {"name": 'Суп "1", {новий}'},
+                {"name": 'Суп "1", {новий}', "time": 10},
+                {"name": 'Суп "1", {новий}', "time": 10, "steps": ["а"]},
+                {"name": 'Суп "1", {новий}', "time": 10, "steps": ["а", "б"]},
+            ],
+        )
+
+    def test_recipe_is_streamed_by_fields(self):
+        recipes = list(stream_generated_recipe("овочі", "суп"))
+
+        self.assertEqual(recipes[0], {"name": STUB_RECIPE["name"]})
+        self.assertEqual(list(recipes[1]), ["name", "description"])
+        self.assertEqual(recipes[-1], STUB_RECIPE)
+        # every step and ingredient is sent as soon as it is complete
+        self.assertGreater(
+            len(recipes),
+            4 + len(STUB_RECIPE["steps"]) + len(STUB_RECIPE["ingredients"]),
+        )
+
+    def test_partial_recipe_is_sent_in_events(self):
+        job = GenerationJob.objects.create(
+            user=self.user,
+            ingredients_description="овочі",
+            recipe_description="суп",
+            status=GenerationJob.Status.RUNNING,
+            result={"name": "Овочевий суп", "steps": ["Наріжте овочі кубиками."]},
+        )
+
+        with self.settings(
+            RECIPE_GENERATION_EVENTS=True, RECIPE_GENERATION_EVENTS_TIMEOUT=0
+        ):
+            response = self.client.get(
+                reverse("generation_job_events", kwargs={"job_id": job.pk})
+            )
+            events = b"".join(response.streaming_content).decode()
+        data = json.loads(events.split("data: ")[1])
+        self.assertEqual(data["recipe"], job.result)
+
+        response = self.client.get(reverse("generation_job", kwargs={"job_id": job.pk}))
+        self.assertContains(response, "<li>Наріжте овочі кубиками.</li>", html=True)
+
+    def test_events_are_disabled_by_default(self):
+        job = GenerationJob.objects.create(
+            user=self.user,
+            ingredients_description="овочі",
+            recipe_description="суп",
+            status=GenerationJob.Status.RUNNING,
+        )
+
+        response = self.client.get(reverse("generation_job", kwargs={"job_id": job.pk}))
+        self.assertContains(
+            response, reverse("generation_job_status", kwargs={"job_id": job.pk})
+        )
+        self.assertNotContains(response, "data-events-url")
+        response = self.client.get(
+            reverse("generation_job_events", kwargs={"job_id": job.pk})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_streamed_job_is_saved_complete(self):
+        job = GenerationJob.objects.create(
+            user=self.user, ingredients_description="овочі", recipe_description="суп"
+        )
+
+        run_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.Status.DONE)
+        self.assertEqual(job.result, STUB_RECIPE)
+
+
+@override_settings(RECIPE_GENERATION_STREAM=False, RECIPE_GENERATION_CACHE_SIZE=2)
+class GenerationCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username="user", password="123456")
+
+    def generate(self, ingredients="овочі", description="суп", **data):
+        self.client.post(
+            reverse("generate_recipe"),
+            {
+                "ingredients_description": ingredients,
+                "recipe_description": description,
+                **data,
+            },
+        )
+        return GenerationJob.objects.latest("id")
+
+    @mock.patch("main.generation.get_generated_recipe", return_value=GENERATED_RECIPE)
+    def test_equal_prompt_is_answered_from_cache(self, get_generated_recipe):
+        self.generate()
+        run_next_job()
+
+        job = self.generate("  Овочі ", "СУП")
+
+        self.assertEqual(job.status, GenerationJob.Status.DONE)
+        self.assertEqual(job.result, GENERATED_RECIPE)
+        get_generated_recipe.assert_called_once()
+        self.assertEqual(GenerationCacheEntry.objects.get().hits, 1)
+
+        self.assertEqual(
+            get_generation_cache_stats(),
+            {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1},
+        )
+
+    @mock.patch("main.generation.get_generated_recipe", return_value=GENERATED_RECIPE)
+    def test_regeneration_skips_cache(self, get_generated_recipe):
+        self.generate()
+        run_next_job()
+
+        job = self.generate(regenerate="1")
+
+        self.assertEqual(job.status, GenerationJob.Status.PENDING)
+
+    def test_expired_recipe_is_not_used(self):
+        cache_recipe("овочі", "суп", GENERATED_RECIPE)
+        GenerationCacheEntry.objects.update(
+            created_at=timezone.now() - datetime.timedelta(days=30)
+        )
+
+        self.assertIsNone(get_cached_recipe("овочі", "суп"))
+        self.assertEqual(delete_expired_recipes(), 1)
+
+    def test_least_recently_used_recipe_is_evicted(self):
+        cache_recipe("перший", "суп", GENERATED_RECIPE)
+        cache_recipe("другий", "суп", GENERATED_RECIPE)
+        self.assertIsNotNone(get_cached_recipe("перший", "суп"))
+
+        cache_recipe("третій", "суп", GENERATED_RECIPE)
+
+        self.assertIsNotNone(get_cached_recipe("перший", "суп"))
+        self.assertIsNone(get_cached_recipe("другий", "суп"))
+        self.assertIsNotNone(get_cached_recipe("третій", "суп"))
+
+    def test_key_depends_on_model(self):
+        cache_recipe("овочі", "суп", GENERATED_RECIPE)
+
+        with self.settings(
+            RECIPE_GENERATION_BACKEND="main.generation_backends.StubBackend"
+        ):
+            self.assertIsNone(get_cached_recipe("овочі", "суп"))
+
+
+@override_settings(
+    RECIPE_GENERATION_BACKEND="main.generation_backends.StubBackend",
+    RECIPE_GENERATION_STUB_CHUNK_DELAY=0,
+    RECIPE_GENERATION_RETRIES=2,
+    RECIPE_GENERATION_RETRY_BACKOFF=0,
+)
+class GenerationBackendTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username="user", password="123456")
+        self.breaker = CircuitBreaker("test", threshold=3, cooldown=60)
+
+    def test_backend_is_reused(self):
+        self.assertIs(get_backend(), get_backend())
+        self.assertEqual(get_backend().name, "stub")
+
+        with self.settings(RECIPE_GENERATION_TIMEOUT=5):
+            self.assertEqual(get_backend().timeout, 5)
+
+    def test_call_limit_counts_slots_of_other_processes(self):
+        limit = CallLimit("test", size=2, ttl=60)
+        # slot taken by a call of another process
+        cache.add(limit.keys[0], "other", 60)
+
+        with limit.slot():
+            with self.assertRaises(GenerationUnavailable):
+                # the call does not wait, as the time to wait is over
+                CallLimit("test", size=2, ttl=0).acquire()
+        self.assertEqual(cache.get(limit.keys[0]), "other")
+        self.assertIsNone(cache.get(limit.keys[1]))
+
+    def test_call_limit_slot_expires(self):
+        limit = CallLimit("test", size=1, ttl=60)
+        key, token = limit.acquire()
+        cache.set(key, "next call", 60)
+
+        # the slot expired and was taken by another call, which keeps it
+        limit.release(key, token)
+        self.assertEqual(cache.get(key), "next call")
+
+    def test_transient_errors_are_retried(self):
+        call = mock.Mock(side_effect=[TransientGenerationError, "recipe"])
+
+        self.assertEqual(call_with_retries(self.breaker, call), "recipe")
+        self.assertEqual(call.call_count, 2)
+        self.assertFalse(cache.get(self.breaker.failures_key))
+
+    def test_other_errors_are_not_retried(self):
+        call = mock.Mock(side_effect=ValueError)
+
+        with self.assertRaises(ValueError):
+            call_with_retries(self.breaker, call)
+        self.assertEqual(call.call_count, 1)
+
+    def test_stream_is_not_retried_after_first_chunk(self):
+        def stream():
+            yield "{"
+            raise TransientGenerationError
+
+        with self.assertRaises(TransientGenerationError):
+            list(stream_with_retries(self.breaker, stream))
+
+    def test_breaker_fails_fast(self):
+        call = mock.Mock(side_effect=TransientGenerationError)
+
+        with self.assertRaises(TransientGenerationError):
+            call_with_retries(self.breaker, call)
+        with self.assertRaises(GenerationUnavailable):
+            call_with_retries(self.breaker, call)
+        self.assertEqual(call.call_count, 3)
+
+    def test_input_page_shows_unavailability(self):
+        breaker = CircuitBreaker("stub", threshold=1, cooldown=60)
+        breaker.record_failure()
+
+        response = self.client.post(
+            reverse("generate_recipe"),
+            {"ingredients_description": "овочі", "recipe_description": "суп"},
+        )
+
+        self.assertContains(response, "тимчасово недоступне")
+        self.assertFalse(GenerationJob.objects.exists())
+
+    def test_failures_of_worker_make_generation_unavailable(self):
+        job = GenerationJob.objects.create(
+            user=self.user, ingredients_description="овочі", recipe_description="суп"
+        )
+
+        with self.settings(RECIPE_GENERATION_BREAKER_THRESHOLD=1), mock.patch.object(
+            StubBackend, "stream", side_effect=ValueError("invalid answer")
+        ):
+            with self.assertLogs("main.generation", "ERROR"):
+                run_next_job()
+            response = self.client.post(
+                reverse("generate_recipe"),
+                {"ingredients_description": "м'ясо", "recipe_description": "рагу"},
+            )
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.Status.FAILED)
+        self.assertContains(response, "тимчасово недоступне")
+
+    def test_process_cache_is_reported(self):
+        self.assertEqual(
+            [warning.id for warning in check_shared_cache(None)], ["main.W001"]
+        )
+        redis_cache = {
+            "default": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}
+        }
+        with self.settings(CACHES=redis_cache):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_stub_backend_is_deterministic(self):
+        recipes = [list(stream_generated_recipe("овочі", "суп")) for _ in range(2)]
+
+        self.assertEqual(recipes[0], recipes[1])
+        self.assertEqual(recipes[0][-1], STUB_RECIPE)
+
+
+@override_settings(
+    RECIPE_GENERATION_BACKEND="main.generation_backends.StubBackend",
+    RECIPE_GENERATION_STUB_CHUNK_DELAY=0,
+    RECIPE_GENERATION_CONCURRENCY=2,
+)
+class GenerationVariantsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username="user", password="123456")
+
+    def generate(self, variants):
+        self.client.post(
+            reverse("generate_recipe"),
+            {
+                "ingredients_description": "овочі",
+                "recipe_description": "суп",
+                "variants": variants,
+            },
+        )
+        run_next_job()
+        job = GenerationJob.objects.latest("id")
+        return job
+
+    def save(self, job, variants):
+        return self.client.post(
+            reverse("save_generated_recipes", kwargs={"job_id": job.pk}),
+            {"variant": variants},
+        )
+
+    def test_variants_are_shown_on_one_page(self):
+        job = self.generate(3)
+
+        self.assertEqual(job.status, GenerationJob.Status.DONE)
+        self.assertEqual(job.result, [STUB_RECIPE] * 3)
+        response = self.client.get(reverse("generation_job", kwargs={"job_id": job.pk}))
+        self.assertTemplateUsed(response, "main/generating_recipe_variants.html")
+        self.assertContains(response, 'name="variant"', count=3)
+
+    def test_calls_run_concurrently_within_limit(self):
+        lock = threading.Lock()
+        calls = {"running": 0, "most": 0}
+
+        def generate(prompt):
+            with lock:
+                calls["running"] += 1
+                calls["most"] = max(calls["most"], calls["running"])
+            time.sleep(0.05)
+            with lock:
+                calls["running"] -= 1
+            return json.dumps(STUB_RECIPE)
+
+        with mock.patch.object(get_backend(), "generate", side_effect=generate):
+            job = self.generate(5)
+
+        self.assertEqual(len(job.result), 5)
+        self.assertEqual(calls["most"], 2)
+
+    def test_failed_variants_are_left_out(self):
+        with mock.patch(
+            "main.generation.get_generated_recipe",
+            side_effect=[STUB_RECIPE, ValueError, STUB_RECIPE],
+        ):
+            with self.assertLogs("main.generation", "WARNING"):
+                job = self.generate(3)
+
+        self.assertEqual(job.status, GenerationJob.Status.DONE)
+        self.assertEqual(len(job.result), 2)
+
+    def test_chosen_variants_are_saved(self):
+        job = self.generate(3)
+
+        response = self.save(job, ["0", "2"])
+
+        self.assertRedirects(response, reverse("list_recipes"))
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(len(recipes), 2)
+        for recipe in recipes:
+            self.assertEqual(recipe.name, STUB_RECIPE["name"])
+            self.assertEqual(recipe.recipestep_set.count(), 3)
+            self.assertEqual(recipe.recipeingredient_set.count(), 3)
+            self.assertTrue(RecipeSearchDocument.objects.filter(recipe=recipe).exists())
+
+    def test_variants_are_saved_once(self):
+        job = self.generate(2)
+
+        self.assertRedirects(self.save(job, ["0", "1"]), reverse("list_recipes"))
+        self.assertEqual(self.save(job, ["0", "1"]).status_code, 404)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(GenerationJob.objects.filter(pk=job.pk).exists())
+
+    def test_variants_are_saved_together(self):
+        job = self.generate(2)
+        job.result[1]["name"] = ""
+        job.save()
+
+        self.assertContains(self.save(job, ["0", "1"]), "Помилка в згенерованому")
+        self.assertContains(self.save(job, []), "Оберіть хоча б один рецепт")
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecipeImportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+
+    def setUp(self):
+        self.client.login(username="user", password="123456")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def make_recipe(self, name, **fields):
+        return {
+            "name": name,
+            "description": "Опис",
+            "cooking_time_in_minutes": 30,
+            "category": "Супи",
+            "steps": ["Крок 1", "Крок 2"],
+            "ingredients": [{"name": "Вода", "volume": 1.5, "volume_measure": "л"}],
+            "tags": ["швидко", "швидко", "пісне"],
+            **fields,
+        }
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def write_ndjson(self, recipes):
+        return self.write_file(
+            "recipes.ndjson",
+            "".join(
+                json.dumps(recipe, ensure_ascii=False) + "\n" for recipe in recipes
+            ),
+        )
+
+    def import_file(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command(
+            "import_recipes", path, "--user", "user", *args, stdout=out, stderr=err
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_read_json_streams_array(self):
+        recipes = [self.make_recipe(f"Рецепт {i}") for i in range(5)]
+        text = json.dumps(recipes, ensure_ascii=False, indent=2)
+
+        self.assertEqual(list(read_json(StringIO(text), chunk_size=7)), recipes)
+        self.assertEqual(
+            list(read_json(StringIO(json.dumps(recipes[0])))), [recipes[0]]
+        )
+
+    def test_read_json_values_cut_by_chunks(self):
+        # a number cut by the end of a chunk is not read as two numbers
+        for chunk_size in range(1, 5):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    list(read_json(StringIO("  [123, 456] "), chunk_size=chunk_size)),
+                    [123, 456],
+                )
+
+    def test_read_json_rejects_malformed_arrays(self):
+        for text in ["[{} {}]", "[,,{}]", "[{},]", "[{},,{}]", "[{}"]:
+            with self.subTest(text=text), self.assertRaises(RecipeImportError):
+                list(read_json(StringIO(text), chunk_size=2))
+
+    def test_read_json_limits_recipe_size(self):
+        recipe = json.dumps({"name": "x" * 1000})
+        for text in [f"[{recipe}]", recipe, "[" + "x" * 1000]:
+            with self.subTest(text=text[:10]), self.assertRaisesMessage(
+                RecipeImportError, "довший за 100 символів"
+            ):
+                list(read_json(StringIO(text), chunk_size=10, max_recipe_size=100))
+
+    def test_truncated_json_is_rejected(self):
+        path = self.write_file("recipes.json", json.dumps([self.make_recipe("a")])[:-5])
+
+        with self.assertRaises(CommandError):
+            self.import_file(path)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_recipes_are_imported(self):
+        path = self.write_ndjson(
+            [
+                self.make_recipe("Борщ"),
+                self.make_recipe("", steps=[]),
+                self.make_recipe("Юшка", ingredients="Вода"),
+                self.make_recipe("Куліш"),
+            ]
+        )
+
+        out, err = self.import_file(path, "--batch-size", "3")
+
+        self.assertIn("Imported 2 recipes, 2 failed", out)
+        self.assertIn("Recipe 2: name", err)
+        self.assertIn("Recipe 3: ingredients", err)
+        recipes = Recipe.objects.filter(user=self.user).order_by("id")
+        self.assertEqual([recipe.name for recipe in recipes], ["Борщ", "Куліш"])
+        recipe = recipes[0]
+        self.assertEqual(
+            list(recipe.recipestep_set.values_list("step_number", flat=True)),
+            [0, STEP_NUMBER_GAP],
+        )
+        self.assertEqual(recipe.recipeingredient_set.get().volume, 1.5)
+        self.assertEqual(
+            sorted(recipe.recipetag_set.values_list("tag_text", flat=True)),
+            ["пісне", "швидко"],
+        )
+        self.assertTrue(RecipeSearchDocument.objects.filter(recipe=recipe).exists())
+
+    def test_import_resumes_from_checkpoint(self):
+        path = self.write_ndjson([self.make_recipe(f"Рецепт {i}") for i in range(5)])
+        ImportCheckpoint.objects.create(name="import", input=path, processed=2)
+
+        out, _ = self.import_file(path, "--batch-size", "2", "--checkpoint", "import")
+
+        self.assertIn("Resuming after 2", out)
+        self.assertEqual(
+            list(Recipe.objects.order_by("id").values_list("name", flat=True)),
+            ["Рецепт 2", "Рецепт 3", "Рецепт 4"],
+        )
+        self.assertEqual(ImportCheckpoint.objects.get(name="import").processed, 5)
+
+        # a finished import is not repeated
+        self.import_file(path, "--checkpoint", "import")
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    def test_checkpoint_is_written_with_batch(self):
+        path = self.write_ndjson([self.make_recipe(f"Рецепт {i}") for i in range(3)])
+
+        with mock.patch(
+            "main.import_utils.invalidate_user_cache", side_effect=RuntimeError
+        ):
+            # the import stops after the first batch is committed
+            with self.assertRaises(RuntimeError):
+                self.import_file(path, "--batch-size", "2", "--checkpoint", "import")
+        self.assertEqual(ImportCheckpoint.objects.get(name="import").processed, 2)
+
+        with mock.patch(
+            "main.import_utils.RecipeSearchDocument.refresh", side_effect=RuntimeError
+        ):
+            # the failed batch is rolled back with its checkpoint
+            with self.assertRaises(RuntimeError):
+                self.import_file(path, "--checkpoint", "import")
+        self.assertEqual(ImportCheckpoint.objects.get(name="import").processed, 2)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+        self.import_file(path, "--checkpoint", "import")
+        self.assertEqual(Recipe.objects.count(), 3)
+
+    def test_checkpoint_of_other_file(self):
+        path = self.write_ndjson([self.make_recipe("Борщ")])
+        ImportCheckpoint.objects.create(name="import", input="/other.ndjson")
+
+        with self.assertRaises(CommandError):
+            self.import_file(path, "--checkpoint", "import")
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_exported_csv_is_imported(self):
+        other_user = User.objects.create_user(username="other", password="123456")
+        seed_recipes(other_user, 3)
+        recipes = list(iter_recipes_with_children(Recipe.objects.order_by("id")))
+        path = self.write_file(
+            "recipes.csv", "".join(get_exporter("csv").export_many(recipes))
+        )
+
+        self.import_file(path)
+
+        imported = list(
+            iter_recipes_with_children(
+                Recipe.objects.filter(user=self.user).order_by("id")
+            )
+        )
+        self.assertEqual(
+            [recipe_to_dict(*recipe) for recipe in imported],
+            [recipe_to_dict(*recipe) for recipe in recipes],
+        )
+
+    def test_upload(self):
+        content = json.dumps(
+            [
+                self.make_recipe("Борщ"),
+                self.make_recipe("Юшка", cooking_time_in_minutes=-1),
+            ],
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+        response = self.client.post(
+            reverse("import_recipes"),
+            {"file": SimpleUploadedFile("recipes.json", content)},
+        )
+
+        self.assertContains(response, "Імпортовано рецептів: 1, з помилками: 1")
+        self.assertContains(response, "Рецепт 2: cooking_time")
+        self.assertEqual(Recipe.objects.get(user=self.user).name, "Борщ")
+
+    def test_upload_of_malformed_csv(self):
+        content = 'name,description\n"Борщ,не закрито\n'.encode("utf-8")
+
+        response = self.client.post(
+            reverse("import_recipes"),
+            {"file": SimpleUploadedFile("recipes.csv", content)},
+        )
+
+        self.assertContains(response, "Не вдалося прочитати файл: unexpected end")
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_IMPORT_UPLOAD_MAX_SIZE=100)
+    def test_upload_size_is_limited(self):
+        content = json.dumps([self.make_recipe("Борщ")]).encode("utf-8")
+
+        response = self.client.post(
+            reverse("import_recipes"),
+            {"file": SimpleUploadedFile("recipes.json", content)},
+        )
+
+        self.assertContains(response, "Файл більший за")
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_IMPORT_UPLOAD_MAX_RECIPES=2)
+    def test_upload_recipes_are_limited(self):
+        content = json.dumps(
+            [self.make_recipe(f"Рецепт {i}") for i in range(3)]
+        ).encode("utf-8")
+
+        response = self.client.post(
+            reverse("import_recipes"),
+            {"file": SimpleUploadedFile("recipes.json", content)},
+        )
+
+        self.assertContains(response, "Файл містить більше 2 рецептів")
+        self.assertFalse(Recipe.objects.exists())
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+        User.objects.create_user(username="staff", password="123456", is_staff=True)
+        seed_recipes(cls.user, 3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username="staff", password="123456")
+
+    def get_metrics(self, **headers):
+        response = self.client.get(reverse("metrics"), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith("#"):
+                series, value = line.rsplit(" ", 1)
+                samples[series] = float(value)
+        return samples
+
+    def test_requests_are_recorded(self):
+        before = self.get_metrics()
+        self.client.login(username="user", password="123456")
+        self.client.get(reverse("list_recipes"))
+        self.client.get(reverse("list_recipes"))
+        self.client.login(username="staff", password="123456")
+
+        after = self.get_metrics()
+
+        def change(series):
+            return after.get(series, 0) - before.get(series, 0)
+
+        requests = (
+            'recipes_http_requests_total{method="GET",status="200",view="list_recipes"}'
+        )
+        self.assertEqual(change(requests), 2)
+        self.assertEqual(
+            change('recipes_http_request_duration_seconds_count{view="list_recipes"}'),
+            2,
+        )
+        self.assertEqual(
+            change(
+                'recipes_http_request_duration_seconds_bucket{view="list_recipes",le="+Inf"}'
+            ),
+            2,
+        )
+        self.assertGreater(
+            change('recipes_db_queries_per_request_sum{view="list_recipes"}'), 0
+        )
+        self.assertGreater(
+            change('recipes_db_query_duration_seconds_total{view="list_recipes"}'), 0
+        )
+        self.assertGreater(
+            change(
+                'recipes_template_render_duration_seconds_total{view="list_recipes"}'
+            ),
+            0,
+        )
+        # the table of the second request is cached
+        self.assertEqual(change('recipes_cache_events_total{event="hits"}'), 1)
+        self.assertEqual(change('recipes_cache_events_total{event="misses"}'), 1)
+
+    @override_settings(
+        RECIPE_GENERATION_BACKEND="main.generation_backends.StubBackend",
+        RECIPE_GENERATION_STUB_CHUNK_DELAY=0,
+    )
+    def test_generation_calls_are_recorded(self):
+        series = (
+            "recipes_generation_call_duration_seconds_count"
+            '{backend="stub",kind="generate",outcome="success"}'
+        )
+        before = self.get_metrics().get(series, 0)
+
+        get_generated_recipe("овочі", "суп")
+
+        self.assertEqual(self.get_metrics()[series], before + 1)
+
+    def test_metrics_of_processes_are_merged(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, "1-other.json"), "w") as file:
+            json.dump(
+                [
+                    ["recipes_cache_events_total", [["event", "worker"]], 3],
+                    [
+                        "recipes_http_request_duration_seconds",
+                        [["view", "worker"]],
+                        [[1] + [0] * len(DURATION_BUCKETS), 0.001, 1],
+                    ],
+                ],
+                file,
+            )
+
+        with override_settings(RECIPE_METRICS_DIR=directory):
+            samples = self.get_metrics()
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+        self.assertEqual(samples['recipes_cache_events_total{event="worker"}'], 3)
+        self.assertEqual(
+            samples[
+                'recipes_http_request_duration_seconds_bucket{view="worker",le="60"}'
+            ],
+            1,
+        )
+
+    def test_access(self):
+        self.client.login(username="user", password="123456")
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+        with override_settings(RECIPE_METRICS_TOKEN="secret"):
+            self.client.logout()
+            self.get_metrics(authorization="Bearer secret")
+            response = self.client.get(
+                reverse("metrics"), headers={"authorization": "Bearer wrong"}
+            )
+            self.assertEqual(response.status_code, 403)
+
+
+class ProfilerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+        User.objects.create_user(username="staff", password="123456", is_staff=True)
+        seed_recipes(cls.user, 3)
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(
+            RECIPE_PROFILE_DIR=directory, RECIPE_PROFILE_LIMIT=2
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory
+        self.client.login(username="staff", password="123456")
+
+    def get_profiled(self, **params):
+        return self.client.get(
+            reverse("list_recipes"), params, headers={"x-profile": "1"}
+        )
+
+    def test_request_is_profiled(self):
+        response = self.get_profiled()
+
+        profile_id = response["X-Profile-Id"]
+        with open(os.path.join(self.directory, f"{profile_id}.json")) as file:
+            info = json.load(file)
+        self.assertEqual(info["view"], "list_recipes")
+        self.assertEqual(info["status"], 200)
+        self.assertEqual(info["query_count"], len(info["queries"]))
+        explained = [query for query in info["queries"] if "explain" in query]
+        self.assertTrue(explained)
+        self.assertNotIn("EXPLAIN failed", explained[0]["explain"])
+        self.assertIn("main/views.py", info["summary"])
+
+        stats = pstats.Stats(os.path.join(self.directory, f"{profile_id}.prof"))
+        self.assertTrue(stats.total_calls)
+
+    def test_streamed_content_is_profiled(self):
+        response = self.client.get(
+            reverse("export_recipes"), headers={"x-profile": "1"}
+        )
+        path = os.path.join(self.directory, f"{response['X-Profile-Id']}.json")
+        self.assertFalse(os.path.exists(path))
+
+        b"".join(response.streaming_content)
+
+        with open(path) as file:
+            info = json.load(file)
+        # the recipes are loaded while the archive is streamed
+        self.assertTrue(
+            any('FROM "main_recipe"' in query["sql"] for query in info["queries"])
+        )
+        self.assertIn("export_utils.py", info["summary"])
+
+    def test_requests_are_profiled_one_at_a_time(self):
+        with profiling._lock:
+            response = self.get_profiled()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertIn("X-Profile-Id", self.get_profiled())
+
+    def test_only_staff_requests_are_profiled(self):
+        self.assertNotIn("X-Profile-Id", self.client.get(reverse("list_recipes")))
+
+        self.client.login(username="user", password="123456")
+        self.assertNotIn("X-Profile-Id", self.get_profiled())
+        response = self.client.get(reverse("list_recipes"), {"_profile": "1"})
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_only_last_profiles_are_kept(self):
+        profile_ids = [self.get_profiled(page=i)["X-Profile-Id"] for i in range(3)]
+
+        response = self.client.get(reverse("list_profiles"))
+
+        self.assertEqual(
+            [profile["id"] for profile in response.context["profiles"]],
+            sorted(profile_ids[1:], reverse=True),
+        )
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+    def test_profile_download(self):
+        profile_id = self.client.get(reverse("list_recipes"), {"_profile": "1"})[
+            "X-Profile-Id"
+        ]
+        url = reverse("download_profile", kwargs={"profile_id": profile_id})
+
+        response = self.client.get(url, {"format": "json"})
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content))["id"], profile_id
+        )
+        self.assertEqual(self.client.get(url, {"format": "txt"}).status_code, 404)
+        missing = reverse("download_profile", kwargs={"profile_id": "missing"})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+        self.client.login(username="user", password="123456")
+        self.assertNotEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(RECIPE_SLOW_QUERY_THRESHOLD=0)
+class SlowQueryLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="123456")
+        seed_recipes(cls.user, 3)
+        cls.recipe = Recipe.objects.filter(user=cls.user).first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username="user", password="123456")
+
+    def get_logged(self):
+        with self.assertLogs("main.slow_queries", "WARNING") as logs:
+            self.client.get(
+                reverse("recipe_details", kwargs={"recipe_id": self.recipe.pk})
+            )
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql(
+                "SELECT *  FROM t1\nWHERE id IN (%s, %s, %s) AND name = 'it''s' LIMIT 21"
+            ),
+            "SELECT * FROM t1 WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+        self.assertEqual(
+            normalize_sql("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)"),
+            "INSERT INTO t (a, b) VALUES (...)",
+        )
+
+    def test_slow_queries_are_logged(self):
+        entries = self.get_logged()
+
+        recipe_queries = [
+            entry for entry in entries if "main_recipeingredient" in entry["sql"]
+        ]
+        self.assertEqual(len(recipe_queries), 1)
+        entry = recipe_queries[0]
+        self.assertEqual(entry["view"], "recipe_details")
+        self.assertRegex(entry["origin"], r"^main/(loaders|views)\.py:\d+ in ")
+        hooks = r"^main/(instrumentation|metrics|profiling|slow_queries)\.py"
+        for entry in entries:
+            self.assertNotRegex(entry["origin"] or "", hooks)
+        self.assertTrue(entry["explain"])
+        self.assertNotIn("EXPLAIN failed", entry["explain"])
+        # plans of the explained queries are not logged themselves
+        self.assertFalse(any("EXPLAIN" in e["sql"] for e in entries))
+
+        # plans are captured once per fingerprint
+        entries = self.get_logged()
+        self.assertFalse(any("explain" in entry for entry in entries))
+
+    def test_plans_are_not_counted_as_queries_of_request(self):
+        key = ("recipes_db_queries_per_request", (("view", "recipe_details"),))
+
+        def count_queries():
+            before = metrics.collect().get(key, [None, 0])[1]
+            self.client.get(
+                reverse("recipe_details", kwargs={"recipe_id": self.recipe.pk})
+            )
+            return metrics.collect()[key][1] - before
+
+        with self.settings(RECIPE_SLOW_QUERY_THRESHOLD=None):
+            expected = count_queries()
+        cache.clear()
+        with self.assertLogs("main.slow_queries", "WARNING") as logs:
+            queries = count_queries()
+
+        self.assertTrue(any('"explain"' in record for record in logs.output))
+        self.assertEqual(queries, expected)
+
+    def test_origin_of_profiled_request(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        with self.settings(RECIPE_PROFILE_DIR=directory), self.assertLogs(
+            "main.slow_queries", "WARNING"
+        ) as logs:
+            response = self.client.get(
+                reverse("recipe_details", kwargs={"recipe_id": self.recipe.pk}),
+                headers={"x-profile": "1"},
+            )
+
+        self.assertIn("X-Profile-Id", response)
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        recipe_queries = [entry for entry in entries if "main_recipe" in entry["sql"]]
+        self.assertTrue(recipe_queries)
+        # plans captured by the profiler are not logged
+        self.assertFalse(any("EXPLAIN" in entry["sql"] for entry in entries))
+        for entry in recipe_queries:
+            self.assertRegex(entry["origin"], r"^main/(loaders|views)\.py:\d+ in ")
+
+    def test_report(self):
+        entries = self.get_logged() + self.get_logged()
+        path = os.path.join(tempfile.mkdtemp(), "slow_queries.log")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("not a query\n")
+            for entry in entries:
+                file.write(json.dumps(entry) + "\n")
+
+        out = StringIO()
+        call_command("slow_query_report", path, "--order-by", "count", stdout=out)
+
+        report = out.getvalue()
+        fingerprints = {entry["fingerprint"] for entry in entries}
+        self.assertIn(
+            f"{len(entries)} slow queries of {len(fingerprints)} kinds", report
+        )
+        self.assertIn("count: 2", report)
+        self.assertIn("recipe_details (2)", report)
+
+    @override_settings(RECIPE_SLOW_QUERY_LOG=None)
+    def test_report_without_log(self):
+        with self.assertRaisesMessage(CommandError, "RECIPE_SLOW_QUERY_LOG"):
+            call_command("slow_query_report")
@@ -8,8 +8,43 @@ urlpatterns = [
     path("search_menu", views.search_menu, name="search_menu"),
     path("search", views.search_results, name="search_results"),
     path("generate", views.generate_recipe, name="generate_recipe"),
+    path("generate/<int:job_id>", views.generation_job, name="generation_job"),
+    path(
+        "generate/<int:job_id>/status",
+        views.generation_job_status,
+        name="generation_job_status",
+    ),
+    path(
+        "generate/<int:job_id>/save",
+        views.save_generated_recipes,
+        name="save_generated_recipes",
+    ),
+    path(
+        "generate/<int:job_id>/events",
+        views.generation_job_events,
+        name="generation_job_events",
+    ),
+    path("export", views.export_recipes, name="export_recipes"),
+    path("import", views.upload_recipes, name="import_recipes"),
+    path("cache-stats", views.recipe_cache_stats, name="recipe_cache_stats"),
+    path("profiles", views.list_profiles, name="list_profiles"),
+    path(
+        "profiles/<slug:profile_id>/download",
+        views.download_profile,
+        name="download_profile",
+    ),
     path("<int:recipe_id>/details", views.recipe_details, name="recipe_details"),
     path("<int:recipe_id>/delete", views.delete_recipe, name="delete_recipe"),
     path("<int:recipe_id>/edit", views.edit_recipe, name="edit_recipe"),
+    path(
+        "<int:recipe_id>/steps/insert",
+        views.insert_recipe_step,
+        name="insert_recipe_step",
+    ),
+    path(
+        "<int:recipe_id>/steps/<int:step_id>/move",
+        views.move_recipe_step,
+        name="move_recipe_step",
+    ),
     path("<int:recipe_id>/text-download", views.download_recipe, name="download_recipe"),
 ]
@@ -1,62 +1,137 @@
+import io
+import os
+
 from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.core.files.storage import default_storage
 from django.db import transaction
-from django.db.models import Max, Q
-from django.http import FileResponse, HttpResponseForbidden
-from django.shortcuts import get_object_or_404, render
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.utils.crypto import constant_time_compare
+from django.utils.http import content_disposition_header
 from django.views import View
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView
 
-from . import forms
-from .ai import get_generated_recipe
-from .export_utils import export_recipe_to_text
-from .models import Recipe, RecipeIngredient, RecipeStep, RecipeTag
+from . import caching, forms, metrics, profiling, search
+from .export_utils import export_recipes_to_zip, get_exporter
+from .generation import create_generation_job, get_job_state, stream_job_events
+from .generation_backends import GenerationUnavailable
+from .generation_cache import get_generation_cache_stats
+from .images import VARIANT_FORMATS, VARIANT_WIDTHS, get_variant_name
+from .import_utils import (
+    RecipeImportError,
+    get_reader,
+    get_recipe_objects,
+    import_recipes,
+    limit_recipes,
+)
+from .loaders import iter_recipes_with_children, load_recipe
+from .media import serve_media
+from .models import (
+    GenerationJob,
+    Recipe,
+    RecipeImage,
+    RecipeIngredient,
+    RecipeStep,
+    RecipeTag,
+)
+from .pagination import KeysetPaginationMixin
+from .persistence import get_formset_changes, save_recipe, save_recipes
+from .steps import place_step
+
+# errors of an uploaded file that are shown to the user
+MAX_SHOWN_IMPORT_ERRORS = 100
 
 
 class RecipeImageDownload(View):
     def get(self, request, relative_path):
-        print(f"relative_path: {relative_path}")
-        recipes = Recipe.objects.filter(
-            Q(image_1=relative_path)
-            | Q(image_2=relative_path)
-            | Q(image_3=relative_path)
-        )
-        recipe = get_object_or_404(recipes)
-
-        if recipe.user != request.user:
-            return HttpResponseForbidden()
-
-        absolute_path = f"{settings.MEDIA_ROOT}/{relative_path}"
-        return FileResponse(open(absolute_path, "rb"), as_attachment=True)
-
-
-class RecipeListView(ListView):
+        # a file is shared by equal images, possibly of several users, and
+        # its name is the hash of its content, so images of other users are
+        # not found like missing ones, which does not tell that they exist
+        if not RecipeImage.objects.filter(
+            image=relative_path, user_id=request.user.pk
+        ).exists():
+            raise Http404("Зображення не знайдено")
+
+        name = relative_path
+        width = request.GET.get("width")
+        extension = request.GET.get("format")
+        if width or extension:
+            if extension not in VARIANT_FORMATS or width not in [
+                str(w) for w in VARIANT_WIDTHS
+            ]:
+                raise Http404("Невідомий варіант зображення")
+
+            variant_name = get_variant_name(relative_path, width, extension)
+            # images uploaded before variants existed are served as they are
+            # until the variants are backfilled
+            if default_storage.exists(variant_name):
+                name = variant_name
+
+        try:
+            return serve_media(request, name)
+        except FileNotFoundError:
+            raise Http404("Файл зображення не знайдено")
+
+
+class RecipeListView(KeysetPaginationMixin, ListView):
     paginate_by = 5
     model = Recipe
     template_name = "main/recipe_list.html"
 
+    def get_sorting(self):
+        """Return field and direction of sorting, by name if they are invalid"""
+        form = forms.SortRecipeListForm(self.request.GET)
+        form.is_valid()
+        return (
+            form.cleaned_data.get("ordering", "name"),
+            form.cleaned_data.get("is_descending", False),
+        )
+
     def get_queryset(self):
-        sort_by = (
-            "-" if self.request.GET.get("is_descending", False) else ""
-        ) + self.request.GET.get("ordering", "name")
+        ordering, is_descending = self.get_sorting()
+        direction = "-" if is_descending else ""
+        sort_by = direction + ordering
 
-        return Recipe.objects.filter(user=self.request.user).order_by(sort_by)
+        # id breaks ties between recipes for keyset pagination
+        return Recipe.objects.filter(user=self.request.user).order_by(
+            sort_by, direction + "id"
+        )
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    def get(self, request, *args, **kwargs):
+        context = {}
+
+        def render_table():
+            self.object_list = self.get_queryset()
+            context.update(self.get_context_data())
+            return render_to_string("main/recipe_list_table.html", context, request)
+
+        # the table is cached for each combination of sorting and page
+        context["recipe_table"] = caching.get_or_render_fragment(
+            request.user.pk, "recipe_list", [request.GET.urlencode()], render_table
+        )
+        ordering, is_descending = self.get_sorting()
         context["sort_form"] = forms.SortRecipeListForm(
-            initial={
-                "ordering": self.request.GET.get("ordering", "name"),
-                "is_descending": self.request.GET.get("is_descending", False),
-            }
+            initial={"ordering": ordering, "is_descending": is_descending}
         )
-        return context
+        return render(request, self.template_name, context)
 
 
 list_recipes = login_required(RecipeListView.as_view())
 
 
-class SearchResultsView(ListView):
+class SearchResultsView(KeysetPaginationMixin, ListView):
     model = Recipe
     template_name = "main/search_results.html"
     context_object_name = "recipes"
@@ -66,40 +141,11 @@ class SearchResultsView(ListView):
         query = forms.SearchForm(self.request.GET)
 
         if query.is_valid():
-            search_string = query.cleaned_data["search_string"]
-
-            recipe_search_params = []
-            if query.cleaned_data["search_in_names"]:
-                recipe_search_params.append(Q(name__icontains=search_string))
-            if query.cleaned_data["search_in_descriptions"]:
-                recipe_search_params.append(Q(description__icontains=search_string))
-            if query.cleaned_data["search_in_categories"]:
-                recipe_search_params.append(Q(category__icontains=search_string))
-            if query.cleaned_data["search_in_ingredients"]:
-                recipe_search_params.append(
-                    Q(recipeingredient__name__icontains=search_string)
-                )
-            if query.cleaned_data["search_in_tags"]:
-                recipe_search_params.append(
-                    Q(recipetag__tag_text__icontains=search_string)
-                )
-
-            if len(recipe_search_params) != 0:
-                recipe_search_params_combined = recipe_search_params[0]
-                for param in recipe_search_params[1:]:
-                    recipe_search_params_combined = (
-                        recipe_search_params_combined | param
-                    )
-
-                return (
-                    Recipe.objects.filter(
-                        recipe_search_params_combined, user=self.request.user
-                    )
-                    .distinct()
-                    .order_by("name")
-                )
-
-            return Recipe.objects.none()
+            return search.search_recipes(
+                self.request.user,
+                query.cleaned_data["search_string"],
+                search.get_search_fields(query.cleaned_data),
+            )
         else:
             return Recipe.objects.none()
 
@@ -107,6 +153,59 @@ class SearchResultsView(ListView):
 search_results = login_required(SearchResultsView.as_view())
 
 
+def export_metrics(request):
+    """
+    Metrics in the Prometheus text format. With RECIPE_METRICS_TOKEN set
+    they are given for the token as a bearer token, otherwise to staff.
+    """
+    token = settings.RECIPE_METRICS_TOKEN
+    if token:
+        authorization = request.headers.get("Authorization", "")
+        if not constant_time_compare(authorization, f"Bearer {token}"):
+            return HttpResponseForbidden()
+    elif not (request.user.is_active and request.user.is_staff):
+        return HttpResponseForbidden()
+
+    return HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@staff_member_required
+def recipe_cache_stats(request):
+    stats = caching.get_cache_stats()
+    stats["generation"] = get_generation_cache_stats()
+    return JsonResponse(stats)
+
+
+@staff_member_required
+def list_profiles(request):
+    return render(
+        request,
+        "main/profiles.html",
+        {
+            **admin.site.each_context(request),
+            "title": "Профілі запитів",
+            "profiles": profiling.get_profiles(),
+        },
+    )
+
+
+@staff_member_required
+def download_profile(request, profile_id):
+    # profile of cProfile or its info with SQL of the request
+    extension = request.GET.get("format", "prof")
+    if extension not in ["prof", "json"]:
+        raise Http404("Невідомий формат")
+
+    try:
+        file = open(profiling.get_profile_path(profile_id, extension), "rb")
+    except FileNotFoundError:
+        raise Http404("Профіль не знайдено")
+    return FileResponse(file, as_attachment=True, filename=f"{profile_id}.{extension}")
+
+
 @login_required
 def search_menu(request):
     return render(request, "main/search_menu.html", {"search_form": forms.SearchForm()})
@@ -117,7 +216,9 @@ def create_recipe(request):
     if request.method == "POST":
         context = {}
         recipe_form = forms.RecipeForm(request.POST, request.FILES)
+        images_form = forms.RecipeImagesForm(request.POST, request.FILES)
         context["recipe_form"] = recipe_form
+        context["images_form"] = images_form
         is_error = False
 
         ingredients = list(
@@ -140,6 +241,9 @@ def create_recipe(request):
         if not recipe_form.is_valid():
             context["info_error_message"] = "Помилка в інформації про рецепт"
             is_error = True
+        if not images_form.is_valid():
+            context["image_error_message"] = "Помилка в зображеннях страви"
+            is_error = True
 
         for step in steps:
             if not forms.RecipeStepForm({"step_description": step}).is_valid():
@@ -165,55 +269,58 @@ def create_recipe(request):
             return render(request, "main/create_recipe.html", context)
 
         # save data if no validation errors occured
-        with transaction.atomic():
-            recipe = recipe_form.save(commit=False)
-            recipe.user = request.user
-            recipe.save()
-
-            for step_number, step in enumerate(steps):
-                RecipeStep.objects.create(
-                    recipe=recipe, step_number=step_number, step_description=step
-                )
-
-            for name, volume, measure in ingredients:
-                RecipeIngredient.objects.create(
-                    recipe=recipe, name=name, volume=volume, volume_measure=measure
-                )
-
-            for tag in tags:
-                RecipeTag.objects.create(recipe=recipe, tag_text=tag)
+        recipe = recipe_form.save(commit=False)
+        recipe.user = request.user
+        save_recipe(
+            recipe,
+            created=get_new_children(steps, ingredients, tags)
+            + get_new_images(images_form),
+        )
 
         return render(
             request, "main/create_recipe_success.html", {"recipe_id": recipe.id}
         )
     else:
         recipe_form = forms.RecipeForm()
-        return render(request, "main/create_recipe.html", {"recipe_form": recipe_form})
+        return render(
+            request,
+            "main/create_recipe.html",
+            {"recipe_form": recipe_form, "images_form": forms.RecipeImagesForm()},
+        )
 
 
 @login_required
 def recipe_details(request, recipe_id):
-    recipe = get_object_or_404(Recipe, pk=recipe_id)
+    context = {}
 
-    if recipe.user != request.user:
-        return render(request, "access_denied.html")
+    def render_details():
+        recipe = load_recipe(request.user, recipe_id)
 
-    ingredients = RecipeIngredient.objects.filter(recipe=recipe)
-    steps = RecipeStep.objects.filter(recipe=recipe)
-    tags = RecipeTag.objects.filter(recipe=recipe)
+        # pages of foreign recipes are not cached
+        if not recipe.is_owner:
+            return None
 
-    return render(
-        request,
-        "main/recipe_details.html",
-        {"recipe": recipe, "ingredients": ingredients, "tags": tags, "steps": steps},
+        context["recipe"] = recipe
+        context["ingredients"] = recipe.recipeingredient_set.all()
+        context["steps"] = recipe.recipestep_set.all()
+        context["tags"] = recipe.recipetag_set.all()
+        context["images"] = recipe.recipeimage_set.all()
+        return render_to_string("main/recipe_details_content.html", context, request)
+
+    context["recipe_details"] = caching.get_or_render_fragment(
+        request.user.pk, "recipe_details", [recipe_id], render_details
     )
+    if context["recipe_details"] is None:
+        return render(request, "access_denied.html")
+
+    return render(request, "main/recipe_details.html", context)
 
 
 @login_required
 def delete_recipe(request, recipe_id):
-    recipe = get_object_or_404(Recipe, pk=recipe_id)
+    recipe = load_recipe(request.user, recipe_id, with_children=False)
 
-    if recipe.user != request.user:
+    if not recipe.is_owner:
         return render(request, "access_denied.html")
 
     recipe_name = recipe.name
@@ -231,23 +338,28 @@ def delete_recipe(request, recipe_id):
     )
 
 
-def change_recipe_data_using_formset(formset, recipe):
-    """Update or delete objects that corresponds to entries in formset"""
-    for form in formset:
-        obj = form.save(commit=False)
-        obj.recipe = recipe
-        # if data in a form marked for deletion
-        if form.cleaned_data["DELETE"]:
-            obj.delete()
-        else:
-            obj.save()
+def get_new_children(steps, ingredients, tags):
+    """Return unsaved recipe children made from the data of a recipe form"""
+    return (
+        [RecipeStep(step_description=step) for step in steps]
+        + [
+            RecipeIngredient(name=name, volume=volume, volume_measure=measure)
+            for name, volume, measure in ingredients
+        ]
+        + [RecipeTag(tag_text=tag) for tag in tags]
+    )
+
+
+def get_new_images(images_form):
+    """Return unsaved recipe images uploaded with a valid images form"""
+    return [RecipeImage(image=image) for image in images_form.cleaned_data["images"]]
 
 
 @login_required
 def edit_recipe(request, recipe_id):
-    recipe = get_object_or_404(Recipe, pk=recipe_id)
+    recipe = load_recipe(request.user, recipe_id)
 
-    if recipe.user != request.user:
+    if not recipe.is_owner:
         return render(request, "access_denied.html")
 
     if request.method == "POST":
@@ -258,6 +370,8 @@ def edit_recipe(request, recipe_id):
         ingredient_formset = forms.RecipeIngredientFormSet(
             request.POST, instance=recipe
         )
+        image_formset = forms.RecipeImageFormSet(request.POST, instance=recipe)
+        images_form = forms.RecipeImagesForm(request.POST, request.FILES)
 
         context = {
             "recipe_name": recipe.name,
@@ -265,6 +379,8 @@ def edit_recipe(request, recipe_id):
             "step_formset": step_formset,
             "tag_formset": tag_formset,
             "ingredient_formset": ingredient_formset,
+            "image_formset": image_formset,
+            "images_form": images_form,
         }
 
         new_ingredients = list(
@@ -297,6 +413,9 @@ def edit_recipe(request, recipe_id):
         if not ingredient_formset.is_valid():
             context["ingredient_error_message"] = "Помилка в описі інгредієнтів"
             is_error = True
+        if not image_formset.is_valid() or not images_form.is_valid():
+            context["image_error_message"] = "Помилка в зображеннях страви"
+            is_error = True
 
         # checking new data for errors
         for step in new_steps:
@@ -323,34 +442,18 @@ def edit_recipe(request, recipe_id):
             return render(request, "main/edit_recipe.html", context)
 
         # save data if no validation errors occured
-        with transaction.atomic():
-            # updated data
-            recipe = recipe_form.save(commit=False)
-            recipe.save()
-
-            change_recipe_data_using_formset(step_formset, recipe)
-            change_recipe_data_using_formset(tag_formset, recipe)
-            change_recipe_data_using_formset(ingredient_formset, recipe)
-
-            # new data
-            start = (
-                RecipeStep.objects.aggregate(Max("step_number", default=0))[
-                    "step_number__max"
-                ]
-                + 1
-            )
-            for step_number, step in enumerate(new_steps, start):
-                RecipeStep.objects.create(
-                    recipe=recipe, step_number=step_number, step_description=step
-                )
-
-            for name, volume, measure in new_ingredients:
-                RecipeIngredient.objects.create(
-                    recipe=recipe, name=name, volume=volume, volume_measure=measure
-                )
-
-            for tag in new_tags:
-                RecipeTag.objects.create(recipe=recipe, tag_text=tag)
+        created, updated, deleted = get_formset_changes(
+            step_formset, tag_formset, ingredient_formset, image_formset
+        )
+        created += get_new_children(new_steps, new_ingredients, new_tags)
+        created += get_new_images(images_form)
+
+        recipe = save_recipe(
+            recipe_form.save(commit=False),
+            created=created,
+            updated=updated,
+            deleted=deleted,
+        )
 
         return render(
             request, "main/edit_recipe_success.html", {"recipe_id": recipe.id}
@@ -360,6 +463,7 @@ def edit_recipe(request, recipe_id):
         step_formset = forms.RecipeStepFormSet(instance=recipe)
         tag_formset = forms.RecipeTagFormSet(instance=recipe)
         ingredient_formset = forms.RecipeIngredientFormSet(instance=recipe)
+        image_formset = forms.RecipeImageFormSet(instance=recipe)
 
         return render(
             request,
@@ -370,38 +474,91 @@ def edit_recipe(request, recipe_id):
                 "step_formset": step_formset,
                 "tag_formset": tag_formset,
                 "ingredient_formset": ingredient_formset,
+                "image_formset": image_formset,
+                "images_form": forms.RecipeImagesForm(),
             },
         )
 
 
+def change_recipe_step_order(request, recipe_id, step_id=None):
+    """
+    Put new or existing step of the recipe before the step given by
+    ``before`` POST parameter or to the end, and return ids of the recipe's
+    steps in their new order.
+    """
+    recipe = load_recipe(request.user, recipe_id, with_children=False)
+
+    if not recipe.is_owner:
+        return HttpResponseForbidden()
+
+    with transaction.atomic():
+        # serializes changes of the steps of this recipe only
+        recipe = Recipe.objects.select_for_update().get(pk=recipe.pk)
+
+        if step_id is None:
+            form = forms.RecipeStepForm(request.POST)
+            if not form.is_valid():
+                return JsonResponse({"errors": form.errors}, status=400)
+            step = form.save(commit=False)
+        else:
+            step = get_object_or_404(RecipeStep, pk=step_id, recipe=recipe)
+
+        position_form = forms.RecipeStepPositionForm(request.POST)
+        if not position_form.is_valid():
+            return JsonResponse({"errors": position_form.errors}, status=400)
+
+        before = None
+        if position_form.cleaned_data["before"] is not None:
+            before = get_object_or_404(
+                RecipeStep, pk=position_form.cleaned_data["before"], recipe=recipe
+            )
+            if before.pk == step.pk:
+                return JsonResponse(
+                    {"errors": {"before": ["Крок не можна поставити перед ним самим"]}},
+                    status=400,
+                )
+
+        steps = place_step(recipe, step, before)
+        # renumbered steps are saved in bulk, which sends no signals
+        caching.invalidate_user_cache(request.user.pk)
+
+    return JsonResponse({"steps": [s.pk for s in steps]})
+
+
+@login_required
+@require_POST
+def insert_recipe_step(request, recipe_id):
+    return change_recipe_step_order(request, recipe_id)
+
+
+@login_required
+@require_POST
+def move_recipe_step(request, recipe_id, step_id):
+    return change_recipe_step_order(request, recipe_id, step_id)
+
+
 @login_required
 def generate_recipe(request):
     if request.method == "POST":
         form = forms.RecipeGenerationForm(request.POST)
         if form.is_valid():
-            recipe_data = get_generated_recipe(
-                form.cleaned_data["ingredients_description"],
-                form.cleaned_data["recipe_description"],
-            )
-
-            recipe_info_form = forms.RecipeForm(
-                {
-                    "name": recipe_data["name"],
-                    "description": recipe_data["description"],
-                    "cooking_time": recipe_data["cooking_time_in_minutes"],
-                    "category": recipe_data["category"],
-                }
-            )
-
-            return render(
-                request,
-                "main/generating_recipe_result.html",
-                {
-                    "recipe": recipe_data,
-                    "recipe_info_form": recipe_info_form,
-                    "generation_input_form": form,
-                },
-            )
+            # the recipe is generated by a worker, the user follows the job
+            try:
+                job = create_generation_job(
+                    request.user,
+                    form.cleaned_data["ingredients_description"],
+                    form.cleaned_data["recipe_description"],
+                    form.cleaned_data["variants"],
+                    # the result page asks for a new recipe for the same prompt
+                    use_cache="regenerate" not in request.POST,
+                )
+            except GenerationUnavailable as error:
+                return render(
+                    request,
+                    "main/generating_recipe_input.html",
+                    {"input_form": form, "error_message": str(error)},
+                )
+            return redirect("generation_job", job_id=job.pk)
 
         return render(
             request,
@@ -416,19 +573,212 @@ def generate_recipe(request):
     )
 
 
+@login_required
+def generation_job(request, job_id):
+    job = get_object_or_404(GenerationJob, pk=job_id, user=request.user)
+    form = forms.RecipeGenerationForm(
+        {
+            "ingredients_description": job.ingredients_description,
+            "recipe_description": job.recipe_description,
+            "variants": job.variants,
+        }
+    )
+
+    if job.status == GenerationJob.Status.FAILED:
+        return render(
+            request,
+            "main/generating_recipe_input.html",
+            {"input_form": form, "error_message": job.error},
+        )
+
+    if job.status != GenerationJob.Status.DONE:
+        # the recipe is shown while it is generated and reloaded when it is done
+        return render(
+            request,
+            "main/generating_recipe_result.html",
+            {
+                "job": job,
+                "generation_input_form": form,
+                "use_events": settings.RECIPE_GENERATION_EVENTS,
+            },
+        )
+
+    if job.variants > 1:
+        return render(
+            request,
+            "main/generating_recipe_variants.html",
+            {"job": job, "recipes": job.result, "generation_input_form": form},
+        )
+
+    recipe_data = job.result
+    recipe_info_form = forms.RecipeForm(
+        {
+            "name": recipe_data["name"],
+            "description": recipe_data["description"],
+            "cooking_time": recipe_data["cooking_time_in_minutes"],
+            "category": recipe_data["category"],
+        }
+    )
+
+    return render(
+        request,
+        "main/generating_recipe_result.html",
+        {
+            "recipe": recipe_data,
+            "recipe_info_form": recipe_info_form,
+            "generation_input_form": form,
+        },
+    )
+
+
+def get_generated_recipe_objects(recipe_data, user):
+    """
+    Return unsaved recipe and its children made from a generated recipe,
+    or None if the recipe is not valid
+    """
+    try:
+        recipe, steps, ingredients, tags = get_recipe_objects(recipe_data, user)
+    except RecipeImportError:
+        return None
+    return recipe, steps + ingredients + tags
+
+
+@login_required
+@require_POST
+def save_generated_recipes(request, job_id):
+    # the job is locked and deleted with the recipes saved from it, so they
+    # are not saved again when the form is submitted twice
+    with transaction.atomic():
+        job = get_object_or_404(
+            GenerationJob.objects.select_for_update(),
+            pk=job_id,
+            user=request.user,
+            status=GenerationJob.Status.DONE,
+            variants__gt=1,
+        )
+        context = {"job": job, "recipes": job.result}
+
+        selected = sorted(
+            {int(i) for i in request.POST.getlist("variant") if i.isdigit()}
+            & set(range(len(job.result)))
+        )
+        if not selected:
+            context["error_message"] = "Оберіть хоча б один рецепт"
+            return render(request, "main/generating_recipe_variants.html", context)
+
+        recipes = [
+            get_generated_recipe_objects(job.result[i], request.user) for i in selected
+        ]
+        if None in recipes:
+            context["error_message"] = "Помилка в згенерованому рецепті"
+            return render(request, "main/generating_recipe_variants.html", context)
+
+        # either all chosen recipes are saved or none of them
+        save_recipes(recipes)
+        job.delete()
+    return redirect("list_recipes")
+
+
+@login_required
+def generation_job_status(request, job_id):
+    job = get_object_or_404(GenerationJob, pk=job_id, user=request.user)
+    return JsonResponse(get_job_state(job))
+
+
+@login_required
+def generation_job_events(request, job_id):
+    if not settings.RECIPE_GENERATION_EVENTS:
+        raise Http404("Події генерації вимкнено")
+
+    job = get_object_or_404(GenerationJob, pk=job_id, user=request.user)
+    response = StreamingHttpResponse(
+        stream_job_events(job.pk), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    # nginx must not buffer the events
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 @login_required
 def download_recipe(request, recipe_id):
-    recipe = get_object_or_404(Recipe, pk=recipe_id)
+    recipe = load_recipe(request.user, recipe_id)
 
-    if recipe.user != request.user:
+    if not recipe.is_owner:
         return render(request, "access_denied.html")
 
-    ingredients = RecipeIngredient.objects.filter(recipe=recipe)
-    steps = RecipeStep.objects.filter(recipe=recipe)
-    tags = RecipeTag.objects.filter(recipe=recipe)
+    exporter = get_exporter(request.GET.get("format", "txt"))
+    if exporter is None:
+        raise Http404("Невідомий формат")
+
+    ingredients = recipe.recipeingredient_set.all()
+    steps = recipe.recipestep_set.all()
+    tags = recipe.recipetag_set.all()
+
+    # the generator is streamed without joining the document, FileResponse
+    # would not send the file name of a generator
+    response = StreamingHttpResponse(
+        exporter.export(recipe, ingredients, steps, tags),
+        content_type=exporter.content_type,
+    )
+    response["Content-Disposition"] = content_disposition_header(
+        True, f"{recipe.name}.{exporter.extension}"
+    )
+    return response
+
 
-    return FileResponse(
-        export_recipe_to_text(recipe, ingredients, steps, tags),
-        as_attachment=True,
-        filename=f"{recipe.name}.txt",
+@login_required
+def export_recipes(request):
+    exporter = get_exporter(request.GET.get("format", "json"))
+    if exporter is None:
+        raise Http404("Невідомий формат")
+
+    recipes = iter_recipes_with_children(
+        Recipe.objects.filter(user=request.user).order_by("id")
     )
+
+    response = StreamingHttpResponse(
+        export_recipes_to_zip(recipes, exporter), content_type="application/zip"
+    )
+    response["Content-Disposition"] = content_disposition_header(True, "recipes.zip")
+    return response
+
+
+@login_required
+def upload_recipes(request):
+    form = forms.RecipeImportForm(request.POST or None, request.FILES or None)
+    context = {"form": form}
+    if request.method != "POST" or not form.is_valid():
+        return render(request, "main/import_recipes.html", context)
+
+    upload = form.cleaned_data["file"]
+    import_format = form.cleaned_data["format"] or os.path.splitext(upload.name)[1][1:]
+    reader = get_reader(import_format.lower())
+    if reader is None:
+        context["error_message"] = "Невідомий формат файлу"
+        return render(request, "main/import_recipes.html", context)
+
+    errors = []
+
+    def on_error(number, message):
+        if len(errors) < MAX_SHOWN_IMPORT_ERRORS:
+            errors.append(f"Рецепт {number}: {message}")
+
+    # the upload is read in chunks, not loaded into memory as a whole
+    file = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+    max_recipes = settings.RECIPE_IMPORT_UPLOAD_MAX_RECIPES
+    try:
+        # recipes of the upload are written in one transaction, so nothing
+        # is imported from a file that can not be read to the end
+        imported, failed = import_recipes(
+            limit_recipes(reader(file), max_recipes),
+            request.user,
+            batch_size=max_recipes + 1,
+            on_error=on_error,
+        )
+    except (RecipeImportError, UnicodeDecodeError) as error:
+        context["error_message"] = f"Не вдалося прочитати файл: {error}"
+    else:
+        context.update(imported=imported, failed=failed)
+    context["errors"] = errors
+    return render(request, "main/import_recipes.html", context)
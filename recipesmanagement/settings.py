@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 import dj_database_url
@@ -53,11 +54,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so the time of the other middleware is measured too
+    "main.instrumentation.MetricsMiddleware",
+    "main.instrumentation.SlowQueryMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "main.instrumentation.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -66,7 +71,8 @@ ROOT_URLCONF = "recipesmanagement.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Django templates backend that records time of rendering
+        "BACKEND": "main.instrumentation.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -107,6 +113,37 @@ DATABASES = {
 if os.environ.get("DATABASE_URL"):
     DATABASES["default"].update(dj_database_url.config())
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# The cache keeps generations of cached pages, cache statistics and the state
+# of the generation circuit breaker, which must be shared by the web server,
+# the generation worker and management commands when they run as separate
+# processes, so Redis at REDIS_URL should be used then. Without REDIS_URL
+# every process keeps a cache of its own.
+# Tests clear the cache, so they never use Redis, even when REDIS_URL is set,
+# as it is in the services of docker compose.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == "test"
+
+if os.environ.get("REDIS_URL") and not TESTING:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "recipes",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+# Rendered recipe pages are cached for this number of seconds
+RECIPE_CACHE_TIMEOUT = 60 * 60
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -158,7 +195,117 @@ LOGOUT_REDIRECT_URL = "home"
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
 
+# How recipe images are sent after the access check: empty to send them from
+# Django, "x-accel-redirect" for nginx or "x-sendfile" for Apache.
+# For nginx MEDIA_ROOT must be served by an internal location at
+# RECIPE_MEDIA_ACCEL_PREFIX.
+RECIPE_MEDIA_SENDFILE = os.environ.get("RECIPE_MEDIA_SENDFILE", "")
+RECIPE_MEDIA_ACCEL_PREFIX = "/protected-media/"
+# names of images are unique, so browsers can keep them for long
+RECIPE_MEDIA_MAX_AGE = 60 * 60 * 24 * 365
+# files of deleted images are removed by a background thread after commit
+RECIPE_MEDIA_DELETE_ASYNC = True
+# image files are shared by equal images, seconds for which a file saved
+# again by an upload is not deleted, while the upload is being committed
+RECIPE_MEDIA_DEDUP_GRACE = 60
+
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+# Class of the backend that generates recipes. main.generation_backends.StubBackend
+# streams a canned recipe, waiting RECIPE_GENERATION_STUB_CHUNK_DELAY seconds
+# per chunk, for load tests and work offline.
+RECIPE_GENERATION_BACKEND = os.environ.get(
+    "RECIPE_GENERATION_BACKEND", "main.generation_backends.GeminiBackend"
+)
+RECIPE_GENERATION_MODEL = os.environ.get("RECIPE_GENERATION_MODEL", "gemini-1.5-flash")
+RECIPE_GENERATION_STUB_CHUNK_DELAY = 0.05
+# seconds for one call of the backend, the calls failed with transient errors
+# are retried RECIPE_GENERATION_RETRIES times after random delays of up to
+# RECIPE_GENERATION_RETRY_BACKOFF seconds, doubled on every retry
+RECIPE_GENERATION_TIMEOUT = 30
+RECIPE_GENERATION_RETRIES = 2
+RECIPE_GENERATION_RETRY_BACKOFF = 0.5
+# after RECIPE_GENERATION_BREAKER_THRESHOLD failed calls in a row generation
+# is refused for RECIPE_GENERATION_BREAKER_COOLDOWN seconds
+RECIPE_GENERATION_BREAKER_THRESHOLD = 5
+RECIPE_GENERATION_BREAKER_COOLDOWN = 30
+# calls of the backend that may run at once in all processes sharing the
+# cache, variants of a recipe are generated concurrently up to this limit
+RECIPE_GENERATION_CONCURRENCY = 4
+# whether partial recipes are shown while they are generated
+RECIPE_GENERATION_STREAM = True
+
+# Recipes are generated by the run_generation_worker command. Jobs running
+# for longer than the timeout, in seconds, are assumed to be lost with their
+# worker and are retried until they are attempted RECIPE_GENERATION_MAX_ATTEMPTS
+# times. Finished jobs are deleted after RECIPE_GENERATION_JOB_RETENTION.
+RECIPE_GENERATION_JOB_TIMEOUT = 5 * 60
+RECIPE_GENERATION_MAX_ATTEMPTS = 2
+RECIPE_GENERATION_JOB_RETENTION = 60 * 60 * 24 * 7
+# Pages of jobs poll their state. With RECIPE_GENERATION_EVENTS they follow it
+# by Server-Sent Events instead, which keep a thread of a WSGI server busy for
+# RECIPE_GENERATION_EVENTS_TIMEOUT seconds per open page, before the browser
+# reconnects, so they should be enabled only for servers with spare threads.
+RECIPE_GENERATION_EVENTS = False
+RECIPE_GENERATION_EVENTS_TIMEOUT = 10
+# generated recipes are reused for equal prompts for RECIPE_GENERATION_CACHE_TTL
+# seconds, at most RECIPE_GENERATION_CACHE_SIZE recipes are kept
+RECIPE_GENERATION_CACHE_TTL = 60 * 60 * 24 * 7
+RECIPE_GENERATION_CACHE_SIZE = 10000
+
+# Metrics of requests are exported on /metrics. Processes aggregate them
+# in memory and write them to RECIPE_METRICS_DIR, shared by all workers,
+# every RECIPE_METRICS_FLUSH_INTERVAL seconds, without it only metrics of
+# the process that serves /metrics are exported. With RECIPE_METRICS_TOKEN
+# the metrics are given for it as a bearer token instead of to staff.
+RECIPE_METRICS_DIR = os.environ.get("RECIPE_METRICS_DIR", "")
+RECIPE_METRICS_FLUSH_INTERVAL = 5
+RECIPE_METRICS_TOKEN = os.environ.get("RECIPE_METRICS_TOKEN", "")
+
+# Files uploaded on the import page are imported during the request in one
+# transaction, larger files are imported by the import_recipes command.
+RECIPE_IMPORT_UPLOAD_MAX_SIZE = 5 * 1024 * 1024
+RECIPE_IMPORT_UPLOAD_MAX_RECIPES = 5000
+
+# Requests of staff users with the X-Profile header or the _profile query
+# parameter are profiled. The last RECIPE_PROFILE_LIMIT profiles are kept
+# in RECIPE_PROFILE_DIR with plans of RECIPE_PROFILE_EXPLAIN_COUNT slowest
+# SELECT statements of every request.
+RECIPE_PROFILE_DIR = os.environ.get("RECIPE_PROFILE_DIR", BASE_DIR / "profiles")
+RECIPE_PROFILE_LIMIT = 50
+RECIPE_PROFILE_EXPLAIN_COUNT = 5
+
+# Queries of requests running for at least RECIPE_SLOW_QUERY_THRESHOLD
+# seconds are logged to RECIPE_SLOW_QUERY_LOG with their plans, an empty
+# RECIPE_SLOW_QUERY_LOG variable turns the log off. The slow_query_report
+# command aggregates the log.
+RECIPE_SLOW_QUERY_THRESHOLD = 0.1
+RECIPE_SLOW_QUERY_LOG = (
+    os.environ.get("RECIPE_SLOW_QUERY_LOG", BASE_DIR / "slow_queries.log") or None
+)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"message": {"format": "%(message)s"}},
+    "handlers": {
+        # records of a logger without handlers would go to stderr
+        "slow_queries": {"class": "logging.NullHandler"},
+    },
+    "loggers": {
+        "main.slow_queries": {
+            "handlers": ["slow_queries"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+    },
+}
+if RECIPE_SLOW_QUERY_LOG:
+    LOGGING["handlers"]["slow_queries"] = {
+        "class": "logging.FileHandler",
+        "filename": RECIPE_SLOW_QUERY_LOG,
+        "formatter": "message",
+        "delay": True,
+    }
 
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 
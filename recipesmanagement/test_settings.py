@@ -0,0 +1,17 @@
+"""
+Settings of test runs:
+python3 manage.py test --settings=recipesmanagement.test_settings
+"""
+
+from .settings import *  # noqa: F401, F403
+
+# tests clear the cache, so they never use the shared one
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "recipes",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+# tests run in one process, so the cache of the process is shared enough
+SILENCED_SYSTEM_CHECKS = ["main.W001"]
@@ -21,7 +21,7 @@ from django.views.generic.base import TemplateView
 from django.conf import settings
 from django.conf.urls.static import static
 
-from main.views import RecipeImageDownload
+from main.views import RecipeImageDownload, export_metrics
 
 urlpatterns = [
     path("", TemplateView.as_view(template_name="home.html"), name="home"),
@@ -30,6 +30,7 @@ urlpatterns = [
     # https://docs.djangoproject.com/en/5.1/topics/auth/default/#module-django.contrib.auth.views
     path("accounts/", include("django.contrib.auth.urls")),
     path("admin/", admin.site.urls),
+    path("metrics", export_metrics, name="metrics"),
     path(
         "media/<path:relative_path>",
         RecipeImageDownload.as_view(),
@@ -0,0 +1,83 @@
+// Follows a generation job, shows the recipe while it is generated
+// and the form to save it when the job is finished.
+// The state of the job is polled, or followed by Server-Sent Events
+// when the server enables them and the browser supports them.
+
+const POLL_INTERVAL = 1000;
+const STATUS_NAMES = {
+    pending: "Очікує",
+    running: "Генерується",
+    done: "Готово",
+    failed: "Помилка",
+};
+
+const jobDiv = document.getElementById("generation_job");
+const statusSpan = document.getElementById("generation_job_status");
+
+function setList(id, items) {
+    const list = document.getElementById(id);
+    // items only grow, so the ones already shown are kept
+    for (const item of items.slice(list.children.length)) {
+        const li = document.createElement("li");
+        li.textContent = item;
+        list.appendChild(li);
+    }
+}
+
+function showRecipe(recipe) {
+    document.getElementById("generated_name").textContent = recipe.name || "";
+    document.getElementById("generated_description").textContent = recipe.description || "";
+    if (recipe.cooking_time_in_minutes !== undefined) {
+        document.getElementById("generated_cooking_time").textContent =
+            `Час приготування: ${recipe.cooking_time_in_minutes} хв`;
+    }
+    if (recipe.category !== undefined) {
+        document.getElementById("generated_category").textContent = `Категорія: ${recipe.category}`;
+    }
+    setList("generated_steps", recipe.steps || []);
+    setList(
+        "generated_ingredients",
+        (recipe.ingredients || []).map(
+            (ingredient) => `${ingredient.name}: ${ingredient.volume} ${ingredient.volume_measure}`
+        )
+    );
+}
+
+function showState(state) {
+    statusSpan.textContent = STATUS_NAMES[state.status] || state.status;
+    if (Array.isArray(state.recipe)) {
+        // variants are shown when all of them are ready
+        document.getElementById("generated_variants").textContent =
+            `Згенеровано варіантів: ${state.recipe.length} з ${state.variants}`;
+    } else if (state.recipe) {
+        showRecipe(state.recipe);
+    }
+    if (state.status === "done" || state.status === "failed") {
+        // the page of a finished job shows the form to save the recipe or the error
+        window.location.reload();
+        return true;
+    }
+    return false;
+}
+
+function pollStatus() {
+    fetch(jobDiv.dataset.statusUrl)
+        .then((response) => response.json())
+        .then((state) => {
+            if (!showState(state)) {
+                setTimeout(pollStatus, POLL_INTERVAL);
+            }
+        })
+        .catch(() => setTimeout(pollStatus, POLL_INTERVAL));
+}
+
+if (jobDiv.dataset.eventsUrl && window.EventSource) {
+    const events = new EventSource(jobDiv.dataset.eventsUrl);
+    events.addEventListener("status", (event) => {
+        if (showState(JSON.parse(event.data))) {
+            events.close();
+        }
+    });
+} else {
+    pollStatus();
+}